@@ -0,0 +1,51 @@
+'''Microbenchmark for HarvestController._add_registry_data.
+Reports the per record cost of attaching the registry collection, campus &
+repository data to harvested records.
+
+Usage:
+    $ python benchmarks/bench_add_registry_data.py --records 100000
+'''
+import os
+import sys
+import json
+import time
+import argparse
+from harvester.collection_registry_client import Collection
+from harvester.fetcher.controller import HarvestController
+
+DIR_FIXTURES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'test', 'fixtures')
+
+
+def get_controller():
+    '''Return a HarvestController for the test collection without creating
+    a fetcher, the fetcher would hit the network'''
+    json_obj = json.load(open(os.path.join(DIR_FIXTURES,
+                                           'collection_api_test.json')))
+    collection = Collection(url_base='https://registry.cdlib.org',
+                            json_obj=json_obj)
+    controller = HarvestController.__new__(HarvestController)
+    controller.collection = collection
+    controller._registry_data = None
+    return controller
+
+
+def run(n_records):
+    controller = get_controller()
+    records = [{'id': str(i), 'title': ['record {}'.format(i)]}
+               for i in xrange(n_records)]
+    start = time.time()
+    for rec in records:
+        controller._add_registry_data(rec)
+    elapsed = time.time() - start
+    return elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time _add_registry_data over a number of records')
+    parser.add_argument('--records', type=int, default=100000)
+    args = parser.parse_args(sys.argv[1:])
+    elapsed = run(args.records)
+    print('{} records in {:.3f}s, {:.2f} usec/record'.format(
+        args.records, elapsed, elapsed * 1000000 / args.records))
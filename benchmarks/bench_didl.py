@@ -0,0 +1,84 @@
+'''Microbenchmark for the DIDL to dict conversion of SickleDIDLRecord.
+Compares didl_to_dict with the old conversion, etree_to_dict on every DIDL
+descendant, which converts each subtree once for each of its ancestors.
+The DIDL is generated: nested Items with Components & Descriptors, like
+the DSpace feeds with compound objects. --depth sets the Item nesting,
+--width the Components in each Item.
+
+Usage:
+    $ python benchmarks/bench_didl.py --depth 2 4 8 --width 20
+'''
+import re
+import sys
+import time
+import argparse
+from lxml import etree
+from harvester.fetcher.oai_fetcher import didl_to_dict, etree_to_dict
+from harvester.fetcher.oai_fetcher import DIDL_NS
+
+STATEMENT = '''<didl:Descriptor><didl:Statement mimeType="application/xml">
+  <oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/"
+    xmlns:dc="http://purl.org/dc/elements/1.1/">
+    <dc:title>Title {0}</dc:title>
+    <dc:creator>Creator {0}</dc:creator>
+    <dc:description>Description {0}</dc:description>
+    <dc:identifier>http://hdl.handle.net/10575/{0}</dc:identifier>
+  </oai_dc:dc>
+</didl:Statement></didl:Descriptor>'''
+COMPONENT = '''<didl:Component id="c-{0}">
+  <didl:Resource ref="http://example.edu/bitstream/{0}.pdf"
+    mimeType="application/pdf"/>
+</didl:Component>'''
+
+
+def didl_xml(depth, width, prefix='0'):
+    '''An Item nested depth deep, each with width Components'''
+    parts = ['<didl:Item id="item-{}">'.format(prefix),
+             STATEMENT.format(prefix)]
+    parts.extend(COMPONENT.format('{}-{}'.format(prefix, i))
+                 for i in range(width))
+    if depth > 1:
+        parts.append(didl_xml(depth - 1, width, prefix + '.1'))
+    parts.append('</didl:Item>')
+    return '\n'.join(parts)
+
+
+def didl_element(depth, width):
+    return etree.fromstring(
+        '<didl:DIDL xmlns:didl="urn:mpeg:mpeg21:2002:02-DIDL-NS">'
+        '<didl:DIDLInfo/>{}</didl:DIDL>'.format(didl_xml(depth, width)))
+
+
+def findall_dict(didl):
+    '''The old conversion'''
+    metadata = {}
+    for element in didl.findall('.//' + DIDL_NS + '*'):
+        metadata[re.sub(r'\{.*\}', '', element.tag)] = etree_to_dict(element)
+    return metadata
+
+
+def time_conversion(convert, didl, repeat):
+    start = time.time()
+    for i in xrange(repeat):
+        convert(didl)
+    return time.time() - start
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time the DIDL to dict conversions')
+    parser.add_argument('--depth', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--width', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args(sys.argv[1:])
+    print('{:<6} {:>9} {:>14} {:>14} {:>8}'.format(
+        'depth', 'elements', 'findall usec', 'single usec', 'speedup'))
+    for depth in args.depth:
+        didl = didl_element(depth, args.width)
+        assert didl_to_dict(didl) == findall_dict(didl)
+        old_time = time_conversion(findall_dict, didl, args.repeat)
+        new_time = time_conversion(didl_to_dict, didl, args.repeat)
+        print('{:<6} {:>9} {:>14.1f} {:>14.1f} {:>7.1f}x'.format(
+            depth, sum(1 for e in didl.iter()),
+            old_time * 1000000 / args.repeat,
+            new_time * 1000000 / args.repeat, old_time / new_time))
@@ -0,0 +1,167 @@
+'''Offline throughput benchmark for the HARVEST_TYPES fetchers.
+Each fetcher is run, in its own process, against a local stand-in for its
+source (see feeds.py) & the records/sec, peak RSS of the fetcher process
+and the number of requests the stand-in served are reported.
+The peak RSS includes the interpreter & the imported harvester modules.
+
+Usage:
+    $ python benchmarks/bench_fetchers.py --records 1000 100000
+    $ python benchmarks/bench_fetchers.py --types OAI SLR --latency 0.05
+'''
+import os
+import sys
+import json
+import time
+import urlparse
+import argparse
+import resource
+import threading
+import traceback
+import multiprocessing
+from SocketServer import ThreadingMixIn
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from feeds import SOURCES
+from harvester.fetcher import HARVEST_TYPES
+
+
+class FeedRequestHandler(BaseHTTPRequestHandler):
+    '''Dispatch to the source for the first path segment'''
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self, body=''):
+        url = urlparse.urlsplit(self.path)
+        params = dict(urlparse.parse_qsl(url.query))
+        params.update(urlparse.parse_qsl(body))
+        prefix, _, path = url.path.lstrip('/').partition('/')
+        self.server.count_request()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        source = self.server.sources.get(prefix.upper())
+        try:
+            content_type, resp = source.respond('/' + path, params)
+        except Exception:
+            self.send_error(500, traceback.format_exc().splitlines()[-1])
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(resp)))
+        self.end_headers()
+        self.wfile.write(resp)
+
+    def do_POST(self):
+        length = int(self.headers.getheader('content-length', 0))
+        self.do_GET(body=self.rfile.read(length))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FeedServer(ThreadingMixIn, HTTPServer):
+    '''Serves the sources on localhost, on a free port'''
+    daemon_threads = True
+
+    def __init__(self, latency=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), FeedRequestHandler)
+        self.latency = latency
+        self.sources = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def reset_count(self):
+        with self._lock:
+            self.requests = 0
+
+
+def run_fetcher(harvest_type, source, results):
+    '''Run in the child process, put the results on the results queue'''
+    try:
+        cls_fetcher = HARVEST_TYPES[harvest_type]
+        source.prepare(cls_fetcher)
+        url_harvest, extra_data, kwargs = source.fetcher_args()
+        n_records = 0
+        start = time.time()
+        fetcher = cls_fetcher(url_harvest, extra_data, **kwargs)
+        for objset in fetcher:
+            n_records += len(objset) if isinstance(objset, list) else 1
+        elapsed = time.time() - start
+        results.put({
+            'records': n_records,
+            'seconds': elapsed,
+            'peak_rss_mb':
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        })
+    except Exception:
+        results.put({'error': traceback.format_exc()})
+
+
+def bench(server, harvest_type, n_records, page_size=None):
+    url_base = '/'.join((server.url, harvest_type.lower()))
+    source = SOURCES[harvest_type](url_base, n_records, page_size)
+    server.sources[harvest_type] = source
+    server.reset_count()
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(
+        target=run_fetcher, args=(harvest_type, source, results))
+    proc.start()
+    result = results.get()
+    proc.join()
+    result.update(type=harvest_type, n_records=n_records,
+                  requests=server.requests)
+    if 'seconds' in result:
+        result['records_per_second'] = \
+            result['records'] / result['seconds'] if result['seconds'] else 0
+    return result
+
+
+def format_result(result):
+    if 'error' in result:
+        return '{type:<4} {n_records:>9} ERROR {error}'.format(
+            type=result['type'],
+            n_records=result['n_records'],
+            error=result['error'].strip().splitlines()[-1])
+    return '{type:<4} {n_records:>9} {records:>9} {seconds:>9.2f} ' \
+        '{records_per_second:>10.1f} {requests:>9} ' \
+        '{peak_rss_mb:>9.1f}'.format(**result)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Benchmark the fetchers against local stand-in sources')
+    parser.add_argument('--records', type=int, nargs='+', default=[1000],
+                        help='collection sizes to run, e.g. 1000 100000')
+    parser.add_argument('--types', nargs='+', default=sorted(SOURCES),
+                        choices=sorted(SOURCES), metavar='TYPE',
+                        help='harvest types to run, default all')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds the stand-in waits before responding')
+    parser.add_argument('--page-size', type=int,
+                        help='page size for sources that pick their own')
+    parser.add_argument('--output', help='also write the results as JSON')
+    args = parser.parse_args(sys.argv[1:])
+    server = FeedServer(latency=args.latency)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    print('{:<4} {:>9} {:>9} {:>9} {:>10} {:>9} {:>9}'.format(
+        'type', 'size', 'records', 'seconds', 'records/s', 'requests',
+        'rss MB'))
+    results = []
+    for n_records in args.records:
+        for harvest_type in args.types:
+            result = bench(server, harvest_type, n_records, args.page_size)
+            results.append(result)
+            print(format_result(result))
+            sys.stdout.flush()
+    server.shutdown()
+    if args.output:
+        with open(args.output, 'w') as foo:
+            json.dump(results, foo, indent=2)
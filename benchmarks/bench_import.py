@@ -0,0 +1,69 @@
+'''Import time benchmark for the harvester.fetcher package.
+Each import is timed in a fresh interpreter, as an RQ worker pays it for
+each forked job. Reports the best & median wall time over the repeats and
+the number of modules the import loads.
+
+Usage:
+    $ python benchmarks/bench_import.py --repeat 5
+    $ python benchmarks/bench_import.py --types OAI NUX
+'''
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+DIR_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        os.pardir)
+
+TIMER = '''
+import sys, time, json
+start = time.time()
+{statement}
+elapsed = time.time() - start
+print(json.dumps([elapsed, len(sys.modules)]))
+'''
+
+STATEMENTS = [
+    ('package', 'import harvester.fetcher'),
+    ('controller', 'from harvester.fetcher import HarvestController'),
+]
+HARVEST_TYPE_STATEMENT = 'from harvester.fetcher import HARVEST_TYPES;' \
+    'HARVEST_TYPES["{}"]'
+HARVEST_TYPES = ('OAI', 'OAJ', 'OAC', 'SLR', 'MRC', 'NUX', 'ALX', 'SFX',
+                 'UCB', 'PRE', 'FLK', 'YTB', 'XML', 'EMS', 'UCD', 'IAR',
+                 'PRA')
+
+
+def time_import(statement, repeat):
+    '''Return the import times & the number of modules loaded'''
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [DIR_ROOT] + env.get('PYTHONPATH', '').split(os.pathsep))
+    times = []
+    for i in range(repeat):
+        out = subprocess.check_output(
+            [sys.executable, '-c', TIMER.format(statement=statement)],
+            env=env)
+        elapsed, n_modules = json.loads(out.splitlines()[-1])
+        times.append(elapsed)
+    return sorted(times), n_modules
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time imports of the fetcher package')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--types', nargs='+', default=HARVEST_TYPES,
+                        metavar='TYPE',
+                        help='harvest types to time the fetcher import of')
+    args = parser.parse_args(sys.argv[1:])
+    statements = STATEMENTS + [
+        (harvest_type, HARVEST_TYPE_STATEMENT.format(harvest_type))
+        for harvest_type in args.types]
+    print('{:<12} {:>9} {:>9} {:>8}'.format('import', 'best ms', 'median ms',
+                                           'modules'))
+    for name, statement in statements:
+        times, n_modules = time_import(statement, args.repeat)
+        print('{:<12} {:>9.1f} {:>9.1f} {:>8}'.format(
+            name, times[0] * 1000, times[len(times) // 2] * 1000, n_modules))
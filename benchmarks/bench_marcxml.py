@@ -0,0 +1,75 @@
+'''Microbenchmark for the MARCXML to dict conversion.
+Compares records_to_dicts on the parsed tree with the old round trip of
+writing the tree to a temp file & parsing it with pymarc's
+parse_xml_to_array, for OAI records (one MARC record per element) and
+Aleph SRU pages (a tree of records).
+
+Usage:
+    $ python benchmarks/bench_marcxml.py --repeat 200
+'''
+import os
+import sys
+import time
+import tempfile
+import argparse
+from xml.etree import ElementTree as ET
+from lxml import etree
+import pymarc
+from harvester.fetcher.marcxml import records_to_dicts
+
+DIR_FIXTURES = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), os.pardir, 'test', 'fixtures')
+OAI_NS = '{http://www.openarchives.org/OAI/2.0/}'
+
+
+def pymarc_dicts(tree, tostring):
+    '''The old path, serialize & reparse with pymarc'''
+    marc_file = tempfile.TemporaryFile()
+    marc_file.write(tostring(tree))
+    marc_file.seek(0)
+    return [rec.as_dict() for rec in pymarc.parse_xml_to_array(marc_file)
+            if rec is not None]
+
+
+def oai_elements():
+    tree = etree.parse(os.path.join(DIR_FIXTURES, 'testOAI-tind.xml'))
+    return [metadata[0] for metadata in
+            tree.iter(OAI_NS + 'metadata')]
+
+
+def aleph_trees():
+    return [ET.parse(os.path.join(DIR_FIXTURES, name)).getroot() for name in
+            ('ucsb-aleph-resp-1-3.xml', 'ucsb-aleph-resp-4-6.xml',
+             'ucsb-aleph-resp-7-8.xml')]
+
+
+def time_conversion(convert, trees, repeat):
+    start = time.time()
+    n_records = 0
+    for i in xrange(repeat):
+        for tree in trees:
+            n_records += len(convert(tree))
+    return time.time() - start, n_records
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Time the MARCXML to dict conversions')
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args(sys.argv[1:])
+    cases = [
+        ('OAI', oai_elements(),
+         lambda tree: pymarc_dicts(
+             tree, lambda t: etree.tostring(t, encoding='utf-8'))),
+        ('Aleph', aleph_trees(),
+         lambda tree: pymarc_dicts(tree, ET.tostring)),
+    ]
+    print('{:<8} {:>8} {:>14} {:>14} {:>8}'.format(
+        'feed', 'records', 'pymarc usec', 'direct usec', 'speedup'))
+    for name, trees, old in cases:
+        old_time, n_records = time_conversion(old, trees, args.repeat)
+        new_time, n_records = time_conversion(records_to_dicts, trees,
+                                              args.repeat)
+        print('{:<8} {:>8} {:>14.1f} {:>14.1f} {:>7.1f}x'.format(
+            name, n_records, old_time * 1000000 / n_records,
+            new_time * 1000000 / n_records, old_time / new_time))
@@ -0,0 +1,778 @@
+'''Stand-in sources for the fetcher benchmarks.
+Each FeedSource serves synthetic records, shaped like the test fixtures for
+its harvest type, from the benchmark HTTP server. Records are generated
+per request so large collections don't have to be built up front, except
+for the single document sources (MRC, XML, PRE & the UCD sitemap) where
+the fetcher reads the whole collection in one response.
+'''
+import json
+import pymarc
+
+XML = 'text/xml; charset=utf-8'
+JSON = 'application/json'
+HTML = 'text/html; charset=utf-8'
+
+
+def record_fields(i):
+    '''The metadata of synthetic record i, shared by all the sources'''
+    return dict(
+        i=i,
+        id='bench-{:09d}'.format(i),
+        title='Benchmark record {}'.format(i),
+        creator='Creator {}'.format(i % 97),
+        date=str(1900 + i % 120),
+        subject1='Subject {}'.format(i % 13),
+        subject2='Subject {}'.format(i % 17),
+        description='Synthetic record {} served by the benchmark '
+        'stand-in for the source'.format(i))
+
+
+def page_range(start, page_size, n_records):
+    return range(start, min(start + page_size, n_records))
+
+
+class FeedSource(object):
+    '''A collection of n_records served under /<harvest type>.
+    page_size is used when the request doesn't set the page size.
+    '''
+    harvest_type = None
+    page_size = 100
+
+    def __init__(self, url_base, n_records, page_size=None):
+        self.url_base = url_base
+        self.n_records = n_records
+        if page_size:
+            self.page_size = page_size
+
+    def fetcher_args(self):
+        '''Return the url_harvest, extra_data & kwargs for the fetcher'''
+        return self.url_base, '', {}
+
+    def class_attrs(self):
+        '''Fetcher class attributes to point at the stand-in, for fetchers
+        with the service URL built in'''
+        return {}
+
+    def prepare(self, cls_fetcher):
+        '''Called in the benchmark process before the fetcher is created'''
+        for name, value in self.class_attrs().items():
+            setattr(cls_fetcher, name, value)
+
+    def respond(self, path, params):
+        '''Return the content type & body for the request'''
+        raise NotImplementedError
+
+
+OAI_FORMATS = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+<responseDate>2016-01-01T00:00:00Z</responseDate>
+<request verb="ListMetadataFormats">http://bench/oai</request>
+<ListMetadataFormats><metadataFormat>
+<metadataPrefix>oai_dc</metadataPrefix>
+<schema>http://www.openarchives.org/OAI/2.0/oai_dc.xsd</schema>
+<metadataNamespace>http://www.openarchives.org/OAI/2.0/oai_dc/\
+</metadataNamespace>
+</metadataFormat></ListMetadataFormats></OAI-PMH>'''
+
+OAI_LIST = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+<responseDate>2016-01-01T00:00:00Z</responseDate>
+<request verb="ListRecords">http://bench/oai</request>
+<ListRecords>{records}<resumptionToken completeListSize="{total}" \
+cursor="{cursor}">{token}</resumptionToken></ListRecords></OAI-PMH>'''
+
+OAI_RECORD = '''<record><header><identifier>oai:bench:{id}</identifier>
+<datestamp>2016-01-01</datestamp></header><metadata>
+<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" \
+xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:title>{title}</dc:title><dc:creator>{creator}</dc:creator>
+<dc:date>{date}</dc:date><dc:subject>{subject1}</dc:subject>
+<dc:subject>{subject2}</dc:subject>
+<dc:description>{description}</dc:description>
+<dc:identifier>http://ark.cdlib.org/ark:/99999/{id}</dc:identifier>
+</oai_dc:dc></metadata></record>'''
+
+
+class OAISource(FeedSource):
+    harvest_type = 'OAI'
+
+    def respond(self, path, params):
+        if params.get('verb') == 'ListMetadataFormats':
+            return XML, OAI_FORMATS
+        start = int(params.get('resumptionToken', 0))
+        recs = page_range(start, self.page_size, self.n_records)
+        token = str(recs[-1] + 1) if recs[-1] + 1 < self.n_records else ''
+        return XML, OAI_LIST.format(
+            records=''.join(OAI_RECORD.format(**record_fields(i))
+                            for i in recs),
+            total=self.n_records,
+            cursor=start,
+            token=token)
+
+
+OAC_RESULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<crossQueryResult totalDocs="{total}">
+<facet field="facet-type-tab" totalGroups="3" totalDocs="{total}">
+<group value="image" totalDocs="{total}" startDoc="{start}" endDoc="{end}">\
+{hits}</group>
+<group value="text" totalDocs="0" startDoc="0" endDoc="0"/>
+<group value="website" totalDocs="0" startDoc="0" endDoc="0"/>
+</facet></crossQueryResult>'''
+
+OAC_DOCHIT = '''<docHit rank="{i}" path="cdl:99999/{id}.mets.xml"><meta>
+<title>{title}</title><creator>{creator}</creator><date>{date}</date>
+<subject>{subject1}</subject><subject>{subject2}</subject>
+<description>{description}</description>
+<identifier>http://ark.cdlib.org/ark:/99999/{id}</identifier>
+<identifier q="local">{id}</identifier>
+<relation>http://www.oac.cdlib.org/findaid/ark:/13030/bench</relation>
+<thumbnail X="125" Y="100" src="/ark:/99999/{id}/thumbnail"/>
+<reference-image X="1024" Y="768" src="/ark:/99999/{id}/med"/>
+</meta></docHit>'''
+
+
+class OACSource(FeedSource):
+    '''XTF crossQuery results, all the records are in the image group'''
+    harvest_type = 'OAC'
+
+    def fetcher_args(self):
+        return self.url_base + '/search?relation=ark:/13030/bench', '', {}
+
+    def respond(self, path, params):
+        start = int(params.get('startDoc', 1))
+        size = int(params.get('docsPerPage', self.page_size))
+        recs = page_range(start - 1, size, self.n_records)
+        return XML, OAC_RESULT.format(
+            total=self.n_records,
+            start=start,
+            end=start + len(recs) - 1,
+            hits=''.join(OAC_DOCHIT.format(**record_fields(i))
+                         for i in recs))
+
+
+class OACJSONSource(FeedSource):
+    harvest_type = 'OAJ'
+    page_size = 25
+
+    def fetcher_args(self):
+        return (self.url_base + '/findaid/ark:/13030/bench/?format=json',
+                '', {})
+
+    def respond(self, path, params):
+        start = int(params.get('startDoc', 1))
+        recs = page_range(start - 1, self.page_size, self.n_records)
+        objset = []
+        for i in recs:
+            fields = record_fields(i)
+            objset.append({
+                'qdc': {
+                    'title': [fields['title']],
+                    'creator': [fields['creator']],
+                    'date': [fields['date']],
+                    'subject': [fields['subject1'], fields['subject2']],
+                    'identifier': [fields['id']]
+                },
+                'files': {}
+            })
+        return JSON, json.dumps({
+            'objset_total': self.n_records,
+            'objset_start': start,
+            'objset_end': start + len(recs) - 1,
+            'objset': objset
+        })
+
+
+SOLR_XML_RESULT = '''<?xml version="1.0" encoding="UTF-8"?>
+<response><lst name="responseHeader"><int name="status">0</int>
+<int name="QTime">1</int></lst>
+<result name="response" numFound="{total}" start="{start}" \
+maxScore="1.0">{docs}</result></response>'''
+
+SOLR_XML_DOC = '''<doc><str name="id">{id}</str>
+<arr name="title"><str>{title}</str></arr><str name="creator">{creator}</str>
+<str name="date">{date}</str>
+<arr name="subject"><str>{subject1}</str><str>{subject2}</str></arr>
+<str name="description">{description}</str>
+<float name="score">1.0</float></doc>'''
+
+
+class SolrSource(FeedSource):
+    '''Solr XML select responses, for solrpy. Paged by start & rows'''
+    harvest_type = 'SLR'
+    page_size = 10  # the Solr default rows
+
+    def fetcher_args(self):
+        return self.url_base, 'collection:bench', {}
+
+    def respond(self, path, params):
+        start = int(params.get('start', 0))
+        rows = int(params.get('rows', self.page_size))
+        return XML, SOLR_XML_RESULT.format(
+            total=self.n_records,
+            start=start,
+            docs=''.join(SOLR_XML_DOC.format(**record_fields(i))
+                         for i in page_range(start, rows, self.n_records)))
+
+
+class SolrJSONSource(FeedSource):
+    '''Solr JSON responses, paged with cursorMark. The cursorMark is the
+    offset of the page'''
+    harvest_type = 'SFX'
+    page_size = 10
+
+    def fetcher_args(self):
+        return self.url_base, 'collection:bench', {}
+
+    def respond(self, path, params):
+        cursor_mark = params.get('cursorMark', '*')
+        start = 0 if cursor_mark == '*' else int(cursor_mark)
+        rows = int(params.get('rows', self.page_size))
+        docs = []
+        for i in page_range(start, rows, self.n_records):
+            fields = record_fields(i)
+            docs.append({
+                'id': fields['id'],
+                'title': [fields['title']],
+                'creator': fields['creator'],
+                'date': fields['date'],
+                'subject': [fields['subject1'], fields['subject2']],
+                'description': fields['description']
+            })
+        return JSON, json.dumps({
+            'responseHeader': {'status': 0, 'QTime': 1},
+            'response': {
+                'numFound': self.n_records,
+                'start': start,
+                'docs': docs
+            },
+            'nextCursorMark': str(start + len(docs)) if docs else cursor_mark
+        })
+
+
+class RequestsSolrSource(SolrJSONSource):
+    harvest_type = 'UCB'
+
+    def fetcher_args(self):
+        return self.url_base + '/select', 'q=collection:bench', {}
+
+
+class MARCSource(FeedSource):
+    '''A binary MARC file. The records are copies of one template record
+    with the fixed width id substituted, so the directory stays valid'''
+    harvest_type = 'MRC'
+    id_placeholder = '#########'
+
+    def __init__(self, url_base, n_records, page_size=None):
+        super(MARCSource, self).__init__(url_base, n_records, page_size)
+        self._body = None
+
+    def fetcher_args(self):
+        return self.url_base + '/records.mrc', '', {}
+
+    def marc_template(self):
+        record = pymarc.Record()
+        record.add_field(
+            pymarc.Field(tag='001', data=self.id_placeholder),
+            pymarc.Field(
+                tag='100', indicators=['1', ' '],
+                subfields=['a', 'Creator']),
+            pymarc.Field(
+                tag='245', indicators=['1', '0'],
+                subfields=['a', 'Benchmark record ' + self.id_placeholder]),
+            pymarc.Field(
+                tag='260', indicators=[' ', ' '],
+                subfields=['c', '1912']),
+            pymarc.Field(
+                tag='520', indicators=[' ', ' '],
+                subfields=['a', record_fields(0)['description']]),
+            pymarc.Field(
+                tag='650', indicators=[' ', '0'],
+                subfields=['a', 'Subject']))
+        return record.as_marc()
+
+    def respond(self, path, params):
+        if self._body is None:
+            template = self.marc_template()
+            self._body = ''.join(
+                template.replace(self.id_placeholder, '{:09d}'.format(i))
+                for i in xrange(self.n_records))
+        return 'application/marc', self._body
+
+
+ALEPH_RESULT = '''<?xml version="1.0"?>
+<zs:searchRetrieveResponse xmlns:zs="http://www.loc.gov/zing/srw/">\
+<zs:version>1.1</zs:version>\
+<zs:numberOfRecords>{total}</zs:numberOfRecords>\
+<zs:records>{records}</zs:records></zs:searchRetrieveResponse>'''
+
+ALEPH_RECORD = '''<zs:record>\
+<zs:recordSchema>info:srw/schema/1/marcxml-v1.1</zs:recordSchema>\
+<zs:recordPacking>xml</zs:recordPacking><zs:recordData>\
+<record xmlns="http://www.loc.gov/MARC21/slim">
+<leader>01429njm a2200385 a 4500</leader>
+<controlfield tag="001">{id}</controlfield>
+<datafield tag="100" ind1="1" ind2=" ">\
+<subfield code="a">{creator}</subfield></datafield>
+<datafield tag="245" ind1="1" ind2="0">\
+<subfield code="a">{title}</subfield></datafield>
+<datafield tag="260" ind1=" " ind2=" ">\
+<subfield code="c">{date}</subfield></datafield>
+<datafield tag="520" ind1=" " ind2=" ">\
+<subfield code="a">{description}</subfield></datafield>
+<datafield tag="650" ind1=" " ind2="0">\
+<subfield code="a">{subject1}</subfield></datafield>
+</record></zs:recordData>\
+<zs:recordPosition>{position}</zs:recordPosition></zs:record>'''
+
+
+class AlephSource(FeedSource):
+    '''SRU searchRetrieve responses with MARC XML records'''
+    harvest_type = 'ALX'
+
+    def fetcher_args(self):
+        return (self.url_base + '/sru?operation=searchRetrieve&query=bench',
+                '', {})
+
+    def respond(self, path, params):
+        start = int(params.get('startRecord', 1))
+        size = int(params.get('maximumRecords', self.page_size))
+        records = []
+        for i in page_range(start - 1, size, self.n_records):
+            fields = record_fields(i)
+            records.append(ALEPH_RECORD.format(position=i + 1, **fields))
+        return XML, ALEPH_RESULT.format(
+            total=self.n_records, records=''.join(records))
+
+
+NUXEO_DOC_TYPE = 'SampleCustomPicture'
+
+
+class BenchDeepHarvest(object):
+    '''Stands in for DeepHarvestNuxeo, which walks the Nuxeo folder tree,
+    with the uids of the stand-in documents'''
+    n_records = 0
+
+    def __init__(self, path, bucket, conf_pynux={}):
+        self.path = path
+
+    def fetch_objects(self):
+        return ({'uid': record_fields(i)['id']}
+                for i in xrange(self.n_records))
+
+
+class NuxeoSource(FeedSource):
+    '''The Nuxeo REST API document endpoint, /id/<uid>.
+    The deep harvest folder walk & the media json in S3 aren't served
+    over HTTP, so they are replaced in the benchmark process.
+    '''
+    harvest_type = 'NUX'
+
+    def fetcher_args(self):
+        return self.url_base, 'asset-library/bench', {
+            'conf_pynux': {
+                'api': self.url_base,
+                'auth_method': 'basic',
+                'user': 'bench',
+                'password': 'bench',
+                'X-NXDocumentProperties':
+                    'dublincore,ucldc_schema,picture,file'
+            }
+        }
+
+    def prepare(self, cls_fetcher):
+        from harvester.fetcher import nuxeo_fetcher
+        BenchDeepHarvest.n_records = self.n_records
+        nuxeo_fetcher.DeepHarvestNuxeo = BenchDeepHarvest
+        nuxeo_fetcher.NuxeoFetcher._get_structmap_text = \
+            lambda self, structmap_url: ''
+
+    def respond(self, path, params):
+        uid = path.rsplit('/', 1)[-1]
+        i = int(uid.split('-')[-1])
+        fields = record_fields(i)
+        return JSON, json.dumps({
+            'entity-type': 'document',
+            'repository': 'default',
+            'uid': uid,
+            'path': '/asset-library/bench/{}'.format(uid),
+            'type': NUXEO_DOC_TYPE,
+            'state': 'project',
+            'title': fields['title'],
+            'properties': {
+                'dc:title': fields['title'],
+                'dc:creator': [fields['creator']],
+                'dc:description': fields['description'],
+                'ucldc_schema:date': [{'date': fields['date']}],
+                'ucldc_schema:subjecttopic': [
+                    {'heading': fields['subject1']},
+                    {'heading': fields['subject2']}
+                ],
+                'file:content': {
+                    'name': '{}.tif'.format(uid),
+                    'mime-type': 'image/tiff',
+                    'data': 'https://nuxeo.cdlib.org/Nuxeo/nxfile/default/'
+                    '{}/file:content/{}.tif'.format(uid, uid)
+                },
+                'picture:views': []
+            }
+        })
+
+
+CMIS_FEED = '''<?xml version="1.0" encoding="UTF-8"?>
+<atom:feed xmlns:atom="http://www.w3.org/2005/Atom" \
+xmlns:cmis="http://docs.oasis-open.org/ns/cmis/core/200908/" \
+xmlns:cmisra="http://docs.oasis-open.org/ns/cmis/restatom/200908/">
+<atom:title>Benchmark collection</atom:title>
+<atom:entry><atom:title>Benchmark collection</atom:title>
+<cmisra:children><atom:feed>{entries}</atom:feed></cmisra:children>
+</atom:entry></atom:feed>'''
+
+CMIS_ENTRY = '''<atom:entry><atom:id>{id}</atom:id>
+<atom:title>{title}</atom:title><atom:updated>2016-01-01T00:00:00Z\
+</atom:updated><cmisra:object><cmis:properties>
+<cmis:propertyId propertyDefinitionId="cmis:objectId">\
+<cmis:value>sdb:deliverableUnit|{id}</cmis:value></cmis:propertyId>
+<cmis:propertyString propertyDefinitionId="cmis:name">\
+<cmis:value>{title}</cmis:value></cmis:propertyString>
+<cmis:propertyString propertyDefinitionId="cmis:description">\
+<cmis:value>{description}</cmis:value></cmis:propertyString>
+</cmis:properties></cmisra:object></atom:entry>'''
+
+
+class CMISSource(FeedSource):
+    '''A single CMIS Atom descendants feed with all the records'''
+    harvest_type = 'PRE'
+
+    def fetcher_args(self):
+        return self.url_base + '/descendants', 'bench,bench', {}
+
+    def respond(self, path, params):
+        return XML, CMIS_FEED.format(entries=''.join(
+            CMIS_ENTRY.format(**record_fields(i))
+            for i in xrange(self.n_records)))
+
+
+FLICKR_PHOTOS = '''<?xml version="1.0" encoding="utf-8" ?>
+<rsp stat="ok"><photos page="{page}" pages="{pages}" perpage="{per_page}" \
+total="{total}">{photos}</photos></rsp>'''
+
+FLICKR_PHOTO = '''<photo id="{i}" owner="12345@N00" secret="abcdef" \
+server="1" farm="1" title="{title}" ispublic="1" isfriend="0" \
+isfamily="0" />'''
+
+FLICKR_INFO = '''<?xml version="1.0" encoding="utf-8" ?>
+<rsp stat="ok"><photo id="{i}" secret="abcdef" server="1" farm="1" \
+dateuploaded="1451606400" isfavorite="0" license="4" views="1" \
+media="photo"><owner nsid="12345@N00" username="bench" />
+<title>{title}</title><description>{description}</description>
+<dates posted="1451606400" taken="{date}-01-01 00:00:00" />
+<tags><tag id="1" author="12345@N00" raw="{subject1}">{subject1}</tag>
+<tag id="2" author="12345@N00" raw="{subject2}">{subject2}</tag></tags>
+<notes /><urls><url type="photopage">\
+https://www.flickr.com/photos/bench/{i}/</url></urls></photo></rsp>'''
+
+
+class FlickrSource(FeedSource):
+    '''The people.getPublicPhotos & photos.getInfo API methods'''
+    harvest_type = 'FLK'
+
+    def fetcher_args(self):
+        return self.url_base, '12345@N00', {}
+
+    def class_attrs(self):
+        api = self.url_base + '/services/rest/?api_key={api_key}'
+        return {
+            'url_get_user_photos_template':
+                api + '&user_id={user_id}&per_page={per_page}'
+                '&method=flickr.people.getPublicPhotos&page={page}',
+            'url_get_photoset_template':
+                api + '&photoset_id={user_id}&per_page={per_page}'
+                '&method=flickr.photosets.getPhotos&page={page}',
+            'url_get_photo_info_template':
+                api + '&method=flickr.photos.getInfo&photo_id={photo_id}'
+        }
+
+    def respond(self, path, params):
+        if params['method'] == 'flickr.photos.getInfo':
+            return XML, FLICKR_INFO.format(
+                **record_fields(int(params['photo_id'])))
+        page = int(params.get('page', 1))
+        per_page = int(params.get('per_page', self.page_size))
+        recs = page_range((page - 1) * per_page, per_page, self.n_records)
+        return XML, FLICKR_PHOTOS.format(
+            page=page,
+            pages=(self.n_records + per_page - 1) // per_page,
+            per_page=per_page,
+            total=self.n_records,
+            photos=''.join(FLICKR_PHOTO.format(**record_fields(i))
+                           for i in recs))
+
+
+class YouTubeSource(FeedSource):
+    '''The YouTube data API playlistItems & videos resources'''
+    harvest_type = 'YTB'
+    page_size = 50
+
+    def fetcher_args(self):
+        return self.url_base, 'PLbench', {}
+
+    def class_attrs(self):
+        return {
+            'url_playlistitems':
+                self.url_base + '/playlistItems?key={api_key}'
+                '&maxResults={page_size}&part=contentDetails&'
+                'playlistId={playlist_id}&pageToken={page_token}',
+            'url_video':
+                self.url_base + '/videos?key={api_key}&part=snippet'
+                '&id={video_ids}'
+        }
+
+    def respond(self, path, params):
+        if path.endswith('/videos'):
+            items = []
+            for video_id in params['id'].split(','):
+                fields = record_fields(int(video_id.split('-')[-1]))
+                items.append({
+                    'kind': 'youtube#video',
+                    'id': video_id,
+                    'snippet': {
+                        'publishedAt': '{}-01-01T00:00:00.000Z'.format(
+                            fields['date']),
+                        'channelTitle': fields['creator'],
+                        'title': fields['title'],
+                        'description': fields['description'],
+                        'tags': [fields['subject1'], fields['subject2']]
+                    }
+                })
+            return JSON, json.dumps({'items': items})
+        start = int(params.get('pageToken') or 0)
+        size = int(params.get('maxResults', self.page_size))
+        recs = page_range(start, size, self.n_records)
+        resp = {
+            'pageInfo': {'totalResults': self.n_records,
+                         'resultsPerPage': size},
+            'items': [{'contentDetails': {'videoId': record_fields(i)['id']}}
+                      for i in recs]
+        }
+        if recs[-1] + 1 < self.n_records:
+            resp['nextPageToken'] = str(recs[-1] + 1)
+        return JSON, json.dumps(resp)
+
+
+XML_RECORD = '''<record><title>{title}</title><creator>{creator}</creator>\
+<date>{date}</date><subject>{subject1}</subject><subject>{subject2}</subject>\
+<description>{description}</description>\
+<identifier type="local">{id}</identifier></record>
+'''
+
+
+class XMLSource(FeedSource):
+    '''A static XML document with all the records'''
+    harvest_type = 'XML'
+
+    def fetcher_args(self):
+        return self.url_base + '/records.xml', '', {}
+
+    def respond(self, path, params):
+        return XML, ''.join((
+            '<?xml version="1.0" encoding="UTF-8"?>\n<records>\n',
+            ''.join(XML_RECORD.format(**record_fields(i))
+                    for i in xrange(self.n_records)),
+            '</records>'))
+
+
+EMUSEUM_FIELD = '''<field label="{label}" order="{order}" name="{name}">\
+<value>{value}</value></field>'''
+
+
+class EMuseumSource(FeedSource):
+    '''eMuseum XML search results, paged until a page has no objects'''
+    harvest_type = 'EMS'
+    page_size = 12
+
+    def respond(self, path, params):
+        page = int(params.get('page', 1))
+        objects = []
+        for i in page_range((page - 1) * self.page_size, self.page_size,
+                            self.n_records):
+            fields = record_fields(i)
+            objects.append(''.join(
+                ['<object>'] +
+                [EMUSEUM_FIELD.format(label=label, order=order, name=name,
+                                      value=fields[key])
+                 for order, (label, name, key) in enumerate((
+                     ('Item Title', 'title', 'title'),
+                     ('Primary Maker', 'primaryMaker', 'creator'),
+                     ('Date Created', 'displayDate', 'date'),
+                     ('Description', 'description', 'description'),
+                     ('Id', 'id', 'id')))] +
+                ['</object>']))
+        return XML, ''.join(
+            ['<results><objects>'] + objects + ['</objects></results>'])
+
+
+UCD_PAGE = '''<html lang="en"><head><meta charset="utf-8" />
+<title>{title} - UC Davis Library Digital Collections</title>
+<script type="application/ld+json">{jsonld}</script>
+</head><body><h1>{title}</h1></body></html>'''
+
+
+class UCDSource(FeedSource):
+    '''An XML sitemap & a record page with JSON-LD for each record'''
+    harvest_type = 'UCD'
+
+    def fetcher_args(self):
+        return self.url_base + '/sitemap.xml', '', {}
+
+    def respond(self, path, params):
+        if path.endswith('/sitemap.xml'):
+            return XML, ''.join((
+                '<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns='
+                '"http://www.sitemaps.org/schemas/sitemap/0.9">',
+                ''.join('<url><loc>{}/record/{}</loc></url>'.format(
+                    self.url_base, i) for i in xrange(self.n_records)),
+                '</urlset>'))
+        fields = record_fields(int(path.rsplit('/', 1)[-1]))
+        jsonld = json.dumps({
+            '@context': 'http://schema.org',
+            '@id': '{}/record/{}'.format(self.url_base, fields['i']),
+            '@type': 'CreativeWork',
+            'name': fields['title'],
+            'creator': {'@type': 'Person', 'name': fields['creator']},
+            'dateCreated': fields['date'],
+            'about': [fields['subject1'], fields['subject2']],
+            'description': fields['description'],
+            'identifier': fields['id']
+        })
+        return HTML, UCD_PAGE.format(jsonld=jsonld, **fields)
+
+
+class IASource(FeedSource):
+    '''The Internet Archive advancedsearch API'''
+    harvest_type = 'IAR'
+
+    def fetcher_args(self):
+        return self.url_base, 'collection:bench', {}
+
+    def class_attrs(self):
+        return {
+            'url_advsearch':
+                self.url_base + '/advancedsearch.php?q={search_query}'
+                '&rows=500&page={page_current}&output=json'
+        }
+
+    def respond(self, path, params):
+        rows = int(params.get('rows', self.page_size))
+        start = (int(params.get('page', 1)) - 1) * rows
+        docs = []
+        for i in page_range(start, rows, self.n_records):
+            fields = record_fields(i)
+            docs.append({
+                'identifier': fields['id'],
+                'title': fields['title'],
+                'creator': fields['creator'],
+                'date': '{}-01-01T00:00:00Z'.format(fields['date']),
+                'subject': [fields['subject1'], fields['subject2']],
+                'description': fields['description'],
+                'mediatype': 'image',
+                'collection': ['bench']
+            })
+        return JSON, json.dumps({
+            'responseHeader': {'status': 0, 'QTime': 1},
+            'response': {
+                'numFound': self.n_records,
+                'start': start,
+                'docs': docs
+            }
+        })
+
+
+PRESERVICA_ENTITY_NS = 'http://preservica.com/EntityAPI/v6.0'
+
+PRESERVICA_CHILDREN = '''<?xml version="1.0" encoding="UTF-8"?>
+<ChildrenResponse xmlns="{ns}" xmlns:xip="http://preservica.com/XIP/v6.0">
+<Children>{children}</Children><Paging>{next}\
+<TotalResults>{total}</TotalResults></Paging></ChildrenResponse>'''
+
+PRESERVICA_OBJECT = '''<?xml version="1.0" encoding="UTF-8"?>
+<EntityResponse xmlns="{ns}" xmlns:xip="http://preservica.com/XIP/v6.0">
+<xip:InformationObject><xip:Ref>{id}</xip:Ref><xip:Title>{title}\
+</xip:Title></xip:InformationObject>
+<AdditionalInformation><Self>{url}</Self><Metadata>
+<Fragment schema="http://www.openarchives.org/OAI/2.0/oai_dc/">\
+{url}/metadata/{id}</Fragment></Metadata></AdditionalInformation>
+</EntityResponse>'''
+
+PRESERVICA_METADATA = '''<?xml version="1.0" encoding="UTF-8"?>
+<MetadataResponse xmlns="{ns}" xmlns:xip="http://preservica.com/XIP/v6.0">
+<xip:MetadataContainer \
+schemaUri="http://www.openarchives.org/OAI/2.0/oai_dc/"><xip:Content>
+<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/" \
+xmlns:dc="http://purl.org/dc/elements/1.1/">
+<dc:title>{title}</dc:title><dc:creator>{creator}</dc:creator>
+<dc:date>{date}</dc:date><dc:subject>{subject1}</dc:subject>
+<dc:description>{description}</dc:description>
+<dc:identifier>{id}</dc:identifier></oai_dc:dc>
+</xip:Content></xip:MetadataContainer></MetadataResponse>'''
+
+
+class PreservicaSource(FeedSource):
+    '''The Preservica entity API: a structural object's children, each
+    child's entity & its oai_dc metadata fragment'''
+    harvest_type = 'PRA'
+
+    def fetcher_args(self):
+        return (self.url_base + '/explorer.html#properties:SO_bench',
+                'bench,bench', {})
+
+    def class_attrs(self):
+        return {'url_API_base': self.url_base + '/structural-objects'}
+
+    def respond(self, path, params):
+        if '/metadata/' in path:
+            fields = record_fields(int(path.rsplit('-', 1)[-1]))
+            return XML, PRESERVICA_METADATA.format(
+                ns=PRESERVICA_ENTITY_NS, **fields)
+        url_objects = self.url_base + '/information-objects/'
+        if '/information-objects/' in path:
+            fields = record_fields(int(path.rsplit('-', 1)[-1]))
+            return XML, PRESERVICA_OBJECT.format(
+                ns=PRESERVICA_ENTITY_NS,
+                url=url_objects + fields['id'],
+                **fields)
+        start = int(params.get('start', 0))
+        size = int(params.get('max', self.page_size))
+        recs = page_range(start, size, self.n_records)
+        url_next = ''
+        if recs and recs[-1] + 1 < self.n_records:
+            url_next = '<Next>{}{}?start={}&amp;max={}</Next>'.format(
+                self.url_base, path, recs[-1] + 1, size)
+        children = ''.join(
+            '<Child title="{title}" ref="{id}" type="IO">{url}{id}</Child>'
+            .format(url=url_objects, **record_fields(i)) for i in recs)
+        return XML, PRESERVICA_CHILDREN.format(
+            ns=PRESERVICA_ENTITY_NS,
+            children=children,
+            next=url_next,
+            total=self.n_records)
+
+
+SOURCES = dict((cls.harvest_type, cls) for cls in (
+    OAISource,
+    OACSource,
+    OACJSONSource,
+    SolrSource,
+    SolrJSONSource,
+    RequestsSolrSource,
+    MARCSource,
+    AlephSource,
+    NuxeoSource,
+    CMISSource,
+    FlickrSource,
+    YouTubeSource,
+    XMLSource,
+    EMuseumSource,
+    UCDSource,
+    IASource,
+    PreservicaSource,
+))
@@ -0,0 +1,93 @@
+'''Optional compression of the harvested pages, for the objset files in
+dir_save and the JSONL pages & segments in S3.
+zstd needs the zstandard package, gzip is always available.
+The readers detect the compression from the data, so they read compressed
+and uncompressed pages alike.
+'''
+import os
+import gzip
+import json
+from io import BytesIO
+from contextlib import contextmanager
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+
+
+def check_compression(compression):
+    '''Raise ValueError if the compression can't be used here'''
+    if compression not in EXTENSIONS:
+        raise ValueError('Unknown compression {}, must be one of {}'.format(
+            compression, EXTENSIONS.keys()))
+    if compression == 'zstd' and not zstandard:
+        raise ValueError('zstd compression needs the zstandard package')
+
+
+def compress(data, compression):
+    '''Return the data compressed'''
+    if compression == 'gzip':
+        buf = BytesIO()
+        gz = gzip.GzipFile(fileobj=buf, mode='wb')
+        gz.write(data)
+        gz.close()
+        return buf.getvalue()
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(data)
+    return data
+
+
+def decompress(data):
+    '''Return the data decompressed, data that isn't compressed is
+    returned as is'''
+    if data.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(fileobj=BytesIO(data)).read()
+    if data.startswith(ZSTD_MAGIC):
+        if not zstandard:
+            raise ValueError(
+                'zstd compressed data needs the zstandard package')
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+@contextmanager
+def open_write(filename, compression=None):
+    '''Open a file to stream compressed output to'''
+    with open(filename, 'wb') as foo:
+        if compression == 'gzip':
+            gz = gzip.GzipFile(fileobj=foo, mode='wb')
+            try:
+                yield gz
+            finally:
+                gz.close()
+        elif compression == 'zstd':
+            with zstandard.ZstdCompressor().stream_writer(foo) as zfoo:
+                yield zfoo
+        else:
+            yield foo
+
+
+def read_file(filename):
+    '''Return the decompressed contents of a file'''
+    with open(filename, 'rb') as foo:
+        return decompress(foo.read())
+
+
+def load_objset(filename):
+    '''Load an objset file saved by the HarvestController'''
+    return json.loads(read_file(filename))
+
+
+def iter_objsets(dir_save):
+    '''Yield the objsets saved to a harvest's dir_save'''
+    for fname in sorted(os.listdir(dir_save)):
+        yield load_objset(os.path.join(dir_save, fname))
+
+
+def loads_jsonl(data):
+    '''Return the objects in a, possibly compressed, JSONL page'''
+    return [json.loads(line) for line in decompress(data).splitlines()]
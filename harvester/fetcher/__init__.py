@@ -1,58 +1,71 @@
-from .fetcher import Fetcher
-from .fetcher import NoRecordsFetchedException
-from .oai_fetcher import OAIFetcher
-from .solr_fetcher import SolrFetcher
-from .solr_fetcher import PySolrFetcher
-from .solr_fetcher import PySolrQueryFetcher
-from .solr_fetcher import RequestsSolrFetcher
-from .marc_fetcher import MARCFetcher
-from .marc_fetcher import AlephMARCXMLFetcher
-from .nuxeo_fetcher import NuxeoFetcher
-from .nuxeo_fetcher import UCLDCNuxeoFetcher
-from .oac_fetcher import OAC_XML_Fetcher
-from .oac_fetcher import OAC_JSON_Fetcher
-from .ucsf_xml_fetcher import UCSF_XML_Fetcher
-from .cmis_atom_feed_fetcher import CMISAtomFeedFetcher
-from .flickr_fetcher import Flickr_Fetcher
-from .youtube_fetcher import YouTube_Fetcher
-from .xml_fetcher import XML_Fetcher
-from .ucd_json_fetcher import UCD_JSON_Fetcher
-from .emuseum_fetcher import eMuseum_Fetcher
-from .ia_fetcher import IA_Fetcher
-from .preservica_api_fetcher import PreservicaFetcher
-from .controller import HARVEST_TYPES
-from .controller import HarvestController
-from .controller import get_log_file_path
-from .controller import main
-from .controller import EMAIL_RETURN_ADDRESS
-
-
-__all__ = (
-        Fetcher,
-        NoRecordsFetchedException,
-        HARVEST_TYPES,
-        OAIFetcher,
-        SolrFetcher,
-        PySolrFetcher,
-        MARCFetcher,
-        AlephMARCXMLFetcher,
-        NuxeoFetcher,
-        UCLDCNuxeoFetcher,
-        OAC_XML_Fetcher,
-        OAC_JSON_Fetcher,
-        UCSF_XML_Fetcher,
-        CMISAtomFeedFetcher,
-        HarvestController,
-        XML_Fetcher,
-        eMuseum_Fetcher,
-        IA_Fetcher,
-        PreservicaFetcher,
-        UCD_JSON_Fetcher,
-        PySolrQueryFetcher,
-        Flickr_Fetcher,
-        YouTube_Fetcher,
-        RequestsSolrFetcher,
-        EMAIL_RETURN_ADDRESS,
-        get_log_file_path,
-        main
-)
+'''The fetchers & the HarvestController.
+The names below are imported from their modules on first use, so importing
+harvester.fetcher doesn't import every fetcher & the libraries for its
+source. HARVEST_TYPES imports a fetcher when its harvest type is used.
+'''
+import sys
+import types
+import importlib
+
+_EXPORTS = {
+    'Fetcher': 'fetcher',
+    'NoRecordsFetchedException': 'fetcher',
+    'OAIFetcher': 'oai_fetcher',
+    'SolrFetcher': 'solr_fetcher',
+    'PySolrFetcher': 'solr_fetcher',
+    'PySolrQueryFetcher': 'solr_fetcher',
+    'RequestsSolrFetcher': 'solr_fetcher',
+    'MARCFetcher': 'marc_fetcher',
+    'AlephMARCXMLFetcher': 'marc_fetcher',
+    'NuxeoFetcher': 'nuxeo_fetcher',
+    'UCLDCNuxeoFetcher': 'nuxeo_fetcher',
+    'OAC_XML_Fetcher': 'oac_fetcher',
+    'OAC_JSON_Fetcher': 'oac_fetcher',
+    'UCSF_XML_Fetcher': 'ucsf_xml_fetcher',
+    'CMISAtomFeedFetcher': 'cmis_atom_feed_fetcher',
+    'Flickr_Fetcher': 'flickr_fetcher',
+    'YouTube_Fetcher': 'youtube_fetcher',
+    'XML_Fetcher': 'xml_fetcher',
+    'UCD_JSON_Fetcher': 'ucd_json_fetcher',
+    'eMuseum_Fetcher': 'emuseum_fetcher',
+    'IA_Fetcher': 'ia_fetcher',
+    'PreservicaFetcher': 'preservica_api_fetcher',
+    'HARVEST_TYPES': 'controller',
+    'HarvestController': 'controller',
+    'get_log_file_path': 'controller',
+    'main': 'controller',
+    'EMAIL_RETURN_ADDRESS': 'controller',
+}
+
+
+class _LazyPackage(types.ModuleType):
+    '''Stands in for this package in sys.modules, importing the exported
+    names on first access'''
+
+    def __getattr__(self, name):
+        try:
+            module_name = self._exports[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '{}'"
+                                 .format(name))
+        module = importlib.import_module('.' + module_name, self.__name__)
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._exports))
+
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update(
+    __file__=__file__,
+    __path__=__path__,
+    __package__=__name__,
+    __all__=sorted(_EXPORTS),
+    _exports=_EXPORTS,
+    # keep the original module alive, python 2 clears the globals of a
+    # module when it's garbage collected
+    _module=sys.modules[__name__])
+sys.modules[__name__] = _package
+
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import requests
 from requests.auth import HTTPBasicAuth
 from xml.etree import ElementTree as ET
 from xmljson import badgerfish
@@ -15,15 +14,21 @@ class CMISAtomFeedFetcher(Fetcher):
     data. This might not work if we get collections much bigger than the
     current ones (~1000 objects max)
     '''
+    conditional_get = True
 
     def __init__(self, url_harvest, extra_data, **kwargs):
         '''Grab file and copy to local temp file'''
-        super(CMISAtomFeedFetcher, self).__init__(url_harvest, extra_data)
+        super(CMISAtomFeedFetcher, self).__init__(url_harvest, extra_data,
+                                                  **kwargs)
         # parse extra data for username,password
         uname, pswd = extra_data.split(',')
-        resp = requests.get(url_harvest,
-                            auth=HTTPBasicAuth(uname.strip(), pswd.strip()))
-        self.tree = ET.fromstring(resp.content)
+        content = self.fetch_source(
+            url_harvest, auth=HTTPBasicAuth(uname.strip(), pswd.strip()))
+        if content is None:
+            self.tree = None
+            self.objects_iter = iter([])
+            return
+        self.tree = ET.fromstring(content)
         self.objects = [
             badgerfish.data(x)
             for x in self.tree.findall('./{http://www.w3.org/2005/Atom}'
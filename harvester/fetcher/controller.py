@@ -1,11 +1,17 @@
 # -*- coding: utf-8 -*-
 import os
+import sys
 import tempfile
+import threading
+import Queue
 import urlparse
 import datetime
 import uuid
 import json
 import codecs
+import hashlib
+import types
+from itertools import chain
 import boto3
 from email.mime.text import MIMEText
 import logbook
@@ -13,49 +19,41 @@ from logbook import FileHandler
 import dplaingestion.couch
 from ..collection_registry_client import Collection
 from .. import config
+from ..harvest_state import HarvestCheckpoint, ValidatorCache, HighWaterMark
+from ..harvest_state import RecordHashIndex, MetadataFormatCache
+from ..harvest_state import get_redis_connection
+from ..s3_segments import S3SegmentWriter, SEGMENT_SIZE
+from .. import compression
 from .fetcher import Fetcher
 from .fetcher import NoRecordsFetchedException
-from .oai_fetcher import OAIFetcher
-from .solr_fetcher import SolrFetcher
-from .solr_fetcher import PySolrQueryFetcher
-from .solr_fetcher import RequestsSolrFetcher
-from .marc_fetcher import MARCFetcher
-from .marc_fetcher import AlephMARCXMLFetcher
-from .nuxeo_fetcher import UCLDCNuxeoFetcher
-from .oac_fetcher import OAC_XML_Fetcher
-from .oac_fetcher import OAC_JSON_Fetcher
-from .cmis_atom_feed_fetcher import CMISAtomFeedFetcher
-from .flickr_fetcher import Flickr_Fetcher
-from .youtube_fetcher import YouTube_Fetcher
-from .xml_fetcher import XML_Fetcher
-from .emuseum_fetcher import eMuseum_Fetcher
-from .ucd_json_fetcher import UCD_JSON_Fetcher
-from .ia_fetcher import IA_Fetcher
-from .preservica_api_fetcher import PreservicaFetcher
+from .registry import FetcherRegistry
 
 EMAIL_RETURN_ADDRESS = os.environ.get('EMAIL_RETURN_ADDRESS',
                                       'example@example.com')
-HARVEST_TYPES = {
-    'OAI': OAIFetcher,
-    'OAJ': OAC_JSON_Fetcher,
-    'OAC': OAC_XML_Fetcher,
-    'SLR': SolrFetcher,
-    'MRC': MARCFetcher,
-    'NUX': UCLDCNuxeoFetcher,
-    'ALX': AlephMARCXMLFetcher,
-    'SFX': PySolrQueryFetcher,
-    'UCB': RequestsSolrFetcher,  # Now points to more generic
+DATETIME_FMT = '%Y-%m-%dT%H:%M:%S.%f'
+HARVEST_TYPES = FetcherRegistry({
+    'OAI': 'oai_fetcher.OAIFetcher',
+    'OAJ': 'oac_fetcher.OAC_JSON_Fetcher',
+    'OAC': 'oac_fetcher.OAC_XML_Fetcher',
+    'SLR': 'solr_fetcher.SolrFetcher',
+    'MRC': 'marc_fetcher.MARCFetcher',
+    'NUX': 'nuxeo_fetcher.UCLDCNuxeoFetcher',
+    'ALX': 'marc_fetcher.AlephMARCXMLFetcher',
+    'SFX': 'solr_fetcher.PySolrQueryFetcher',
+    'UCB': 'solr_fetcher.RequestsSolrFetcher',  # Now points to more generic
     # class, accepts parameters
     # from extra data field
-    'PRE': CMISAtomFeedFetcher,  # 'Preservica CMIS Atom Feed'),
-    'FLK': Flickr_Fetcher,  # All public photos fetcher
-    'YTB': YouTube_Fetcher,  # by playlist id, use "uploads" list
-    'XML': XML_Fetcher,
-    'EMS': eMuseum_Fetcher,
-    'UCD': UCD_JSON_Fetcher,
-    'IAR': IA_Fetcher,
-    'PRA': PreservicaFetcher
-}
+    # 'Preservica CMIS Atom Feed'
+    'PRE': 'cmis_atom_feed_fetcher.CMISAtomFeedFetcher',
+    'FLK': 'flickr_fetcher.Flickr_Fetcher',  # All public photos fetcher
+    # by playlist id, use "uploads" list
+    'YTB': 'youtube_fetcher.YouTube_Fetcher',
+    'XML': 'xml_fetcher.XML_Fetcher',
+    'EMS': 'emuseum_fetcher.eMuseum_Fetcher',
+    'UCD': 'ucd_json_fetcher.UCD_JSON_Fetcher',
+    'IAR': 'ia_fetcher.IA_Fetcher',
+    'PRA': 'preservica_api_fetcher.PreservicaFetcher'
+})
 
 
 class HarvestController(object):
@@ -75,13 +73,72 @@ class HarvestController(object):
     ]
     bucket = 'ucldc-ingest'
     tmpl_s3path = 'data-fetched/{cid}/{datetime_start}/'
+    # fields that change without the record changing, not hashed
+    volatile_fields = ('datestamp', )
 
     def __init__(self,
                  user_email,
                  collection,
                  profile_path=None,
                  config_file=None,
+                 pipeline_depth=0,
+                 save_workers=1,
+                 checkpoint=False,
+                 s3_segment_size=None,
+                 s3_segment_records=None,
+                 file_compression=None,
+                 s3_compression=None,
+                 conditional_get=False,
+                 incremental=False,
+                 skip_unchanged=False,
+                 partitions=0,
+                 cache_formats=False,
+                 identifiers=None,
+                 objset_records=None,
+                 objset_size=None,
                  **kwargs):
+        '''If pipeline_depth is > 0, objsets are handed to save_workers
+        threads through a queue of that size so that the fetcher doesn't
+        wait on the disk & S3 saves.
+        If checkpoint is True, the fetcher position is saved to redis after
+        every saved objset and an interrupted harvest of the collection is
+        resumed from there.
+        If s3_segment_size (bytes) or s3_segment_records is set, objsets are
+        rolled up into S3 segments of that size instead of one S3 object
+        per objset.
+        file_compression & s3_compression ('gzip' or 'zstd') compress the
+        objset files in dir_save & the pages in S3. Only compress dir_save
+        if the enrichment reads it with harvester.compression.
+        If conditional_get is True, fetchers that download a whole source
+        file make a conditional GET with the validators saved by the last
+        ingest & when the file is unchanged, the harvest fetches nothing
+        and source_unchanged is True.
+        If incremental is True, fetchers that can filter by modification
+        time only fetch the records modified since the collection's high
+        water mark, the start of its last successful ingest. Deleted
+        records are not seen, they need a full harvest to be removed.
+        If skip_unchanged is True, records with the same hash as a record
+        saved by the last ingest of the collection are counted but not
+        saved to dir_save or S3, so they aren't enriched & saved again.
+        As with incremental harvests, deleted records need a full harvest.
+        If partitions is > 1, fetchers that can split their source fetch
+        that many partitions of it concurrently. Partitioned harvests can't
+        be resumed from a checkpoint.
+        If cache_formats is True, fetchers that negotiate the metadata
+        format with the source keep the formats it supports in redis.
+        identifiers, a list of record identifiers or the path of a file
+        with one per line, limits the harvest to those records. Only for
+        fetchers that can fetch records by identifier, the harvest doesn't
+        see the rest of the collection so nothing is deleted.
+        If objset_records or objset_size (bytes of record JSON) is set, the
+        records the fetcher returns, one at a time, a page at a time or all
+        at once, are regrouped into objsets of up to that size, so dir_save
+        & S3 get a file per objset_records records. Sizing by bytes
+        serializes the records an extra time. Checkpoints are only written
+        for objsets that end where an objset of the fetcher ends.
+        '''
+        compression.check_compression(file_compression)
+        compression.check_compression(s3_compression)
         self.user_email = user_email  # single or list
         self.collection = collection
         self.profile_path = profile_path
@@ -95,9 +152,43 @@ class HarvestController(object):
             self.couch_dashboard_name = 'dashboard'
 
         cls_fetcher = HARVEST_TYPES.get(self.collection.harvest_type, None)
+        if cls_fetcher is None:
+            raise ValueError('Harvest type {} is not in {}'.format(
+                self.collection.harvest_type, HARVEST_TYPES.keys()))
+        self.high_water_mark = None
+        self.modified_since = None
+        self._harvest_start = datetime.datetime.utcnow()
+        if incremental and cls_fetcher.incremental:
+            self.high_water_mark = HighWaterMark(
+                self.collection.id, get_redis_connection(self._config))
+            self.modified_since = self.high_water_mark.load()
+            if self.modified_since:
+                kwargs['modified_since'] = self.modified_since
+        if partitions > 1 and cls_fetcher.partitioned:
+            kwargs['partitions'] = partitions
+        if (objset_records or objset_size) and cls_fetcher.streamed:
+            kwargs['lazy'] = True
+        if cache_formats and cls_fetcher.cache_formats:
+            kwargs['format_cache'] = MetadataFormatCache(
+                get_redis_connection(self._config))
+        if isinstance(identifiers, basestring):
+            identifiers = read_identifiers(identifiers)
+        self.identifiers = identifiers
+        if identifiers:
+            if not cls_fetcher.targeted:
+                raise ValueError(
+                    'Harvest type {} can\'t harvest records by '
+                    'identifier'.format(self.collection.harvest_type))
+            kwargs['identifiers'] = identifiers
+        if conditional_get and cls_fetcher.conditional_get:
+            kwargs['validator_cache'] = ValidatorCache(
+                get_redis_connection(self._config))
         self.fetcher = cls_fetcher(self.collection.url_harvest,
                                    self.collection.harvest_extra_data,
                                    **kwargs)
+        if not self.fetcher.incremental:
+            # the fetcher can't filter this collection, a full harvest
+            self.modified_since = None
         self.logger = logbook.Logger('HarvestController')
         self.dir_save = tempfile.mkdtemp('_' + self.collection.slug)
         self.ingest_doc_id = None
@@ -106,6 +197,40 @@ class HarvestController(object):
         self.num_records = 0
         self.datetime_start = datetime.datetime.now()
         self.objset_page = 0
+        self.pipeline_depth = pipeline_depth
+        self.save_workers = save_workers
+        self._save_queue = None
+        self._save_threads = []
+        self._save_error = None
+        self._registry_data = None
+        self._registry_json = None
+        self.checkpoint = None
+        if checkpoint:
+            self.checkpoint = HarvestCheckpoint(
+                self.collection.id, get_redis_connection(self._config))
+        self._checkpoint_lock = threading.Lock()
+        self._checkpoint_pending = {}
+        self._checkpoint_next_page = 0
+        self.s3_segment_size = s3_segment_size
+        self.s3_segment_records = s3_segment_records
+        self._s3_writer = None
+        self.objset_records = objset_records
+        self.objset_size = objset_size
+        self.file_compression = file_compression
+        self.s3_compression = s3_compression
+        self.metrics = self.fetcher.metrics
+        self._unchanged = False
+        self.record_hashes = None
+        if skip_unchanged:
+            self.record_hashes = RecordHashIndex(
+                self.collection.id, get_redis_connection(self._config))
+        self._hashes_saved = None
+        self.num_unchanged = 0
+
+    @property
+    def source_unchanged(self):
+        '''True if the source hasn't changed since the last harvest'''
+        return self._unchanged or self.fetcher.source_unchanged
 
     @property
     def s3path(self):
@@ -113,6 +238,11 @@ class HarvestController(object):
             cid=self.collection.id,
             datetime_start=self.datetime_start.strftime('%Y-%m-%d-%H%M'))
 
+    def key_page(self, page):
+        '''S3 key for a page of the harvest'''
+        return ''.join((self.s3path, 'page-{}.jsonl'.format(page),
+                        compression.EXTENSIONS[self.s3_compression]))
+
     @staticmethod
     def dt_json_handler(obj):
         '''The json package cannot deal with datetimes.
@@ -127,34 +257,81 @@ class HarvestController(object):
     def jsonl(objset):
         '''Return a JSONL string for a given set of python objects
         '''
-        jsonl = ''
         if isinstance(objset, dict):
             objset = [objset]
-        for obj in objset:
-            jsonl += ''.join((json.dumps(
-                obj, default=HarvestController.dt_json_handler), '\n'))
-        return jsonl
+        return HarvestController.jsonl_from_records([
+            json.dumps(obj, default=HarvestController.dt_json_handler)
+            for obj in objset])
 
-    def save_objset_s3(self, objset):
-        '''Save the objset to a bucket'''
-        if not hasattr(self, 's3'):
-            self.s3 = boto3.resource('s3')
-        body = HarvestController.jsonl(objset)
-        bucket = self.s3.Bucket('ucldc-ingest')
-        key = ''.join((self.s3path, 'page-{}.jsonl'.format(self.objset_page)))
-        self.objset_page += 1
-        bucket.put_object(Body=body, Key=key)
+    @staticmethod
+    def jsonl_from_records(records):
+        '''Return a JSONL string from a list of serialized objects'''
+        return ''.join(chain.from_iterable((rec, '\n') for rec in records))
 
-    def save_objset(self, objset):
-        '''Save an object set to disk. If it is a single object, wrap in a
-        list to be uniform'''
-        filename = os.path.join(self.dir_save, str(uuid.uuid4()))
+    def serialize_obj(self, obj):
+        '''Return the JSON for one harvested object. The registry data
+        is shared by all the objects of the harvest, so splice in its JSON
+        instead of serializing it again for every object.
+        '''
+        if not isinstance(obj, dict) or self._registry_data is None or \
+                obj.get('collection') is not self._registry_data:
+            return json.dumps(obj, default=HarvestController.dt_json_handler)
+        if self._registry_json is None:
+            self._registry_json = json.dumps(
+                self._registry_data,
+                default=HarvestController.dt_json_handler)
+        obj_rest = dict(obj)
+        del obj_rest['collection']
+        if not obj_rest:
+            return ''.join(('{"collection": ', self._registry_json, '}'))
+        return ''.join((
+            '{"collection": ', self._registry_json, ', ',
+            json.dumps(obj_rest, default=HarvestController.dt_json_handler)
+            [1:]))
+
+    def serialize_objset(self, objset):
+        '''Serialize an objset once, returns a list of the JSON strings for
+        the objects. The same strings are used for the local file & the S3
+        JSONL page.'''
         if not type(objset) == list:
             objset = [objset]
-        with open(filename, 'w') as foo:
-            foo.write(
-                json.dumps(
-                    objset, default=HarvestController.dt_json_handler))
+        return [self.serialize_obj(obj) for obj in objset]
+
+    def save_objset_s3(self, objset, page=None, s3=None, records=None):
+        '''Save the objset to a bucket. If page is None, use the next page
+        number for the harvest. Pass in s3 to use a boto3 resource other than
+        the controller's own. records are the already serialized objects of
+        the objset'''
+        if not s3:
+            if not hasattr(self, 's3'):
+                self.s3 = boto3.resource('s3')
+            s3 = self.s3
+        if page is None:
+            page = self.objset_page
+            self.objset_page += 1
+        if records is None:
+            records = self.serialize_objset(objset)
+        body = compression.compress(
+            HarvestController.jsonl_from_records(records), self.s3_compression)
+        bucket = s3.Bucket('ucldc-ingest')
+        bucket.put_object(Body=body, Key=self.key_page(page))
+
+    def save_objset(self, objset, records=None):
+        '''Save an object set to disk. If it is a single object, wrap in a
+        list to be uniform. The records are written one at a time, no
+        JSON string is built for the whole objset'''
+        filename = os.path.join(self.dir_save, ''.join((
+            str(uuid.uuid4()),
+            compression.EXTENSIONS[self.file_compression])))
+        if records is None:
+            records = self.serialize_objset(objset)
+        with compression.open_write(filename, self.file_compression) as foo:
+            foo.write('[')
+            for i, rec in enumerate(records):
+                if i:
+                    foo.write(', ')
+                foo.write(rec)
+            foo.write(']')
 
     def create_ingest_doc(self):
         '''Create the DPLA style ingest doc in couch for this harvest session.
@@ -200,7 +377,10 @@ class HarvestController(object):
             "fetch_process/error": error_msg,
             "fetch_process/end_time": datetime.datetime.now().isoformat(),
             "fetch_process/total_items": items,
-            "fetch_process/total_collections": num_coll
+            "fetch_process/total_collections": num_coll,
+            "fetch_process/metrics": self.metrics.summary(),
+            "fetch_process/modified_since": self.modified_since,
+            "fetch_process/unchanged_items": self.num_unchanged
         }
         if not self.ingestion_doc:
             self.create_ingest_doc()
@@ -211,8 +391,17 @@ class HarvestController(object):
                               (self.ingestion_doc["_id"], __name__))
             raise e
 
-    def _add_registry_data(self, obj):
-        '''Add the registry based data to the harvested object.
+    @property
+    def registry_data(self):
+        '''The registry based collection data for the harvested objects.
+        Built once per harvest, every harvested object shares this list.
+        '''
+        if self._registry_data is None:
+            self._registry_data = self._build_registry_data()
+        return self._registry_data
+
+    def _build_registry_data(self):
+        '''Build the collection, campus & repository data from the registry.
         '''
         # get base registry URL
         url_tuple = urlparse.urlparse(self.collection.url)
@@ -222,24 +411,297 @@ class HarvestController(object):
                                                                       1)[1]
         self.collection['ingestType'] = 'collection'
         self.collection['title'] = self.collection.name
-        if 'collection' in obj:
-            # save before hammering
-            obj['source_collection_name'] = obj['collection']
-        obj['collection'] = dict(self.collection)
+        collection = dict(self.collection)
         campus = []
         for c in self.collection.get('campus', []):
             c.update({'@id': ''.join((base_url, c['resource_uri']))})
             campus.append(c)
-        obj['collection']['campus'] = campus
+        collection['campus'] = campus
         repository = []
         for r in self.collection['repository']:
             r.update({'@id': ''.join((base_url, r['resource_uri']))})
             repository.append(r)
-        obj['collection']['repository'] = repository
+        collection['repository'] = repository
         # in future may be more than one
-        obj['collection'] = [obj['collection']]
+        return [collection]
+
+    def _add_registry_data(self, obj):
+        '''Add the registry based data to the harvested object.
+        '''
+        if 'collection' in obj:
+            # save before hammering
+            obj['source_collection_name'] = obj['collection']
+        obj['collection'] = self.registry_data
         return obj
 
+    def record_hash(self, obj):
+        '''A sha1 of the record with its registry data, stable across
+        harvests. The volatile fields are left out.'''
+        if self._registry_json is None:
+            self._registry_json = json.dumps(
+                self._registry_data,
+                default=HarvestController.dt_json_handler)
+        obj_rest = dict((k, v) for k, v in obj.items()
+                        if k != 'collection' and k not in self.volatile_fields)
+        sha1 = hashlib.sha1(self._registry_json)
+        sha1.update(json.dumps(obj_rest, sort_keys=True,
+                               default=HarvestController.dt_json_handler))
+        return sha1.hexdigest()
+
+    def _skip_unchanged(self, objset):
+        '''Add the hashes of the objset's records to the next index. Return
+        the records that aren't in the last ingest's index.'''
+        if not isinstance(objset, list):
+            objset = [objset]
+        hashes = [self.record_hash(obj) for obj in objset]
+        self.record_hashes.add(hashes)
+        changed = [obj for obj, h in zip(objset, hashes)
+                   if h not in self._hashes_saved]
+        self.num_unchanged += len(objset) - len(changed)
+        return changed
+
+    def commit_record_hashes(self):
+        '''Make the hashes of this harvest the index for the next one. Call
+        once the records are saved, a record that failed to save would be
+        skipped by the next harvest.'''
+        if self.record_hashes:
+            self.record_hashes.commit()
+
+    def commit_validators(self):
+        '''Save the validators of the sources fetched, so the next
+        conditional harvest skips them if unchanged. Call once the records
+        are saved, a source that failed to ingest would be skipped.'''
+        self.fetcher.commit_validators()
+
+    def commit_high_water_mark(self):
+        '''Make the start of this harvest the high water mark for the next
+        incremental harvest. Call once the records are saved, the records
+        modified before a failed ingest would never be harvested again.'''
+        if self.high_water_mark:
+            self.high_water_mark.save(self._harvest_start)
+
+    def _cursor(self):
+        '''The fetcher's cursor, if checkpointing'''
+        return self.fetcher.get_cursor() if self.checkpoint else None
+
+    def _checkpoint_state(self, cursor):
+        '''The state to checkpoint once the objset just fetched is saved,
+        cursor is the fetcher's position after it.
+        None if not checkpointing or the fetcher can't be resumed.'''
+        if not self.checkpoint or cursor is None:
+            return None
+        return {
+            'cursor': cursor,
+            'objset_page': self.objset_page + 1,
+            'num_records': self.num_records,
+            'num_unchanged': self.num_unchanged,
+            'datetime_start': self.datetime_start.strftime(DATETIME_FMT),
+            'harvest_start': self._harvest_start.strftime(DATETIME_FMT)
+        }
+
+    def _page_saved(self, page, state):
+        '''Write the checkpoint for the last page of the contiguous run of
+        saved pages. With save workers pages can finish out of order, a
+        checkpoint past an unsaved page would lose that page on resume.
+        '''
+        with self._checkpoint_lock:
+            self._checkpoint_pending[page] = state
+            state = None
+            while self._checkpoint_next_page in self._checkpoint_pending:
+                state = self._checkpoint_pending.pop(
+                    self._checkpoint_next_page) or state
+                self._checkpoint_next_page += 1
+            if state:
+                self.checkpoint.save(state)
+
+    def resume(self):
+        '''Pick up the harvest from the collection's checkpoint, if any.
+        The harvest continues in the same S3 prefix. The pages already
+        fetched have to be copied from S3 to dir_save with
+        restore_objsets_s3, the old job's dir_save is gone (tmp is cleaned
+        when a job starts) & may hold pages past the checkpoint.
+        Returns True if resuming.
+        '''
+        state = self.checkpoint.load()
+        if not state:
+            return False
+        self.logger.info('Resuming harvest from checkpoint: {}'.format(
+            json.dumps(state)))
+        self.fetcher.set_cursor(state['cursor'])
+        self.datetime_start = datetime.datetime.strptime(
+            state['datetime_start'], DATETIME_FMT)
+        self.objset_page = state['objset_page']
+        self.num_records = state['num_records']
+        self.num_unchanged = state.get('num_unchanged', 0)
+        if 'harvest_start' in state:
+            self._harvest_start = datetime.datetime.strptime(
+                state['harvest_start'], DATETIME_FMT)
+        return True
+
+    def restore_objsets_s3(self):
+        '''Copy the pages already saved to S3 into dir_save'''
+        if self._s3_writer:
+            for records in self._s3_writer.restore(self.objset_page):
+                self.save_objset(None, records=records)
+            return
+        if not hasattr(self, 's3'):
+            self.s3 = boto3.resource('s3')
+        for page in range(self.objset_page):
+            body = self.s3.Object(
+                self.bucket, self.key_page(page)).get()['Body'].read()
+            self.save_objset(
+                None, records=compression.decompress(body).splitlines())
+
+    def _save_page(self, page, objset, s3=None, checkpoint_state=None):
+        '''Save the objset as the given page, then checkpoint it. With S3
+        segments the checkpoint is written once the segment is uploaded.
+        '''
+        with self.metrics.timer('serialize'):
+            records = self.serialize_objset(objset)
+        with self.metrics.timer('disk_save'):
+            self.save_objset(objset, records=records)
+        with self.metrics.timer('s3_save'):
+            if self._s3_writer:
+                self._s3_writer.write_page(page, records, checkpoint_state)
+                return
+            self.save_objset_s3(objset, page=page, s3=s3, records=records)
+        if self.checkpoint:
+            self._page_saved(page, checkpoint_state)
+
+    def _start_s3_writer(self):
+        if not (self.s3_segment_size or self.s3_segment_records):
+            return
+        self._s3_writer = S3SegmentWriter(
+            self.bucket,
+            self.s3path,
+            segment_size=self.s3_segment_size or SEGMENT_SIZE,
+            segment_records=self.s3_segment_records,
+            compression=self.s3_compression,
+            on_saved=self._page_saved if self.checkpoint else None)
+
+    def _stop_s3_writer(self):
+        '''Upload the last segment'''
+        s3_writer, self._s3_writer = self._s3_writer, None
+        s3_writer.close()
+
+    def _save_worker(self):
+        '''Drain the save queue to disk & S3. On error, keep draining so the
+        fetching thread never blocks on a full queue, the error is raised in
+        the harvesting thread.
+        '''
+        # boto3 resources are not thread safe, one per worker
+        s3 = boto3.resource('s3')
+        while True:
+            item = self._save_queue.get()
+            try:
+                if item is None:
+                    return
+                if self._save_error:
+                    continue
+                page, objset, checkpoint_state = item
+                self._save_page(page, objset, s3=s3,
+                                checkpoint_state=checkpoint_state)
+            except Exception:
+                self._save_error = sys.exc_info()
+            finally:
+                self._save_queue.task_done()
+
+    def _start_save_workers(self):
+        self._save_error = None
+        self._save_queue = Queue.Queue(maxsize=self.pipeline_depth)
+        self._save_threads = []
+        for i in range(self.save_workers):
+            t = threading.Thread(
+                target=self._save_worker, name='save-worker-{}'.format(i))
+            t.daemon = True
+            t.start()
+            self._save_threads.append(t)
+
+    def _stop_save_workers(self):
+        '''Wait for queued objsets to be saved, then stop the workers'''
+        for t in self._save_threads:
+            self._save_queue.put(None)
+        for t in self._save_threads:
+            t.join()
+        self._save_threads = []
+        self._raise_save_error()
+
+    def _raise_save_error(self):
+        if self._save_error:
+            exc_type, exc_value, exc_tb = self._save_error
+            self._save_error = None
+            raise exc_type, exc_value, exc_tb
+
+    def _save(self, objset, checkpoint_state=None):
+        '''Save the objset to disk & S3, in this thread if not pipelined.
+        The put blocks when the queue is full, which throttles the fetcher
+        to the speed of the savers.
+        '''
+        page = self.objset_page
+        self.objset_page += 1
+        if not self._save_threads:
+            self._save_page(page, objset, checkpoint_state=checkpoint_state)
+            return
+        self._raise_save_error()
+        self._save_queue.put((page, objset, checkpoint_state))
+
+    def _fetch(self, objsets=None):
+        '''Iterate the fetcher, or the records of a lazy objset, timing
+        each page'''
+        objsets = iter(objsets if objsets is not None else self.fetcher)
+        while True:
+            with self.metrics.timer('fetch'):
+                try:
+                    objset = objsets.next()
+                except StopIteration:
+                    return
+            yield objset
+
+    def _objsets(self):
+        '''The objsets to save, each with the fetcher's cursor just after
+        it, None if it can't be checkpointed there'''
+        if not (self.objset_records or self.objset_size):
+            for objset in self._fetch():
+                yield objset, self._cursor()
+            return
+        for objset in self._regroup(self._fetch()):
+            yield objset
+
+    def _objset_full(self, objset, size):
+        if self.objset_records and len(objset) >= self.objset_records:
+            return True
+        return bool(self.objset_size) and size >= self.objset_size
+
+    def _regroup(self, objsets):
+        '''Regroup the records of the fetcher's objsets into objsets of
+        objset_records records or objset_size bytes. The fetcher's objsets
+        can be a record, a list or a lazy iterator of records.
+        '''
+        objset = []
+        size = 0
+        for fetched in objsets:
+            if isinstance(fetched, types.GeneratorType):
+                records = self._fetch(fetched)
+            elif isinstance(fetched, list):
+                records = fetched
+            else:
+                records = [fetched]
+            for record in records:
+                if self._objset_full(objset, size):
+                    # part way through the fetched objset, no cursor here
+                    yield objset, None
+                    objset = []
+                    size = 0
+                objset.append(record)
+                if self.objset_size:
+                    size += len(self.serialize_obj(record))
+            if objset and self._objset_full(objset, size):
+                yield objset, self._cursor()
+                objset = []
+                size = 0
+        if objset:
+            yield objset, self._cursor()
+
     def harvest(self):
         '''Harvest the collection'''
         self.logger.info(' '.join((
@@ -249,28 +711,75 @@ class HarvestController(object):
             str(self.collection['campus']),
             str(self.collection['repository']))))
         self.num_records = 0
+        self.num_unchanged = 0
+        if self.source_unchanged:
+            self.logger.info('Source unchanged since the last harvest')
+            return 0
         next_log_n = interval = 100
-        for objset in self.fetcher:
-            if isinstance(objset, list):
-                self.num_records += len(objset)
-                # TODO: use map here
-                for obj in objset:
-                    self._add_registry_data(obj)
-            else:
-                self.num_records += 1
-                self._add_registry_data(objset)
-            self.save_objset(objset)
-            self.save_objset_s3(objset)
-            if self.num_records >= next_log_n:
-                self.logger.info(' '.join((str(self.num_records),
-                                           'records harvested')))
-                if self.num_records < 10000 and \
-                        self.num_records >= 10 * interval:
-                    interval = 10 * interval
-                next_log_n += interval
+        resumed = self.checkpoint and self.resume()
+        self._checkpoint_pending = {}
+        self._checkpoint_next_page = self.objset_page
+        self._registry_data = self._build_registry_data()
+        self._registry_json = None
+        if self.record_hashes:
+            self._hashes_saved = self.record_hashes.load()
+            if not resumed:
+                self.record_hashes.start()
+        self._start_s3_writer()
+        if self.pipeline_depth > 0:
+            self._start_save_workers()
+        try:
+            if resumed:
+                self.restore_objsets_s3()
+            for objset, cursor in self._objsets():
+                with self.metrics.timer('registry'):
+                    if isinstance(objset, list):
+                        self.num_records += len(objset)
+                        self.metrics.record_page(len(objset))
+                        # TODO: use map here
+                        for obj in objset:
+                            self._add_registry_data(obj)
+                    else:
+                        self.num_records += 1
+                        self.metrics.record_page(1)
+                        self._add_registry_data(objset)
+                if self.record_hashes:
+                    with self.metrics.timer('hash'):
+                        objset = self._skip_unchanged(objset)
+                if objset or not self.record_hashes:
+                    self._save(objset,
+                               checkpoint_state=self._checkpoint_state(cursor))
+                if self.num_records >= next_log_n:
+                    self.logger.info(' '.join((str(self.num_records),
+                                               'records harvested')))
+                    if self.num_records < 10000 and \
+                            self.num_records >= 10 * interval:
+                        interval = 10 * interval
+                    next_log_n += interval
+        finally:
+            self.fetcher.close()
+            try:
+                if self._save_threads:
+                    self._stop_save_workers()
+            finally:
+                if self._s3_writer:
+                    self._stop_s3_writer()
 
+        if self.checkpoint:
+            self.checkpoint.clear()
         if self.num_records == 0:
-            raise NoRecordsFetchedException
+            if not self.modified_since:
+                raise NoRecordsFetchedException
+            self.logger.info('No records modified since {}'.format(
+                self.modified_since))
+            self._unchanged = True
+        elif self.num_unchanged == self.num_records:
+            self.logger.info('All {} records unchanged since the last '
+                             'ingest'.format(self.num_records))
+            self._unchanged = True
+        if self.num_unchanged:
+            self.logger.info('{} unchanged records skipped'.format(
+                self.num_unchanged))
         msg = ' '.join((str(self.num_records), 'records harvested'))
         self.logger.info(msg)
         return self.num_records
@@ -301,6 +810,12 @@ def get_log_file_path(collection_slug):
     return os.path.join(log_file_dir, log_file_name)
 
 
+def read_identifiers(path):
+    '''Return the record identifiers in the file, one per line'''
+    with open(path) as foo:
+        return [line.strip() for line in foo if line.strip()]
+
+
 def create_mimetext_msg(mail_from, mail_to, subject, message):
     msg = MIMEText(message)
     msg['Subject'] = str(subject)
@@ -385,17 +900,52 @@ def main(user_email,
     ingest_doc_id = harvester.create_ingest_doc()
     logger.info('Ingest DOC ID: ' + ingest_doc_id)
     logger.info('Start harvesting next')
-    num_recs = harvester.harvest()
+    try:
+        num_recs = harvester.harvest()
+    except Exception as e:
+        import traceback
+        error_msg = ''.join(("Error while harvesting: type-> ", str(type(e)),
+                             " TRACE:\n" + str(traceback.format_exc())))
+        logger.error(error_msg)
+        harvester.update_ingest_doc(
+            'error', error_msg=error_msg, items=harvester.num_records)
+        raise e
+    if harvester.source_unchanged:
+        logger.info(''.join(('Source for ', collection.slug,
+                             ' unchanged since the last harvest.')))
+        harvester.update_ingest_doc('unchanged', items=0, num_coll=1)
+        if my_log_handler:
+            my_log_handler.pop_application()
+        if my_mail_handler:
+            my_mail_handler.pop_application()
+        return ingest_doc_id, num_recs, harvester.dir_save, harvester
     msg = ''.join(('Finished harvest of ', collection.slug, '. ',
                    str(num_recs), ' records harvested.'))
     logger.info(msg)
     logger.debug('-- get a new harvester --')
+    metrics = harvester.metrics
+    modified_since = harvester.modified_since
+    harvest_start = harvester._harvest_start
+    num_unchanged = harvester.num_unchanged
+    unchanged = harvester._unchanged
+    harvest_fetcher = harvester.fetcher
     harvester = HarvestController(
          user_email,
          collection,
          profile_path=profile_path,
          config_file=config_file,
          **kwargs)
+    harvester.metrics = metrics
+    # the new harvester sees the high water mark of this harvest
+    harvester.modified_since = modified_since
+    harvester._harvest_start = harvest_start
+    harvester.num_unchanged = num_unchanged
+    # the harvest's fetcher, with the validators of the sources it fetched.
+    # The new one may have fetched a source again, against validators
+    # that aren't committed until the records are saved
+    harvester.fetcher.close()
+    harvester.fetcher = harvest_fetcher
+    harvester._unchanged = unchanged
     harvester.ingest_doc_id = ingest_doc_id
     harvester.couch = dplaingestion.couch.Couch(
             config_file=harvester.config_file,
@@ -1,7 +1,4 @@
 # -*- coding: utf-8 -*-
-import datetime
-import time
-import requests
 import re
 from xml.etree import ElementTree as ET
 from collections import defaultdict
@@ -11,6 +8,8 @@ class eMuseum_Fetcher(Fetcher):
     '''Paginates through eMuseum API XML search results until
         no more records are found'''
 
+    cursor_attrs = ('page_current', )
+
     def __init__(self, url_harvest, extra_data, **kwargs):
         self.url_base = url_harvest
         self.page_current = 1
@@ -66,10 +65,7 @@ class eMuseum_Fetcher(Fetcher):
     def next(self):
         '''get next objset, use etree to pythonize. Stop
         iterating when no more <object>s are found'''
-        dt_start = dt_end = datetime.datetime.now()
-        xml = requests.get(self.url_current).text
-        dt_end = datetime.datetime.now()
-        time.sleep((dt_end-dt_start).total_seconds())
+        xml = self.requests_get(self.url_current).text
         tree = ET.fromstring(xml.encode('utf-8'))
         hits = tree.findall("objects/object")
         self.docs_total = len(hits)
@@ -1,5 +1,12 @@
 # -*- coding: utf-8 -*-
+import time
+import urllib
+import hashlib
+import urlparse
 import logbook
+from .metrics import FetchMetrics
+from .http_session import HarvestSession, retries, throttled
+from ..rate_limit import get_rate_limiter
 
 
 class NoRecordsFetchedException(Exception):
@@ -9,10 +16,42 @@ class NoRecordsFetchedException(Exception):
 class Fetcher(object):
     '''Base class for harvest objects.'''
 
-    def __init__(self, url_harvest, extra_data, **kwargs):
+    # True for fetchers that download their source file with fetch_source,
+    # the controller passes them a validator_cache for conditional GETs
+    conditional_get = False
+    validator_cache = None
+    # set by fetch_source when the source hasn't changed since the last
+    # harvest, the fetcher then returns no records
+    source_unchanged = False
+    # True for fetchers that can limit the harvest to the records modified
+    # since a time, the controller passes them modified_since, a
+    # "YYYY-MM-DDThh:mm:ssZ" UTC string, for incremental harvests. Set False
+    # on the fetcher if the collection can't be filtered, for a full harvest
+    incremental = False
+    # True for fetchers that can split their source into partitions and
+    # fetch them concurrently, the controller passes them the number of
+    # partitions to fetch at once
+    partitioned = False
+    # True for fetchers that negotiate a metadata format with the source,
+    # the controller passes them a format_cache to keep it between harvests
+    cache_formats = False
+    # True for fetchers that can fetch just the records with the given
+    # identifiers, the controller passes them the list of identifiers
+    targeted = False
+    # True for fetchers that can return an objset as a generator of its
+    # records, the controller passes them lazy=True when it regroups the
+    # records into objsets of its own size
+    streamed = False
+    # requests/second to the source's host, when HARVEST_RATE_LIMITS has
+    # no rate for it. None for no limit
+    rate_limit = None
+
+    def __init__(self, url_harvest, extra_data, validator_cache=None,
+                 **kwargs):
         self.url = url_harvest
         self.extra_data = extra_data
         self.logger = logbook.Logger('FetcherBaseClass')
+        self.validator_cache = validator_cache
 
     def __iter__(self):
         return self
@@ -23,6 +62,150 @@ class Fetcher(object):
         '''
         raise NotImplementedError
 
+    @property
+    def metrics(self):
+        '''The FetchMetrics the fetcher records its requests in. Created on
+        first use, not all fetchers call the base __init__.'''
+        if getattr(self, '_metrics', None) is None:
+            self._metrics = FetchMetrics()
+        return self._metrics
+
+    @metrics.setter
+    def metrics(self, metrics):
+        self._metrics = metrics
+
+    @property
+    def session(self):
+        '''The HarvestSession the fetcher makes its HTTP requests with,
+        created on first use'''
+        if getattr(self, '_session', None) is None:
+            self._session = HarvestSession()
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        self._session = session
+
+    @property
+    def rate_limiter(self):
+        '''The HostRateLimiter the fetcher's requests wait on'''
+        if getattr(self, '_rate_limiter', None) is None:
+            self._rate_limiter = get_rate_limiter()
+        return self._rate_limiter
+
+    @rate_limiter.setter
+    def rate_limiter(self, rate_limiter):
+        self._rate_limiter = rate_limiter
+
+    def wait_for_host(self, url):
+        '''Wait until the rate limit for url's host allows a request'''
+        wait = self.rate_limiter.acquire(url, self.rate_limit)
+        if wait:
+            self.metrics.add_stage_time('rate_limit', wait)
+
+    def urlopen_read(self, url):
+        '''Return the content at url. Local files, which some fetchers
+        accept for url_harvest, are read with urllib'''
+        if urlparse.urlsplit(url).scheme not in ('http', 'https'):
+            start = time.time()
+            data = urllib.urlopen(url).read()
+            self.metrics.record_request(time.time() - start, len(data))
+            return data
+        return self.requests_get(url).content
+
+    def requests_get(self, url, **kwargs):
+        '''GET the url with the fetcher's session. The body of a stream=True
+        response isn't read here, its reader records the bytes with
+        metrics.record_bytes'''
+        self.wait_for_host(url)
+        start = time.time()
+        resp = self.session.get(url, **kwargs)
+        nbytes = 0 if kwargs.get('stream') else len(resp.content)
+        self.metrics.record_request(time.time() - start, nbytes,
+                                    retries=retries(resp))
+        if throttled(resp):
+            self.rate_limiter.throttled(url)
+        return resp
+
+    def fetch_source(self, url, **kwargs):
+        '''Return the content of the source file at url, kwargs are passed
+        to requests_get.
+        With a validator_cache, the request is made conditional on the
+        validators saved by the last ingest. If the server answers 304 Not
+        Modified or the content hash is unchanged, source_unchanged is set &
+        None returned. The new validators are saved by commit_validators once
+        the records are saved.
+        '''
+        local = urlparse.urlsplit(url).scheme not in ('http', 'https')
+        if not self.validator_cache:
+            if local:
+                return self.urlopen_read(url)
+            return self.requests_get(url, **kwargs).content
+        cached = self.validator_cache.get(url) or {}
+        validators = {}
+        if local:
+            content = self.urlopen_read(url)
+        else:
+            headers = dict(kwargs.pop('headers', None) or {})
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+            resp = self.requests_get(url, headers=headers, **kwargs)
+            if resp.status_code == 304:
+                self.logger.info('Source not modified: {}'.format(url))
+                self.source_unchanged = True
+                return None
+            content = resp.content
+            validators['etag'] = resp.headers.get('ETag')
+            validators['last_modified'] = resp.headers.get('Last-Modified')
+        validators['sha1'] = hashlib.sha1(content).hexdigest()
+        self.validators_fetched[url] = validators
+        if cached.get('sha1') == validators['sha1']:
+            self.logger.info('Source content unchanged: {}'.format(url))
+            self.source_unchanged = True
+            return None
+        return content
+
+    @property
+    def validators_fetched(self):
+        '''The validators of the sources fetched, by URL'''
+        if getattr(self, '_validators_fetched', None) is None:
+            self._validators_fetched = {}
+        return self._validators_fetched
+
+    def commit_validators(self):
+        '''Save the validators of the sources fetched to the cache'''
+        if not self.validator_cache:
+            return
+        for url, validators in self.validators_fetched.items():
+            self.validator_cache.set(url, validators)
+
+    # attributes that locate the harvest in the feed, for fetchers that can
+    # be resumed by restoring them
+    cursor_attrs = ()
+
+    def get_cursor(self):
+        '''Return a JSON serializable cursor for the position in the feed
+        just after the last set returned by next.
+        Fetchers that can't restart a harvest part way through return None.
+        '''
+        if not self.cursor_attrs:
+            return None
+        return dict((name, getattr(self, name)) for name in self.cursor_attrs)
+
+    def set_cursor(self, cursor):
+        '''Restart the harvest from a cursor returned by get_cursor'''
+        if not self.cursor_attrs:
+            raise NotImplementedError
+        for name in self.cursor_attrs:
+            setattr(self, name, cursor[name])
+
+    def close(self):
+        '''Stop the threads & processes the fetcher started. The controller
+        calls it when the harvest ends, on errors too.'''
+        pass
+
 
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
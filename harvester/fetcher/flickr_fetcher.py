@@ -1,6 +1,5 @@
 # -*- coding: utf-8 -*-
 import os
-import urllib
 import re
 from xml.etree import ElementTree as ET
 from .fetcher import Fetcher
@@ -31,6 +30,8 @@ class Flickr_Fetcher(Fetcher):
     url_get_photo_info_template = 'https://api.flickr.com/services/rest/' \
         '?api_key={api_key}&method=flickr.photos.getInfo&photo_id={photo_id}'
 
+    cursor_attrs = ('page_current', 'doc_current', 'docs_fetched')
+
     def __init__(self,
                  url_harvest,
                  extra_data,
@@ -44,7 +45,7 @@ class Flickr_Fetcher(Fetcher):
         self.page_current = 1
         self.doc_current = 0
         self.docs_fetched = 0
-        xml = urllib.urlopen(self.url_current).read()
+        xml = self.urlopen_read(self.url_current)
         total = re.search('total="(?P<total>\d+)"', xml)
         self.docs_total = int(total.group('total'))
         page_total = re.search('pages="(?P<page_total>\d+)"', xml)
@@ -117,14 +118,14 @@ class Flickr_Fetcher(Fetcher):
         # for each <photo> tag, create an object with id, server & farm saved
         # then get the info for the photo and add to object
         # return the full list of objects to the harvest controller
-        tree = ET.fromstring(urllib.urlopen(self.url_current).read())
+        tree = ET.fromstring(self.urlopen_read(self.url_current))
         photo_list = tree.findall('.//photo')
         objset = []
         for photo in photo_list:
             photo_obj = photo.attrib
             url_photo_info = self.url_get_photo_info_template.format(
                 api_key=self.api_key, photo_id=photo_obj['id'])
-            ptree = ET.fromstring(urllib.urlopen(url_photo_info).read())
+            ptree = ET.fromstring(self.urlopen_read(url_photo_info))
             photo_info = ptree.find('.//photo')
             photo_obj.update(photo_info.attrib)
             photo_obj.update(
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+'''The requests Session the fetchers make their HTTP requests with.
+Connections to each host are pooled & kept alive between requests, gzip is
+negotiated, every request gets a timeout and failed connections & 429/5xx
+responses are retried with exponential backoff, honoring Retry-After.
+The defaults can be set from the environment.
+'''
+import os
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+from ..rate_limit import THROTTLE_STATUS
+
+CONNECT_TIMEOUT = float(os.environ.get('HARVEST_HTTP_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.environ.get('HARVEST_HTTP_READ_TIMEOUT', 300))
+RETRIES = int(os.environ.get('HARVEST_HTTP_RETRIES', 5))
+BACKOFF_FACTOR = float(os.environ.get('HARVEST_HTTP_BACKOFF_FACTOR', 1))
+RETRY_STATUS = (429, 500, 502, 503, 504)
+POOL_MAXSIZE = 10
+
+
+class HarvestSession(requests.Session):
+    '''A requests Session with a default timeout & retrying adapters.
+    timeout is (connect, read) seconds, the backoff between retries is
+    backoff_factor * 2 ** (retry - 1) seconds.
+    '''
+
+    def __init__(self,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+                 retries=RETRIES,
+                 backoff_factor=BACKOFF_FACTOR,
+                 pool_maxsize=POOL_MAXSIZE):
+        super(HarvestSession, self).__init__()
+        self.timeout = timeout
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUS,
+            respect_retry_after_header=True,
+            # return the last response, callers check the status
+            raise_on_status=False)
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.mount('http://', adapter)
+        self.mount('https://', adapter)
+        self.headers['Accept-Encoding'] = 'gzip, deflate'
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super(HarvestSession, self).request(method, url, **kwargs)
+
+
+def retries(resp):
+    '''Return the number of times the request for resp was retried'''
+    retry = getattr(resp.raw, 'retries', None)
+    return len(retry.history) if retry else 0
+
+
+def throttled(resp):
+    '''True if the server answered 429 or 503 for the request for resp,
+    including the retries'''
+    if resp.status_code in THROTTLE_STATUS:
+        return True
+    retry = getattr(resp.raw, 'retries', None)
+    return bool(retry) and any(
+        attempt.status in THROTTLE_STATUS for attempt in retry.history)
+
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import urllib
 import json
 from .fetcher import Fetcher
 
@@ -25,6 +24,8 @@ class IA_Fetcher(Fetcher):
     url_advsearch = 'https://archive.org/advancedsearch.php?' \
         'q={search_query}&rows=500&page={page_current}&output=json'
 
+    cursor_attrs = ('page_current', 'doc_current')
+
     def __init__(self, url_harvest, extra_data, **kwargs):
         self.url_base = url_harvest
         self.search_query = extra_data
@@ -34,7 +35,7 @@ class IA_Fetcher(Fetcher):
     def next(self):
         self.url_current = self.url_advsearch.format(
             page_current=self.page_current, search_query=self.search_query)
-        search = urllib.urlopen(self.url_current).read()
+        search = self.urlopen_read(self.url_current)
         results = json.loads(search)
         self.doc_total = results["response"]["numFound"]
 
@@ -1,21 +1,21 @@
 # -*- coding: utf-8 -*-
-import urllib
 import tempfile
 from xml.etree import ElementTree as ET
 from pymarc import MARCReader
-import pymarc
 from .fetcher import Fetcher
+from .marcxml import records_to_dicts
 
 
 class MARCFetcher(Fetcher):
     '''Harvest a MARC FILE. Can be local or at a URL'''
+    conditional_get = True
 
     def __init__(self, url_harvest, extra_data, **kwargs):
         '''Grab file and copy to local temp file'''
         super(MARCFetcher, self).__init__(url_harvest, extra_data, **kwargs)
         self.url_marc_file = url_harvest
         self.marc_file = tempfile.TemporaryFile()
-        self.marc_file.write(urllib.urlopen(self.url_marc_file).read())
+        self.marc_file.write(self.fetch_source(self.url_marc_file) or '')
         self.marc_file.seek(0)
         self.marc_reader = MARCReader(
             self.marc_file, to_unicode=True, utf8_handling='replace')
@@ -49,7 +49,7 @@ class AlephMARCXMLFetcher(Fetcher):
     def get_current_xml_tree(self):
         '''Return an ElementTree for the next xml_page'''
         url = self.get_url_current_chunk()
-        return ET.fromstring(urllib.urlopen(url).read())
+        return ET.fromstring(self.urlopen_read(url))
 
     def get_total_records(self, tree):
         '''Return the total number of records from the etree passed in'''
@@ -68,15 +68,8 @@ class AlephMARCXMLFetcher(Fetcher):
         self.current_record = int(recs_xml[-1].find('.//zs:recordPosition',
                                                     self.ns).text)
         self.current_record += 1
-        # translate to pymarc records & return
-        marc_xml_file = tempfile.TemporaryFile()
-        marc_xml_file.write(ET.tostring(tree))
-        marc_xml_file.seek(0)
-        recs = [
-            rec.as_dict() for rec in pymarc.parse_xml_to_array(marc_xml_file)
-            if rec is not None
-        ]
-        return recs
+        # translate to pymarc record dicts & return
+        return records_to_dicts(tree)
 
 
 # Copyright © 2016, Regents of the University of California
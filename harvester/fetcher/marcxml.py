@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+'''Convert parsed MARCXML straight to the dicts of pymarc's Record.as_dict.
+pymarc only parses MARCXML from files with SAX, so the fetchers wrote the
+already parsed elements back out to temp files for it. These work on the
+elements, lxml or ElementTree, and follow pymarc's XmlHandler: elements
+are matched by local name in any namespace.
+'''
+
+# the leader of a pymarc Record without one
+DEFAULT_LEADER = (' ' * 10) + '22' + (' ' * 8) + '4500'
+FIELD_ELEMENTS = ('leader', 'controlfield', 'datafield')
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _text(element):
+    return unicode(element.text) if element.text else u''
+
+
+def _field_tag(tag):
+    '''pymarc's Field tag normalization'''
+    try:
+        return '%03i' % int(tag)
+    except ValueError:
+        return '%03s' % tag
+
+
+def record_to_dict(record):
+    '''Return the Record.as_dict() dict for a MARCXML record element'''
+    leader = DEFAULT_LEADER
+    fields = []
+    for element in record:
+        if not isinstance(element.tag, basestring):
+            continue  # comments & processing instructions
+        name = _local_name(element.tag)
+        if name == 'leader':
+            leader = _text(element)
+        elif name == 'controlfield':
+            fields.append({_field_tag(element.get('tag')): _text(element)})
+        elif name == 'datafield':
+            fields.append({_field_tag(element.get('tag')): {
+                'subfields': [{sub.get('code'): _text(sub)}
+                              for sub in element
+                              if isinstance(sub.tag, basestring) and
+                              _local_name(sub.tag) == 'subfield'],
+                'ind1': element.get('ind1', u' '),
+                'ind2': element.get('ind2', u' ')}})
+    return {'leader': leader, 'fields': fields}
+
+
+def records_to_dicts(tree):
+    '''Return the dicts for the MARC records in the tree. As with pymarc,
+    an element named record that has other records in it is a wrapper, not
+    a MARC record (e.g. the SRU zs:record).
+    '''
+    records = []
+
+    def find_records(element):
+        '''Add the innermost records in element, True if any'''
+        found = False
+        for child in element:
+            if isinstance(child.tag, basestring) and \
+                    _local_name(child.tag) not in FIELD_ELEMENTS and \
+                    find_records(child):
+                found = True
+        if not found and _local_name(element.tag) == 'record':
+            records.append(element)
+            found = True
+        return found
+
+    find_records(tree)
+    return [record_to_dict(record) for record in records]
+
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+from contextlib import contextmanager
+
+
+class FetchMetrics(object):
+    '''Throughput & latency counters for a harvest.
+    Fetchers record their page requests, the harvest controller records the
+    pages & the time spent in each of its stages. Safe to update from the
+    save worker threads.
+    '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.time_start = time.time()
+        self.requests = 0
+        self.request_time = 0.0
+        self.request_time_max = 0.0
+        self.bytes = 0
+        self.retries = 0
+        self.pages = 0
+        self.records = 0
+        self.stages = {}
+
+    def record_request(self, seconds, nbytes=0, retries=0):
+        '''Record a request to the source, the size of the response & the
+        number of times the request was retried'''
+        with self._lock:
+            self.requests += 1
+            self.request_time += seconds
+            self.request_time_max = max(self.request_time_max, seconds)
+            self.bytes += nbytes
+            self.retries += retries
+
+    def record_bytes(self, nbytes):
+        '''Add the bytes of a streamed response, read after its request was
+        recorded'''
+        with self._lock:
+            self.bytes += nbytes
+
+    def record_retry(self):
+        with self._lock:
+            self.retries += 1
+
+    def record_page(self, n_records):
+        with self._lock:
+            self.pages += 1
+            self.records += n_records
+
+    def add_stage_time(self, stage, seconds):
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def timer(self, stage):
+        '''Add the time spent in the with block to the stage'''
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_stage_time(stage, time.time() - start)
+
+    def summary(self):
+        '''Return the metrics as a dict for the ingest doc'''
+        with self._lock:
+            elapsed = time.time() - self.time_start
+            return {
+                'elapsed_seconds': round(elapsed, 3),
+                'pages': self.pages,
+                'records': self.records,
+                'records_per_second':
+                    round(self.records / elapsed, 3) if elapsed else None,
+                'requests': self.requests,
+                'request_seconds_avg':
+                    round(self.request_time / self.requests, 4)
+                    if self.requests else None,
+                'request_seconds_max': round(self.request_time_max, 4),
+                'bytes_received': self.bytes,
+                'retries': self.retries,
+                'stage_seconds': dict((stage, round(seconds, 3))
+                                      for stage, seconds in
+                                      self.stages.items())
+            }
+
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
@@ -15,8 +15,10 @@ NUXEO_S3_THUMB_URL_FORMAT = "https://s3.amazonaws.com/" \
 
 class NuxeoFetcher(Fetcher):
     '''Harvest a Nuxeo FILE. Can be local or at a URL'''
+    incremental = True
 
-    def __init__(self, url_harvest, extra_data, conf_pynux={}, **kwargs):
+    def __init__(self, url_harvest, extra_data, conf_pynux={},
+                 modified_since=None, **kwargs):
         '''
         uses pynux (https://github.com/ucldc/pynux) to grab objects from
         the Nuxeo API
@@ -26,6 +28,10 @@ class NuxeoFetcher(Fetcher):
 
         the pynux config file should have user & password
         and X-NXDocumemtProperties values filled in.
+
+        with modified_since, only the documents with a later dc:modified
+        are harvested. DeepHarvestNuxeo builds its own NXQL, so the
+        documents are filtered here, before the per document requests.
         '''
         super(NuxeoFetcher, self).__init__(url_harvest, extra_data, **kwargs)
         self._url = url_harvest
@@ -39,6 +45,18 @@ class NuxeoFetcher(Fetcher):
         self._dh = DeepHarvestNuxeo(self._path, '', conf_pynux=conf_pynux)
 
         self._children = iter(self._dh.fetch_objects())
+        if modified_since:
+            self._children = (
+                doc for doc in self._children
+                if self._modified_since(doc, modified_since[:19]))
+
+    @staticmethod
+    def _modified_since(doc, since):
+        '''True if the doc was modified at or after since, a
+        "YYYY-MM-DDThh:mm:ss" string, or its modification time is unknown'''
+        modified = doc.get('properties', {}).get('dc:modified') or \
+            doc.get('lastModified')
+        return not modified or modified[:19] >= since
 
     def _get_structmap_url(self, bucket, obj_key):
         '''Get structmap_url property for object'''
@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
-import urllib
-from collections import defaultdict
+import os
+from collections import defaultdict, deque
+from multiprocessing.pool import ThreadPool
 from xml.etree import ElementTree as ET
 import time
 import logbook
 import requests
 from requests.packages.urllib3.exceptions import DecodeError
+from requests.exceptions import ContentDecodingError
 from .fetcher import Fetcher
 
 CONTENT_SERVER = 'http://content.cdlib.org/'
+# pages of OAC_XML_Fetcher results fetched at once, 1 to fetch them in turn
+PAGE_THREADS = int(os.environ.get('HARVEST_OAC_PAGE_THREADS', 1))
+GROUPS = ('image', 'text')
 
 
 class BunchDict(dict):
@@ -21,12 +26,20 @@ class OAC_XML_Fetcher(Fetcher):
     '''Fetcher for the OAC
     The results are returned in 3 groups, image, text and website.
     Image and text are the ones we care about.
+    With page_threads > 1, the pages of the image & text groups are worked
+    out from the group totals of the first response & fetched that many
+    at a time. The objsets are still returned in page order.
     '''
 
-    def __init__(self, url_harvest, extra_data, docsPerPage=100, **kwargs):
+    def __init__(self, url_harvest, extra_data, docsPerPage=100,
+                 page_threads=PAGE_THREADS, **kwargs):
         super(OAC_XML_Fetcher, self).__init__(url_harvest, extra_data)
         self.logger = logbook.Logger('FetcherOACXML')
         self.docsPerPage = docsPerPage
+        self.page_threads = page_threads
+        self._page_pool = None
+        self._pages = None
+        self._pending = deque()
         self.url = self.url + '&docsPerPage=' + str(self.docsPerPage)
         self._url_current = self.url
         self.currentDoc = 0
@@ -145,39 +158,98 @@ class OAC_XML_Fetcher(Fetcher):
     def _get_next_result_set(self):
         '''get the next result set
         Return the facet element, only one were interested in'''
+        return self._get_result_set(self._url_current)
+
+    def _get_result_set(self, url):
+        '''Return the facet element of the results at url'''
         n_tries = 0
         pause = 5
         while True:
             try:
-                resp = urllib.urlopen(self._url_current)
+                xml = self.urlopen_read(url)
                 break
-            except DecodeError as e:
+            except (DecodeError, ContentDecodingError) as e:
                 n_tries += 1
                 if n_tries > 5:
                     raise e
+                self.metrics.record_retry()
                 # backoff
                 time.sleep(pause)
                 pause = pause * 2
         # resp.encoding = 'utf-8'  # thinks it's ISO-8859-1
-        crossQueryResult = ET.fromstring(resp.read())
+        crossQueryResult = ET.fromstring(xml)
         # crossQueryResult = ET.fromstring(resp.text.encode('utf-8'))
         return crossQueryResult.find('facet')
 
+    def _page_url(self, group, start):
+        return ''.join((self.url, '&startDoc=', str(start), '&group=', group))
+
+    def _page_plan(self):
+        '''The (group, startDoc) of the pages left to fetch, in order'''
+        pages = []
+        for group in GROUPS:
+            hitgroup = self.groups[group]
+            if not hitgroup.get('total'):
+                continue
+            pages.extend((group, start) for start in xrange(
+                hitgroup.currentDoc, hitgroup.total + 1, self.docsPerPage))
+        return pages
+
+    def _next_page(self):
+        '''Return the facet element of the next page in the plan, keeping
+        page_threads pages in flight'''
+        if self._pages is None:
+            self._pages = iter(self._page_plan())
+            self._page_pool = ThreadPool(self.page_threads)
+        while len(self._pending) < self.page_threads:
+            page = next(self._pages, None)
+            if page is None:
+                break
+            url = self._page_url(*page)
+            self._pending.append((page, url, self._page_pool.apply_async(
+                self._get_result_set, (url, ))))
+        if not self._pending:
+            self._close_pages()
+            raise StopIteration
+        (group, start), url, result = self._pending.popleft()
+        self.currentGroup = group
+        self._url_current = url
+        try:
+            return result.get()
+        except Exception:
+            self._close_pages()
+            raise
+
+    def _close_pages(self):
+        '''Stop fetching pages, the plan starts again from the groups'
+        currentDoc on the next call'''
+        if self._page_pool is not None:
+            self._page_pool.terminate()
+        self._page_pool = None
+        self._pages = None
+        self._pending.clear()
+
+    def close(self):
+        self._close_pages()
+
     def next(self):
         '''Get the next page of search results
         '''
-        if self.currentDoc >= self.totalDocs:
-            raise StopIteration
-        if self.currentGroup == 'image':
-            if self.groups['image']['end'] == self.groups['image']['total']:
-                self.currentGroup = 'text'
-                if self.groups['text']['total'] == 0:
-                    raise StopIteration
-        self._url_current = ''.join(
-            (self.url, '&startDoc=',
-             str(self.groups[self.currentGroup]['currentDoc']), '&group=',
-             self.currentGroup))
-        facet_type_tab = self._get_next_result_set()
+        if self.page_threads > 1:
+            facet_type_tab = self._next_page()
+        else:
+            if self.currentDoc >= self.totalDocs:
+                raise StopIteration
+            if self.currentGroup == 'image':
+                if self.groups['image']['end'] == \
+                        self.groups['image']['total']:
+                    self.currentGroup = 'text'
+                    if self.groups['text']['total'] == 0:
+                        raise StopIteration
+            self._url_current = self._page_url(
+                self.currentGroup,
+                self.groups[self.currentGroup]['currentDoc'])
+            facet_type_tab = self._get_next_result_set()
         self._update_groups(facet_type_tab.findall('group'))
         objset = self._docHits_to_objset(
             facet_type_tab.findall('./group/docHit'))
@@ -185,6 +257,22 @@ class OAC_XML_Fetcher(Fetcher):
         self.groups[self.currentGroup]['currentDoc'] += len(objset)
         return objset
 
+    def get_cursor(self):
+        '''The startDoc of the next page for each group'''
+        return {
+            'currentDoc': self.currentDoc,
+            'currentGroup': self.currentGroup,
+            'groups': dict((key, dict(hitgroup))
+                           for key, hitgroup in self.groups.items())
+        }
+
+    def set_cursor(self, cursor):
+        self._close_pages()
+        self.currentDoc = cursor['currentDoc']
+        self.currentGroup = cursor['currentGroup']
+        for key, hitgroup in cursor['groups'].items():
+            self.groups[key].update(hitgroup)
+
 
 class OAC_JSON_Fetcher(Fetcher):
     '''Fetcher for oac, using the JSON objset interface
@@ -195,7 +283,7 @@ class OAC_JSON_Fetcher(Fetcher):
         self.oac_findaid_ark = self._parse_oac_findaid_ark(self.url)
         self.headers = {'content-type': 'application/json'}
         self.objset_last = False
-        self.resp = requests.get(self.url, headers=self.headers)
+        self.resp = self.requests_get(self.url, headers=self.headers)
         api_resp = self.resp.json()
         # for key in api_resp.keys():
         #    self.__dict__[key] = api_resp[key]
@@ -230,7 +318,7 @@ class OAC_JSON_Fetcher(Fetcher):
                     raise StopIteration
             url_next = ''.join((self.url, '&startDoc=',
                                 unicode(self.objset_end + 1)))
-            self.resp = requests.get(url_next, headers=self.headers)
+            self.resp = self.requests_get(url_next, headers=self.headers)
             self.api_resp = self.resp.json()
             # self.objset_total = api_resp['objset_total']
             self.objset_start = self.api_resp['objset_start']
@@ -255,7 +343,7 @@ class OAC_JSON_Fetcher(Fetcher):
         else:
             url_next = ''.join((self.url, '&startDoc=',
                                 unicode(self.objset_end + 1)))
-            self.resp = requests.get(url_next, headers=self.headers)
+            self.resp = self.requests_get(url_next, headers=self.headers)
             self.api_resp = self.resp.json()
             self.objset_start = self.api_resp['objset_start']
             self.objset_end = self.api_resp['objset_end']
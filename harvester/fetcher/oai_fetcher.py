@@ -1,12 +1,56 @@
 # -*- coding: utf-8 -*-
-import re
-import tempfile
+import os
+import sys
+import time
+import datetime
+import threading
+import Queue
+import collections
+import multiprocessing
+import functools
 from urlparse import parse_qs
 from .fetcher import Fetcher
+from .http_session import retries, throttled
+from itertools import islice, chain
 from sickle import Sickle
+from sickle import oaiexceptions
+from sickle.iterator import OAIItemIterator
+from sickle.response import OAIResponse
 from sickle.models import Record as SickleDCRecord
-from pymarc import parse_xml_to_array
+from sickle.models import ResumptionToken, Header
+from sickle.utils import get_namespace
+from sickle.oaiexceptions import NoRecordsMatch, IdDoesNotExist
 from lxml import etree
+from .marcxml import records_to_dicts
+
+# ListRecords pages read ahead of the harvest, 0 to read them as needed
+PREFETCH_PAGES = int(os.environ.get('HARVEST_OAI_PREFETCH', 0))
+# records queued per page read ahead, a page with more waits for the
+# harvest to take them
+PREFETCH_PAGE_RECORDS = 1000
+# seconds a thread waits on a full queue before checking it's stopped
+QUEUE_TIMEOUT = 1
+# concurrent GetRecord requests of a harvest by identifier
+GET_RECORD_THREADS = int(os.environ.get('HARVEST_OAI_GET_RECORD_THREADS', 4))
+# processes to parse ListRecords records in, 0 to parse them in the harvest
+PARSE_PROCESSES = int(os.environ.get('HARVEST_OAI_PARSE_PROCESSES', 0))
+# records sent to a parse process at a time
+PARSE_CHUNK_SIZE = 20
+
+
+DIDL_NS = '{urn:mpeg:mpeg21:2002:02-DIDL-NS}'
+
+
+def put_until(queue, item, stopped):
+    '''Put the item on the bounded queue, waiting while it's full until
+    stopped() is True. False if stopped before the item was put'''
+    while not stopped():
+        try:
+            queue.put(item, timeout=QUEUE_TIMEOUT)
+            return True
+        except Queue.Full:
+            pass
+    return False
 
 
 def etree_to_dict(t):
@@ -15,14 +59,40 @@ def etree_to_dict(t):
     d['text'] = t.text
     return d
 
-class SickleMARCRecord(SickleDCRecord):
-    '''Extend the sickle Record to handle oai marc xml
-    using pymarc's parse_xml_to_array function.
 
-    parse_xml_to_array takes a file and returns an array
-    of all records in the file, but in this case it's
-    guaranteed to be just one record per file, because
-    Sickle is handling iterating through the oai feed.
+def didl_to_dict(didl):
+    '''Return the etree_to_dict of each DIDL element under the didl
+    element, by local name. Where a name repeats the last element in
+    document order wins.
+    Each element is converted once, the dict of an element holds the
+    dicts of its children rather than copies of them.
+    '''
+    metadata = {}
+
+    def convert(element):
+        children = []
+        d = {element.tag: children}
+        tag = element.tag
+        if element is not didl and isinstance(tag, basestring) and \
+                tag.startswith(DIDL_NS):
+            # set before the descendants, so a nested element of the same
+            # name replaces it, as in document order
+            metadata[tag[len(DIDL_NS):]] = d
+        children.extend(convert(child) for child in element.iterchildren())
+        d.update(('@' + k, v) for k, v in element.attrib.iteritems())
+        d['text'] = element.text
+        return d
+
+    convert(didl)
+    return metadata
+
+
+class SickleMARCRecord(SickleDCRecord):
+    '''Extend the sickle Record to handle oai marc xml.
+    The metadata is the pymarc Record.as_dict() of the MARC record,
+    converted from the parsed element with records_to_dicts.
+    There's just one MARC record per OAI record, Sickle is handling
+    iterating through the oai feed.
 
     SickleDCRecord definition:
     https://github.com/mloesch/sickle/blob/79d7c727af3a4437720116549d4c681e74799f7e/sickle/models.py#L120
@@ -31,14 +101,9 @@ class SickleMARCRecord(SickleDCRecord):
         super(SickleMARCRecord, self).__init__(
             record_element, strip_ns=strip_ns)
         if not self.deleted:
-            marc_file = tempfile.TemporaryFile()
             metadata = self.xml.find(
                 ".//" + self._oai_namespace + "metadata/")
-            marc_file.write(
-                etree.tostring(metadata, encoding='utf-8'))
-            marc_file.seek(0)
-            records = parse_xml_to_array(marc_file)
-            self.metadata = records[0].as_dict()
+            self.metadata = records_to_dicts(metadata)[0]
 
 class SickleDIDLRecord(SickleDCRecord):
     '''Extend the Sickle Record to handle oai didl xml.
@@ -59,30 +124,518 @@ class SickleDIDLRecord(SickleDCRecord):
             record_element, strip_ns=strip_ns)
         # need to grab the didl components here
         if not self.deleted:
-            didl = self.xml.find('.//{urn:mpeg:mpeg21:2002:02-DIDL-NS}DIDL')
-            didls = didl.findall('.//{urn:mpeg:mpeg21:2002:02-DIDL-NS}*')
-            for element in didls:
-                tag = re.sub(r'\{.*\}', '', element.tag)
-                self.metadata[tag] = etree_to_dict(element)
+            didl = self.xml.find('.//' + DIDL_NS + 'DIDL')
+            self.metadata.update(didl_to_dict(didl))
+
+
+class OAIClient(Sickle):
+    '''Sickle client that makes its requests with a requests session.
+    The session retries 503s, so Sickle's own retry loop isn't used.
+    If there's a fetcher, requests wait for its rate limit.
+    ListRecords pages are streamed, see OAIStreamIterator.
+    '''
+
+    def __init__(self, endpoint, session, fetcher=None, **kwargs):
+        super(OAIClient, self).__init__(endpoint, **kwargs)
+        self.session = session
+        self.fetcher = fetcher
+
+    def request(self, stream=False, **kwargs):
+        '''Make the OAI request, return the requests response'''
+        if self.fetcher:
+            self.fetcher.wait_for_host(self.endpoint)
+        if self.http_method == 'GET':
+            http_response = self.session.get(self.endpoint, params=kwargs,
+                                             stream=stream,
+                                             **self.request_args)
+        else:
+            http_response = self.session.post(self.endpoint, data=kwargs,
+                                              stream=stream,
+                                              **self.request_args)
+        if self.fetcher and throttled(http_response):
+            self.fetcher.rate_limiter.throttled(self.endpoint)
+        http_response.raise_for_status()
+        return http_response
+
+    def harvest(self, **kwargs):
+        http_response = self.request(**kwargs)
+        if self.encoding:
+            http_response.encoding = self.encoding
+        return OAIResponse(http_response, params=kwargs)
+
+    def ListRecords(self, ignore_deleted=False, **kwargs):
+        params = dict(kwargs, verb='ListRecords')
+        return OAIStreamIterator(self, params, ignore_deleted=ignore_deleted)
+
+
+class OAIPositionIterator(OAIItemIterator):
+    '''Sickle item iterator that tracks its position in the feed.
+    page_token is the resumptionToken used to request the current page (None
+    for the first page) & page_offset is the number of items of the page
+    already consumed, deleted records included.
+    '''
+
+    def __init__(self, sickle, params, ignore_deleted=False):
+        self.page_token = params.get('resumptionToken')
+        self.page_offset = 0
+        super(OAIPositionIterator, self).__init__(sickle, params,
+                                                  ignore_deleted)
+
+    def _next_response(self):
+        if self.resumption_token:
+            self.page_token = self.resumption_token.token
+        start = time.time()
+        super(OAIPositionIterator, self)._next_response()
+        metrics = getattr(self.sickle, 'metrics', None)
+        if metrics:
+            metrics.record_request(
+                time.time() - start, len(self.oai_response.raw),
+                retries=retries(self.oai_response.http_response))
+        self.page_offset = 0
+
+    def skip(self, n):
+        '''Skip over n items of the current page'''
+        for item in islice(self._items, n):
+            self.page_offset += 1
+
+    def next(self):
+        while True:
+            for item in self._items:
+                self.page_offset += 1
+                mapped = self.mapper(item)
+                if self.ignore_deleted and mapped.deleted:
+                    continue
+                return mapped
+            if self.resumption_token and self.resumption_token.token:
+                self._next_response()
+            else:
+                raise StopIteration
+
+
+class ResponseReader(object):
+    '''File like reader of a streamed requests response body, decoded if
+    gzipped. Counts the bytes read.'''
+
+    def __init__(self, http_response):
+        self.raw = http_response.raw
+        self.nbytes = 0
+
+    def read(self, n=-1):
+        data = self.raw.read(None if n < 0 else n, decode_content=True)
+        self.nbytes += len(data)
+        return data
+
+
+class OAIStreamIterator(OAIPositionIterator):
+    '''Iterate the records of ListRecords pages as they're parsed.
+    Each response is read through an incremental parser, a record is
+    yielded when its <record> element closes & freed when the next one is
+    requested, so memory is bounded by the size of a record, not the page.
+    The resumptionToken is at the end of the page, it's read once the
+    page's records are consumed.
+    The request time recorded for a page includes parsing it.
+    before_request is called before requesting the pages after the first.
+    '''
+    before_request = None
+
+    def _next_response(self):
+        params = self.params
+        if self.resumption_token:
+            if self.before_request:
+                self.before_request()
+            self.page_token = self.resumption_token.token
+            params = {
+                'resumptionToken': self.resumption_token.token,
+                'verb': self.verb
+            }
+        self.resumption_token = None
+        self.page_offset = 0
+        http_response = self.sickle.request(stream=True, **params)
+        items = self._iter_records(http_response, time.time())
+        # read up to the first record, so OAI errors raise here as they do
+        # for Sickle's iterators
+        first = next(items, None)
+        self._items = chain([first], items) if first is not None else items
+
+    def _iter_records(self, http_response, start):
+        ns = self.sickle.oai_namespace
+        reader = ResponseReader(http_response)
+        context = etree.iterparse(
+            reader,
+            events=('end', ),
+            tag=(ns + 'record', ns + 'resumptionToken', ns + 'error'),
+            remove_blank_text=True,
+            recover=True,
+            resolve_entities=False,
+            huge_tree=True)
+        previous = None
+        try:
+            for event, element in context:
+                if previous is not None:
+                    self._free(previous)
+                    previous = None
+                if element.tag == ns + 'record':
+                    previous = element
+                    yield element
+                elif element.tag == ns + 'resumptionToken':
+                    self.resumption_token = ResumptionToken(
+                        token=element.text,
+                        cursor=element.get('cursor'),
+                        complete_list_size=element.get('completeListSize'),
+                        expiration_date=element.get('expirationDate'))
+                else:
+                    raise self._oai_error(element)
+        finally:
+            http_response.close()
+        metrics = getattr(self.sickle, 'metrics', None)
+        if metrics:
+            metrics.record_request(time.time() - start, reader.nbytes,
+                                   retries=retries(http_response))
+
+    @staticmethod
+    def _free(element):
+        '''Clear the element & drop it & what came before from the tree'''
+        element.clear()
+        while element.getprevious() is not None:
+            del element.getparent()[0]
+
+    @staticmethod
+    def _oai_error(element):
+        code = element.get('code', 'UNKNOWN')
+        description = element.text or ''
+        return getattr(oaiexceptions, code[0].upper() + code[1:],
+                       oaiexceptions.OAIError)(description)
+
+
+class EmptyOAIIterator(object):
+    '''Stands in for an OAIPositionIterator when no records match'''
+    page_token = None
+    page_offset = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        raise StopIteration
+
+    def skip(self, n):
+        pass
+
+
+class PrefetchOAIIterator(object):
+    '''Read the records of an OAIStreamIterator on a background thread, up
+    to prefetch pages ahead of the harvest, so the next page is requested &
+    parsed while the records of the current one are processed.
+    page_token & page_offset are the position of the records returned.
+    The thread starts on the first next.
+    '''
+
+    def __init__(self, records, prefetch,
+                 page_records=PREFETCH_PAGE_RECORDS):
+        self.page_token = records.page_token
+        self.page_offset = records.page_offset
+        self._records = records
+        self._queue = Queue.Queue(maxsize=prefetch * page_records)
+        self._closed = False
+        # a page is released once its records are all returned
+        self._pages = threading.Semaphore(prefetch)
+        records.before_request = self._pages.acquire
+        self._thread = None
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._read_records,
+                                        name='oai-prefetch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _put(self, item):
+        return put_until(self._queue, item, lambda: self._closed)
+
+    def _read_records(self):
+        records = self._records
+        try:
+            for record in records:
+                if not self._put(
+                        (record, records.page_token, records.page_offset)):
+                    return
+        except Exception:
+            # no record, the error
+            self._put((None, sys.exc_info(), None))
+        finally:
+            self._put(None)
+
+    def close(self):
+        '''Stop reading ahead'''
+        self._closed = True
+        self._pages.release()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._closed:
+            raise StopIteration
+        if self._thread is None:
+            self._start()
+        item = self._queue.get()
+        if item is None:
+            self._closed = True
+            raise StopIteration
+        record, page_token, page_offset = item
+        if record is None:
+            self._closed = True
+            exc_type, exc_value, exc_tb = page_token
+            raise exc_type, exc_value, exc_tb
+        self.page_offset = page_offset
+        if page_token != self.page_token:
+            self.page_token = page_token
+            self._pages.release()
+        return record
+
+
+class RawOAIRecord(object):
+    '''Stands in for a Sickle record that's parsed in another process. Has
+    the header & the serialized record, the metadata is set once parsed.
+    '''
+    metadata = None
+
+    def __init__(self, record_element):
+        self.header = Header(record_element.find(
+            './/' + get_namespace(record_element) + 'header'))
+        self.deleted = self.header.deleted
+        self.xml = etree.tostring(record_element, encoding='utf-8')
+
+
+def parse_record(task):
+    '''Process pool target, return the metadata of a serialized record
+    parsed with the record class'''
+    record_class, xml = task
+    return record_class(etree.fromstring(xml)).metadata
+
+
+class ParsedOAIIterator(object):
+    '''Parse the records of an OAIStreamIterator (or a PrefetchOAIIterator
+    of one) that maps them to RawOAIRecords, with record_class in the
+    fetcher's process pool. The records are read in chunks, up to two
+    chunks per process are parsed at a time & the records are returned in
+    order, with their position in the feed.
+    '''
+
+    def __init__(self, records, record_class, fetcher,
+                 chunk_size=PARSE_CHUNK_SIZE):
+        self.page_token = records.page_token
+        self.page_offset = records.page_offset
+        self._record_class = record_class
+        self._records = records
+        self._fetcher = fetcher
+        self.chunk_size = chunk_size
+        self._pending = collections.deque()
+        self._parsed = iter(())
+        self._exhausted = False
+
+    def _read_chunk(self):
+        '''The next records of the feed & their positions'''
+        chunk = []
+        for record in islice(self._records, self.chunk_size):
+            chunk.append((record, self._records.page_token,
+                          self._records.page_offset))
+        if len(chunk) < self.chunk_size:
+            self._exhausted = True
+        return chunk
+
+    def _submit(self):
+        '''Send chunks to the pool until enough are being parsed'''
+        pool = self._fetcher.parse_pool
+        while not self._exhausted and \
+                len(self._pending) < 2 * self._fetcher.parse_processes:
+            chunk = self._read_chunk()
+            if not chunk:
+                break
+            tasks = [(self._record_class, record.xml)
+                     for record, page_token, page_offset in chunk
+                     if not record.deleted]
+            self._pending.append((chunk, pool.map_async(parse_record, tasks)))
+
+    def close(self):
+        '''Stop reading the feed'''
+        self._exhausted = True
+        self._pending.clear()
+        if hasattr(self._records, 'close'):
+            self._records.close()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        while True:
+            for record, page_token, page_offset in self._parsed:
+                self.page_token = page_token
+                self.page_offset = page_offset
+                return record
+            self._submit()
+            if not self._pending:
+                raise StopIteration
+            chunk, result = self._pending.popleft()
+            metadata = iter(result.get())
+            for record, page_token, page_offset in chunk:
+                if not record.deleted:
+                    record.metadata = next(metadata)
+            self._parsed = iter(chunk)
+
+
+class PartitionedOAIIterator(object):
+    '''Harvest ListRecords partitions concurrently, each partition is the
+    params of a ListRecords request. Records are returned as they come
+    from the partitions, once for each header identifier: a record modified
+    during the harvest can be in two partitions.
+    partitions is the list of params or a function returning it. The
+    threads start on the first next, so a fetcher that is created & not
+    iterated makes no requests. They stop once closed or after an error.
+    '''
+
+    def __init__(self, fetcher, partitions, n_threads, queue_size=1000):
+        self.page_token = None
+        self.page_offset = 0
+        self._fetcher = fetcher
+        self._partition_list = partitions
+        self._partitions = Queue.Queue()
+        self._n_threads = n_threads
+        self._records = Queue.Queue(maxsize=queue_size)
+        self._seen = set()
+        self._threads = []
+        self._running = 0
+        self._started = False
+        self._closed = False
+
+    def _start(self):
+        '''Queue the partitions & start the threads'''
+        self._started = True
+        partitions = self._partition_list
+        if callable(partitions):
+            partitions = partitions()
+        for params in partitions:
+            self._partitions.put(params)
+        for i in range(min(self._n_threads, len(partitions))):
+            t = threading.Thread(target=self._harvest_partitions,
+                                 name='oai-partition-{}'.format(i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        self._running = len(self._threads)
+
+    def partition_records(self, params):
+        '''The records of a partition'''
+        return self._fetcher.list_records(**params)
+
+    def _put(self, item):
+        return put_until(self._records, item, lambda: self._closed)
+
+    def _harvest_partitions(self):
+        '''Thread target, harvest partitions until there are none left or
+        closed. The records, an error or None when done are put on the
+        records queue'''
+        try:
+            while not self._closed:
+                try:
+                    params = self._partitions.get_nowait()
+                except Queue.Empty:
+                    break
+                for record in self.partition_records(params):
+                    if not self._put(record):
+                        return
+        except Exception:
+            self._put(sys.exc_info())
+        finally:
+            self._put(None)
+
+    def close(self):
+        '''Stop the threads, they finish the request they're making'''
+        self._closed = True
+        self._running = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._closed:
+            raise StopIteration
+        if not self._started:
+            self._start()
+        while self._running:
+            item = self._records.get()
+            if item is None:
+                self._running -= 1
+            elif isinstance(item, tuple):
+                # the other threads stop too
+                self.close()
+                exc_type, exc_value, exc_tb = item
+                raise exc_type, exc_value, exc_tb
+            elif item.header.identifier not in self._seen:
+                self._seen.add(item.header.identifier)
+                return item
+        raise StopIteration
+
+
+class GetRecordOAIIterator(PartitionedOAIIterator):
+    '''GetRecord the identifiers concurrently, in no particular order.
+    An identifier the repository doesn't have is logged & skipped. Closing
+    it stops the threads, the identifiers left aren't requested.
+    '''
+
+    def partition_records(self, identifier):
+        try:
+            return [self._fetcher.get_record(identifier)]
+        except IdDoesNotExist:
+            self._fetcher.logger.warning(
+                'OAI identifier {} does not exist'.format(identifier))
+            return []
 
 
 class OAIFetcher(Fetcher):
-    '''Fetcher for oai'''
+    '''Fetcher for oai. With modified_since, records are harvested from
+    that day on, the day granularity is supported by all repositories.
+    With partitions > 1 the datestamps from the repository's
+    earliestDatestamp (or modified_since) to now are split into that many
+    ranges, for each set in extra_data, & the ranges are harvested
+    concurrently. A partitioned harvest has no cursor.
+    With identifiers, just those records are harvested, with concurrent
+    GetRecord requests. The sets, modified_since & partitions don't apply
+    & there's no cursor.
+    With parse_processes, the records of a ListRecords harvest (not
+    partitioned or by identifier) are parsed in a pool of that many
+    processes, for the CPU bound DIDL & MARC records.
+    '''
+    incremental = True
+    partitioned = True
+    cache_formats = True
+    targeted = True
 
-    def __init__(self, url_harvest, extra_data, **kwargs):
+    def __init__(self, url_harvest, extra_data, modified_since=None,
+                 partitions=None, prefetch=PREFETCH_PAGES, format_cache=None,
+                 identifiers=None, get_record_threads=GET_RECORD_THREADS,
+                 parse_processes=PARSE_PROCESSES, **kwargs):
         super(OAIFetcher, self).__init__(url_harvest, extra_data, **kwargs)
         # TODO: check extra_data?
-        self.oai_client = Sickle(self.url)
+        self.oai_client = OAIClient(self.url, self.session, fetcher=self,
+                                    iterator=OAIPositionIterator)
+        self.oai_client.metrics = self.metrics
+        self.prefetch = prefetch
+        self.parse_processes = parse_processes
+        self._parse_pool = None
+        self.format_cache = format_cache
         self._metadataPrefix = self.get_metadataPrefix(extra_data)
         # ensure not cached in module?
         self.oai_client.class_mapping['ListRecords'] = SickleDCRecord
         self.oai_client.class_mapping['GetRecord'] = SickleDCRecord
+        self._sets = []
         if extra_data:  # extra data is set spec
             if 'set' in extra_data:
                 params = parse_qs(extra_data)
+                self._sets = params['set']
                 self._set = params['set'][0]
             else:
                 self._set = extra_data
+                self._sets = [self._set]
             # if metadataPrefix=didl, use didlRecord for parsing
             if self._metadataPrefix.lower() == 'didl':
                 self.oai_client.class_mapping['ListRecords'] = SickleDIDLRecord
@@ -90,29 +643,132 @@ class OAIFetcher(Fetcher):
             elif self._metadataPrefix.lower() == 'marcxml':
                 self.oai_client.class_mapping['ListRecords'] = SickleMARCRecord
                 self.oai_client.class_mapping['GetRecord'] = SickleMARCRecord
-            self.records = self.oai_client.ListRecords(
-                metadataPrefix=self._metadataPrefix,
-                set=self._set,
-                ignore_deleted=True)
+            self._list_params = dict(
+                metadataPrefix=self._metadataPrefix, set=self._set)
         else:
-            self.records = self.oai_client.ListRecords(
-                metadataPrefix=self._metadataPrefix, ignore_deleted=True)
+            self._list_params = dict(metadataPrefix=self._metadataPrefix)
+        if modified_since:
+            self._list_params['from'] = modified_since[:10]
+        self.partitions = partitions
+        self.identifiers = identifiers
+        if identifiers:
+            self.records = GetRecordOAIIterator(self, identifiers,
+                                                get_record_threads)
+        elif partitions > 1:
+            self.records = PartitionedOAIIterator(
+                self, functools.partial(self.get_partitions, partitions),
+                partitions)
+        else:
+            self.records = self.read_ahead(
+                self.list_records(**self._list_params))
+
+    def read_ahead(self, records):
+        '''Prefetch the pages of the records iterator & parse its records
+        in the process pool if set to'''
+        if not isinstance(records, OAIStreamIterator):
+            return records
+        record_class = records.mapper
+        if self.parse_processes:
+            # before the prefetch thread starts mapping records
+            records.mapper = RawOAIRecord
+        if self.prefetch:
+            records = PrefetchOAIIterator(records, self.prefetch)
+        if self.parse_processes:
+            records = ParsedOAIIterator(records, record_class, self)
+        return records
+
+    @property
+    def parse_pool(self):
+        '''The process pool records are parsed in, created on first use'''
+        if self._parse_pool is None:
+            self._parse_pool = multiprocessing.Pool(self.parse_processes)
+        return self._parse_pool
+
+    def close_parse_pool(self):
+        if self._parse_pool is not None:
+            self._parse_pool.terminate()
+            self._parse_pool = None
+
+    def close(self):
+        if isinstance(self.records,
+                      (PrefetchOAIIterator, ParsedOAIIterator,
+                       PartitionedOAIIterator)):
+            self.records.close()
+        self.close_parse_pool()
+
+    def list_records(self, **params):
+        '''Return the ListRecords iterator. An incremental harvest with no
+        changes or a partition with no records gets a noRecordsMatch
+        error, that's an empty iterator'''
+        try:
+            return self.oai_client.ListRecords(ignore_deleted=True, **params)
+        except NoRecordsMatch:
+            if 'from' not in params:
+                raise
+            return EmptyOAIIterator()
+
+    def get_record(self, identifier):
+        return self.oai_client.GetRecord(identifier=identifier,
+                                         metadataPrefix=self._metadataPrefix)
+
+    def get_partitions(self, n):
+        '''Return the ListRecords params for n datestamp ranges for each
+        set. The ranges are whole days, from & until are inclusive. The last
+        range is open ended.
+        '''
+        start = self._list_params.get('from')
+        if not start:
+            start = self.oai_client.Identify().earliestDatestamp
+        try:
+            start = datetime.datetime.strptime(start[:10], '%Y-%m-%d').date()
+        except (TypeError, ValueError):
+            # no usable datestamp, harvest each set whole
+            start = None
+        ranges = [(None, None)]
+        if start:
+            days = (datetime.datetime.utcnow().date() - start).days + 1
+            n = max(1, min(n, days))
+            bounds = [start + datetime.timedelta(days=days * i // n)
+                      for i in range(n)]
+            ranges = [
+                (bound, bounds[i + 1] - datetime.timedelta(days=1)
+                 if i + 1 < n else None)
+                for i, bound in enumerate(bounds)]
+        partitions = []
+        for set_spec in self._sets or [None]:
+            for range_from, range_until in ranges:
+                params = dict(self._list_params)
+                if set_spec:
+                    params['set'] = set_spec
+                if range_from:
+                    params['from'] = range_from.isoformat()
+                if range_until:
+                    params['until'] = range_until.isoformat()
+                partitions.append(params)
+        return partitions
 
     def get_metadataPrefix(self, extra_data):
         '''Set the metadata format for the feed.
         If it is in extra_data, use that.
         Else, see if oai_qdc is supported, if so use that.
         Else, revert to oai_dc
+        The formats the endpoint supports are kept in the format_cache.
         '''
         if extra_data:
             if 'metadataPrefix' in extra_data:
                 params = parse_qs(extra_data)
                 return params['metadataPrefix'][0]
 
-        mdformats = [x for x in self.oai_client.ListMetadataFormats()]
-        for f in mdformats:
-            if f.metadataPrefix == 'oai_qdc':
-                return 'oai_qdc'
+        prefixes = None
+        if self.format_cache:
+            prefixes = self.format_cache.get(self.url)
+        if prefixes is None:
+            prefixes = [f.metadataPrefix for f in
+                        self.oai_client.ListMetadataFormats()]
+            if self.format_cache:
+                self.format_cache.set(self.url, prefixes)
+        if 'oai_qdc' in prefixes:
+            return 'oai_qdc'
         return 'oai_dc'
 
     def next(self):
@@ -124,7 +780,11 @@ class OAIFetcher(Fetcher):
         collection name
         '''
         while True:
-            sickle_rec = self.records.next()
+            try:
+                sickle_rec = self.records.next()
+            except StopIteration:
+                self.close_parse_pool()
+                raise
             if not sickle_rec.deleted:
                 break  # good record to harvest, don't do deleted
                 # update process looks for deletions
@@ -133,6 +793,29 @@ class OAIFetcher(Fetcher):
         rec['id'] = sickle_rec.header.identifier
         return rec
 
+    def get_cursor(self):
+        if self.partitions > 1 or self.identifiers:
+            return None
+        return {
+            'resumptionToken': self.records.page_token,
+            'offset': self.records.page_offset
+        }
+
+    def set_cursor(self, cursor):
+        '''Re-request the page the cursor is in & skip the records already
+        harvested from it'''
+        if isinstance(self.records,
+                      (PrefetchOAIIterator, ParsedOAIIterator)):
+            self.records.close()
+        if cursor['resumptionToken']:
+            records = self.oai_client.ListRecords(
+                resumptionToken=cursor['resumptionToken'],
+                ignore_deleted=True)
+        else:
+            records = self.list_records(**self._list_params)
+        records.skip(cursor['offset'])
+        self.records = self.read_ahead(records)
+
 
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import requests
 import json
 from requests.auth import HTTPBasicAuth
 from xml.etree import ElementTree as ET
@@ -13,6 +12,9 @@ class PreservicaFetcher(Fetcher):
     https://developers.preservica.com/blog/api-versioning-in-preservica-6-2
     '''
 
+    url_API_base = \
+        'https://us.preservica.com/api/entity/v6.0/structural-objects'
+
     def __init__(self, url_harvest, extra_data, **kwargs):
         super(PreservicaFetcher, self).__init__(url_harvest, extra_data)
         # parse extra data for username, password
@@ -20,8 +22,8 @@ class PreservicaFetcher(Fetcher):
         # build API Collection URL from url_harvest
         urlOne, urlTwo = url_harvest.split('SO_')
         collectionID = urlTwo.replace('/','')
-        self.url_API = '/'.join(('https://us.preservica.com/api/entity/v6.0/structural-objects',
-                            collectionID, 'children'))
+        self.url_API = '/'.join((self.url_API_base, collectionID,
+                                 'children'))
         self.doc_total = 0
         self.doc_current = 0
 
@@ -31,8 +33,8 @@ class PreservicaFetcher(Fetcher):
         for d in docHits:
             # need to descend two layers in API for object metadata
             url_object = d.text
-            obj_resp = requests.get(url_object,
-                                auth=HTTPBasicAuth(self.uname.strip(), self.pswd.strip()))
+            obj_resp = self.requests_get(url_object,
+                                         auth=HTTPBasicAuth(self.uname.strip(), self.pswd.strip()))
             objTree = ET.fromstring(obj_resp.content)
             for mdataRef in objTree.findall('{http://preservica.com/EntityAPI/v6.0}'
                                             'AdditionalInformation/{http://preservica.com/'
@@ -40,8 +42,8 @@ class PreservicaFetcher(Fetcher):
                                             'EntityAPI/v6.0}Fragment[@schema="http://www.open'
                                             'archives.org/OAI/2.0/oai_dc/"]'):
                 url_mdata = mdataRef.text
-            mdata_resp = requests.get(url_mdata,
-                                auth=HTTPBasicAuth(self.uname.strip(), self.pswd.strip()))
+            mdata_resp = self.requests_get(url_mdata,
+                                           auth=HTTPBasicAuth(self.uname.strip(), self.pswd.strip()))
             mdataTree = ET.fromstring(mdata_resp.content)
             object = [
                 # strip namespace from JSON
@@ -61,7 +63,7 @@ class PreservicaFetcher(Fetcher):
         return objset
 
     def next(self):
-        resp = requests.get(self.url_API,
+        resp = self.requests_get(self.url_API,
             auth=HTTPBasicAuth(self.uname.strip(), self.pswd.strip()))
         tree = ET.fromstring(resp.content)
         TotalResults = tree.find('{http://preservica.com/EntityAPI/v6.0}'
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+import importlib
+from collections import Mapping
+
+
+class FetcherRegistry(Mapping):
+    '''Map harvest types to fetcher classes, importing a fetcher's module
+    the first time its harvest type is looked up.
+    The fetcher modules pull in the libraries for their sources (sickle,
+    pysolr, pymarc, extruct, pynux...), a worker should only pay for the
+    ones it harvests with.
+    fetchers is a dict of harvest type -> "module.ClassName", the module
+    relative to package.
+    '''
+
+    def __init__(self, fetchers, package=__name__.rsplit('.', 1)[0]):
+        self._paths = dict(fetchers)
+        self._package = package
+        self._classes = {}
+
+    def __getitem__(self, harvest_type):
+        try:
+            return self._classes[harvest_type]
+        except KeyError:
+            pass
+        module_name, cls_name = self._paths[harvest_type].rsplit('.', 1)
+        module = importlib.import_module('.' + module_name, self._package)
+        cls = self._classes[harvest_type] = getattr(module, cls_name)
+        return cls
+
+    def __contains__(self, harvest_type):
+        return harvest_type in self._paths
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self):
+        return len(self._paths)
+
+
+# Copyright © 2016, Regents of the University of California
+# All rights reserved.
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions are met:
+# - Redistributions of source code must retain the above copyright notice,
+#   this list of conditions and the following disclaimer.
+# - Redistributions in binary form must reproduce the above copyright notice,
+#   this list of conditions and the following disclaimer in the documentation
+#   and/or other materials provided with the distribution.
+# - Neither the name of the University of California nor the names of its
+#   contributors may be used to endorse or promote products derived from this
+#   software without specific prior written permission.
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS"
+# AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE
+# IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE
+# ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER OR CONTRIBUTORS BE
+# LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR
+# CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF
+# SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS
+# INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN
+# CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE)
+# ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE
+# POSSIBILITY OF SUCH DAMAGE.
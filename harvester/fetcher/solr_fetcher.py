@@ -1,17 +1,427 @@
 # -*- coding: utf-8 -*-
+import os
+import re
+import sys
+import json
+import Queue
+import functools
+import threading
+import requests
 import solr
 import pysolr
 from .fetcher import Fetcher
+import urllib
 import urlparse
-import requests
+from itertools import islice, chain
+
+# cursorMark pages to request ahead of the harvest, 0 to request each page
+# when the harvest gets to it
+PREFETCH_PAGES = int(os.environ.get('HARVEST_SOLR_PREFETCH', 0))
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = re.compile(r'\s*')
+
+
+def modified_since_fq(fetcher, modified_since, field):
+    '''Return the filter query for the docs modified since the UTC time.
+    field is the modified_field of the extra data, schemas don't agree on
+    one. Without it the fetcher can't harvest incrementally, returns None
+    & the harvest is a full harvest.
+    '''
+    if not modified_since:
+        return None
+    if not field:
+        fetcher.logger.warning('No modified_field in the extra data, '
+                               'harvesting all the docs')
+        fetcher.incremental = False
+        return None
+    return '{}:[{} TO *]'.format(field, modified_since)
+
+
+class JSONStream(object):
+    '''Decode JSON from an iterator of chunks of it, a value at a time, so
+    only the value being decoded is buffered, not the whole document.
+    '''
+    decoder = json.JSONDecoder()
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def _read(self, size=1):
+        '''Read chunks until size characters past the position are
+        buffered, False if there was nothing left to read'''
+        chunks = [self._buf[self._pos:]]
+        buffered = len(chunks[0])
+        for chunk in self._chunks:
+            chunks.append(chunk)
+            buffered += len(chunk)
+            if buffered >= size:
+                break
+        else:
+            self._eof = True
+        if len(chunks) == 1 or buffered == len(chunks[0]):
+            return False
+        self._buf = ''.join(chunks)
+        self._pos = 0
+        return True
+
+    def peek(self):
+        '''The next character that isn't whitespace'''
+        while True:
+            self._pos = WHITESPACE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._read():
+                raise ValueError('Unexpected end of JSON')
+
+    def expect(self, chars):
+        '''Consume the next character, one of chars'''
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected {} at {!r}'.format(
+                ' or '.join(chars), self._buf[self._pos:self._pos + 20]))
+        self._pos += 1
+        return char
+
+    def value(self):
+        '''Decode the next value'''
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self._buf, self._pos)
+            except ValueError:
+                # the value isn't all read yet, double what's buffered of it
+                # so a large value isn't decoded again for every chunk
+                if not self._read(2 * (len(self._buf) - self._pos) + 1):
+                    raise
+                continue
+            # a number at the end of the buffer may go on in the next chunk
+            if end < len(self._buf) or self._eof or not self._read():
+                self._pos = end
+                return value
+
+    def keys(self):
+        '''Iterate over the keys of the next object, the caller reads the
+        value of each key before getting the next one'''
+        self.expect('{')
+        if self.peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self.expect(',}') == '}':
+                return
+
+    def items(self):
+        '''Iterate over the values of the next array'''
+        self.expect('[')
+        if self.peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+
+def iter_solr_docs(chunks, results):
+    '''Iterate over the docs of a Solr JSON response read in chunks, as
+    they're decoded. The rest of the response is put in results, with an
+    empty docs list'''
+    stream = JSONStream(chunks)
+    for key in stream.keys():
+        if key != 'response' or stream.peek() != '{':
+            results[key] = stream.value()
+            continue
+        response = results[key] = {}
+        for name in stream.keys():
+            if name == 'docs' and stream.peek() == '[':
+                response[name] = []
+                for doc in stream.items():
+                    yield doc
+            else:
+                response[name] = stream.value()
+
+
+def decode_solr_response(chunks):
+    '''Decode a Solr JSON response read in chunks, a doc at a time'''
+    results = {}
+    docs = list(iter_solr_docs(chunks, results))
+    if 'docs' in results.get('response', {}):
+        results['response']['docs'] = docs
+    return results
+
+
+def response_chunks(resp, metrics):
+    '''The body of a stream=True response as it's read, its bytes are
+    recorded in the fetcher metrics'''
+    try:
+        for chunk in resp.iter_content(CHUNK_SIZE):
+            metrics.record_bytes(len(chunk))
+            yield chunk
+    finally:
+        resp.close()
+
+
+def stream_solr_response(resp, metrics):
+    '''Decode the body of a stream=True response as it's read'''
+    return decode_solr_response(response_chunks(resp, metrics))
+
+
+def export_docs(resp, metrics):
+    '''Iterate over the docs of a stream=True response from the /export
+    handler as they're read. Returns the response without its docs & the
+    docs iterator. Raises SolrError if Solr couldn't start the export, eg.
+    there's no /export handler or the sort & fl fields have no docValues.
+    '''
+    if resp.status_code != 200:
+        resp.close()
+        raise pysolr.SolrError('Export failed with HTTP status {}'.format(
+            resp.status_code))
+    results = {}
+    docs = iter_solr_docs(response_chunks(resp, metrics), results)
+    first = next(docs, None)
+    status = results.get('responseHeader', {}).get('status', 0)
+    if status or 'response' not in results or \
+            (first and 'EXCEPTION' in first):
+        resp.close()
+        raise pysolr.SolrError('Export failed with status {}: {}'.format(
+            status, first.get('EXCEPTION') if first else None))
+    return results, _checked_export_docs(first, docs)
+
+
+def _checked_export_docs(first, docs):
+    # export errors after the response has started come as a doc
+    if first is None:
+        return
+    for doc in chain((first, ), docs):
+        if 'EXCEPTION' in doc:
+            raise pysolr.SolrError('Export failed: {}'.format(
+                doc['EXCEPTION']))
+        yield doc
+
+
+def sort_field(sort):
+    '''The field of the first clause of a sort, "id asc" -> "id"'''
+    return sort.split(',')[0].split()[0]
+
+
+def quote_term(value):
+    '''Quote a value for a range query'''
+    return u'"{}"'.format(
+        unicode(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def quote_param(value):
+    '''URL encode a query param value, the range bounds are sort field
+    values & may have &, +, # or %'''
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    return urllib.quote(value, safe='')
+
+
+def range_filters(field, bounds):
+    '''The filter queries for the ranges of field values between the
+    bounds, from the first value to the last. Each bound starts a range.
+    The docs without the field are in no range, the last filter is for
+    them'''
+    bounds = [quote_term(bound) for bound in sorted(set(bounds))]
+    lows = ['*'] + bounds
+    highs = bounds + ['*']
+    return [u''.join((field, ':[', low, ' TO ', high,
+                      '}' if high != '*' else ']'))
+            for low, high in zip(lows, highs)] + \
+        [u''.join(('-', field, ':[* TO *]'))]
+
+
+def partition_filters(field, num_found, partitions, value_at):
+    '''Split the docs sorted on field into partitions ranges of about the
+    same number of docs. value_at(offset) is the field value of the doc at
+    offset in the sort order. Returns the filter query for each range & one
+    for the docs without the field, they're disjoint & cover all the docs.
+    '''
+    bounds = []
+    for i in range(1, partitions):
+        value = value_at(num_found * i // partitions)
+        if value is not None:
+            bounds.append(value)
+    return range_filters(field, bounds)
+
+
+def truthy(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def listify(value):
+    return value if isinstance(value, list) else [value]
+
+
+def iter_cursor_pages(get_page, cursorMark='*'):
+    '''Request the pages of a Solr query one after another from the
+    cursorMark, get_page(cursorMark) returns the decoded page. Iterates over
+    (cursorMark, page) tuples until the nextCursorMark of a page is its
+    cursorMark or it has no docs.
+    '''
+    while True:
+        page = get_page(cursorMark)
+        yield cursorMark, page
+        nextCursorMark = page.get('nextCursorMark')
+        # solr returns the same cursorMark once there are no more
+        if (nextCursorMark and nextCursorMark == cursorMark) or \
+                not page.get('response', {}).get('docs'):
+            return
+        cursorMark = nextCursorMark
+
+
+class PrefetchSolrPages(object):
+    '''Request the (cursorMark, page) pages from iter_cursor_pages on a
+    background thread, up to prefetch pages ahead of the harvest, so the
+    next page is downloaded & decoded while the docs of the current one are
+    saved. The harvest closes it if it stops before the last page.
+    '''
+
+    def __init__(self, pages, prefetch):
+        self._queue = Queue.Queue()
+        self._closed = False
+        # a page is released once the harvest takes it
+        self._pages = threading.Semaphore(prefetch)
+        self._thread = threading.Thread(target=self._read_pages,
+                                        args=(pages, ),
+                                        name='solr-prefetch')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _read_pages(self, pages):
+        try:
+            while True:
+                self._pages.acquire()
+                if self._closed:
+                    return
+                cursorMark, page = next(pages, (None, None))
+                if page is None:
+                    return
+                self._queue.put((cursorMark, page, None))
+        except Exception:
+            # no page, the error
+            self._queue.put((None, None, sys.exc_info()))
+        finally:
+            self._queue.put(None)
+
+    def close(self):
+        '''Stop requesting pages'''
+        self._closed = True
+        self._pages.release()
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if self._closed:
+            raise StopIteration
+        item = self._queue.get()
+        if item is None:
+            self._closed = True
+            raise StopIteration
+        cursorMark, page, exc_info = item
+        if exc_info:
+            self._closed = True
+            exc_type, exc_value, exc_tb = exc_info
+            raise exc_type, exc_value, exc_tb
+        self._pages.release()
+        return cursorMark, page
+
+
+class PartitionedSolrIterator(object):
+    '''Harvest the partitions of a Solr query concurrently.
+    partition_items(fq) iterates over the items of the partition with the
+    filter query fq. Items are returned as they come from the partitions,
+    which are disjoint so each doc comes once. The threads start on the
+    first next.
+    '''
+
+    def __init__(self, partition_items, filters, n_threads, queue_size=100):
+        self._partition_items = partition_items
+        self._filters = Queue.Queue()
+        for fq in filters:
+            self._filters.put(fq)
+        self._n_threads = min(n_threads, len(filters))
+        self._items = Queue.Queue(maxsize=queue_size)
+        self._threads = []
+        self._running = 0
+        self._started = False
+
+    def _start(self):
+        self._started = True
+        for i in range(self._n_threads):
+            t = threading.Thread(target=self._harvest_partitions,
+                                 name='solr-partition-{}'.format(i))
+            t.daemon = True
+            t.start()
+            self._threads.append(t)
+        self._running = len(self._threads)
+
+    def _harvest_partitions(self):
+        '''Thread target, harvest partitions until there are none left. The
+        items, an error or None when done are put on the items queue'''
+        try:
+            while True:
+                try:
+                    fq = self._filters.get_nowait()
+                except Queue.Empty:
+                    break
+                for item in self._partition_items(fq):
+                    self._items.put((item, None))
+        except Exception:
+            self._items.put((None, sys.exc_info()))
+        finally:
+            self._items.put(None)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        if not self._started:
+            self._start()
+        while self._running:
+            item = self._items.get()
+            if item is None:
+                self._running -= 1
+                continue
+            item, exc_info = item
+            if exc_info:
+                self._running = 0
+                exc_type, exc_value, exc_tb = exc_info
+                raise exc_type, exc_value, exc_tb
+            return item
+        raise StopIteration
 
 
 class SolrFetcher(Fetcher):
-    def __init__(self, url_harvest, query, **query_params):
+    '''Fetch the docs of a query. The query can be a query string,
+    q=<query>&modified_field=<field>, to give the field incremental
+    harvests filter on.
+    '''
+    incremental = True
+
+    def __init__(self, url_harvest, query, modified_since=None,
+                 **query_params):
         super(SolrFetcher, self).__init__(url_harvest, query)
         self.solr = solr.Solr(url_harvest)  # , debug=True)
         self.query = query
-        self.resp = self.solr.select(self.query)
+        modified_field = None
+        extra_params = urlparse.parse_qs(query)
+        if 'q' in extra_params:
+            self.query = extra_params['q'][0]
+            modified_field = extra_params.get('modified_field', [None])[0]
+        fq = modified_since_fq(self, modified_since, modified_field)
+        if fq:
+            self.resp = self.solr.select(self.query, fq=fq)
+        else:
+            self.resp = self.solr.select(self.query)
         self.numFound = self.resp.numFound
         self.index = 0
 
@@ -27,14 +437,42 @@ class SolrFetcher(Fetcher):
 
 
 class PySolrFetcher(Fetcher):
+    '''Fetch the docs of a query with cursorMark pages.
+    The query can be a query string, q=<query>&fl=<fields>&export=true, for
+    the other params of the query. modified_field=<field> is the field
+    incremental harvests filter on.
+    With export, the docs are streamed from the /export handler in one
+    response, if Solr can export them: the fl & sort fields need docValues.
+    Otherwise, with partitions > 1, the query is split into that many
+    ranges of the sort field & the ranges are harvested concurrently.
+    Exported & partitioned harvests have no cursor.
+    '''
+    incremental = True
+    partitioned = True
+
     def __init__(self,
                  url_harvest,
                  query,
                  handler_path='select',
+                 modified_since=None,
+                 prefetch=PREFETCH_PAGES,
+                 partitions=0,
+                 export=False,
                  **query_params):
         super(PySolrFetcher, self).__init__(url_harvest, query, **query_params)
         self.solr = pysolr.Solr(url_harvest, timeout=1)
+        self.solr.session = self.session
         self._handler_path = handler_path
+        self.prefetch = prefetch
+        self._pages = None
+        extra_params = urlparse.parse_qs(query)
+        if 'q' in extra_params:
+            export = export or truthy(extra_params.pop('export', [''])[0])
+            query = extra_params.pop('q')[0]
+            for name, values in extra_params.items():
+                query_params.setdefault(
+                    name, values if name == 'fq' or len(values) > 1
+                    else values[0])
         self._query_params = {
             'q': query,
             'wt': 'json',
@@ -43,49 +481,209 @@ class PySolrFetcher(Fetcher):
             'cursorMark': '*'
         }
         self._query_params.update(query_params)
+        modified_fq = modified_since_fq(
+            self, modified_since,
+            self._query_params.pop('modified_field', None))
+        if modified_fq:
+            fq = self._query_params.get('fq', [])
+            self._query_params['fq'] = \
+                (fq if isinstance(fq, list) else [fq]) + [modified_fq]
         self._nextCursorMark = '*'
-        self.get_next_results()
-        self.numFound = self.results['response'].get('numFound')
         self.index = 0
+        self.partitions = partitions
+        self.export = export
+        self._started = False
+        if not export and partitions <= 1:
+            self._start()
+
+    def _start(self):
+        '''Start the export or the partitions on the first next, a fetcher
+        the harvest doesn't iterate over requests nothing. Pages with
+        cursorMark if Solr can't export the docs'''
+        self._started = True
+        self.export = self.export and self.start_export()
+        if self.export:
+            return
+        if self.partitions > 1:
+            self.start_partitions(self.partitions)
+            return
+        self.get_next_results(prefetch=False)
+        self.numFound = self.results['response'].get('numFound')
 
     @property
     def _query_path(self):
-        self._query_params_encoded = pysolr.safe_urlencode(self._query_params)
+        self._query_params_encoded = pysolr.safe_urlencode(
+            self._query_params, doseq=True)
         return '{}?{}'.format(self._handler_path, self._query_params_encoded)
 
-    def get_next_results(self):
+    def _get(self, handler_path, params):
+        '''Start the stream=True request of the handler with the params'''
+        url = self.solr._create_full_url('{}?{}'.format(
+            handler_path, pysolr.safe_urlencode(params, doseq=True)))
+        try:
+            return self.requests_get(url, timeout=self.solr.timeout,
+                                     stream=True)
+        except (requests.exceptions.Timeout,
+                requests.exceptions.ConnectionError) as err:
+            raise pysolr.SolrError(
+                'Request to {} failed: {}'.format(url, err))
+
+    def select(self, fq=None, **params):
+        '''Request & decode the query with params replacing its params, None
+        to leave one out, & the extra filter query fq'''
+        query_params = dict(self._query_params, **params)
+        if fq:
+            query_params['fq'] = listify(query_params.get('fq', [])) + [fq]
+        resp = self._get(self._handler_path,
+                         dict((name, value)
+                              for name, value in query_params.items()
+                              if value is not None))
+        if resp.status_code != 200:
+            raise pysolr.SolrError(self.solr._extract_error(resp))
+        return stream_solr_response(resp, self.metrics)
+
+    def get_page(self, cursorMark, fq=None):
+        '''Request & decode the page of results for the cursorMark'''
+        return self.select(fq=fq, cursorMark=cursorMark)
+
+    def start_export(self):
+        '''Start streaming the docs from the /export handler, False if Solr
+        can't export them'''
+        if 'fl' not in self._query_params:
+            self.logger.warning(
+                'Solr export needs the fl fields, paging with cursorMark')
+            return False
+        params = dict((name, value)
+                      for name, value in self._query_params.items()
+                      if name not in ('rows', 'cursorMark'))
+        try:
+            results, self.iter = export_docs(self._get('export', params),
+                                             self.metrics)
+        except (pysolr.SolrError, ValueError) as e:
+            self.logger.warning(
+                'Solr export unavailable, paging with cursorMark: '
+                '{}'.format(e))
+            return False
+        self.numFound = results['response'].get('numFound')
+        return True
+
+    def start_partitions(self, partitions):
+        '''Split the query into ranges of the sort field, harvested
+        concurrently'''
+        self.numFound = self.select(rows=0)['response'].get('numFound')
+        field = sort_field(self._query_params['sort'])
+
+        def value_at(offset):
+            docs = self.select(start=offset, rows=1, fl=field,
+                               cursorMark=None)['response']['docs']
+            return docs[0].get(field) if docs else None
+
+        filters = partition_filters(field, self.numFound, partitions,
+                                    value_at)
+        self.logger.info('Harvesting {} docs in {} partitions'.format(
+            self.numFound, len(filters)))
+        self.iter = PartitionedSolrIterator(self.partition_docs, filters,
+                                            partitions)
+
+    def partition_docs(self, fq):
+        '''The docs of the query with the extra filter query fq'''
+        for cursorMark, page in iter_cursor_pages(
+                functools.partial(self.get_page, fq=fq)):
+            for doc in page['response']['docs']:
+                yield doc
+
+    def get_next_results(self, prefetch=True):
+        '''Get the page for the next cursorMark. With prefetch, it's taken
+        from the pages requested ahead, they start with it. The first page
+        is requested without, the pages are requested ahead once the harvest
+        has started'''
         self._query_params['cursorMark'] = self._nextCursorMark
-        resp = self.solr._send_request('get', path=self._query_path)
-        self.results = self.solr.decoder.decode(resp)
+        if self.prefetch and prefetch:
+            if self._pages is None:
+                self._pages = PrefetchSolrPages(
+                    iter_cursor_pages(self.get_page, self._nextCursorMark),
+                    self.prefetch)
+            cursorMark, self.results = self._pages.next()
+        else:
+            self.results = self.get_page(self._nextCursorMark)
         self._nextCursorMark = self.results.get('nextCursorMark')
         self.iter = self.results['response']['docs'].__iter__()
+        self._page_index = self.index
 
     def next(self):
+        if not self._started:
+            self._start()
+        if self.export or self.partitions > 1:
+            next_result = self.iter.next()
+            self.index += 1
+            return next_result
         try:
             next_result = self.iter.next()
             self.index += 1
             return next_result
         except StopIteration:
             if self.index >= self.numFound:
+                self.close_pages()
                 raise StopIteration
-        self.get_next_results()
+        try:
+            self.get_next_results()
+        except StopIteration:
+            # the prefetched pages ran out
+            self._pages = None
+            raise
         if self._nextCursorMark == self._query_params['cursorMark']:
             if self.index >= self.numFound:
+                self.close_pages()
                 raise StopIteration
         if len(self.results['response']['docs']) == 0:
+            self.close_pages()
             raise StopIteration
         self.index += 1
         return self.iter.next()
 
+    def get_cursor(self):
+        '''The cursorMark of the current page & how many of its docs have
+        been returned'''
+        if self.export or self.partitions > 1:
+            return None
+        return {
+            'cursorMark': self._query_params['cursorMark'],
+            'offset': self.index - self._page_index,
+            'index': self.index
+        }
+
+    def close_pages(self):
+        '''Stop requesting pages ahead'''
+        if self._pages is not None:
+            self._pages.close()
+            self._pages = None
+
+    def close(self):
+        self.close_pages()
+
+    def set_cursor(self, cursor):
+        # a cursor is from a harvest paging with cursorMark
+        self._started = True
+        self.export = False
+        self.partitions = 0
+        self.close_pages()
+        self.index = cursor['index'] - cursor['offset']
+        self._nextCursorMark = cursor['cursorMark']
+        self.get_next_results(prefetch=False)
+        for doc in islice(self.iter, cursor['offset']):
+            self.index += 1
+
 
 class PySolrQueryFetcher(PySolrFetcher):
     ''' Use the `select` url path for querying instead of 'query'. This is
     more typical for most Solr applications.
     '''
 
-    def __init__(self, url_harvest, query, **query_params):
+    def __init__(self, url_harvest, query, modified_since=None,
+                 **query_params):
         super(PySolrQueryFetcher, self).__init__(
-            url_harvest, query, handler_path='query', **query_params)
+            url_harvest, query, handler_path='query',
+            modified_since=modified_since, **query_params)
 
 
 class RequestsSolrFetcher(Fetcher):
@@ -97,11 +695,27 @@ class RequestsSolrFetcher(Fetcher):
         q=<query>&header=<name>:<value>&header=<name>:<value>
     The auth parameter will be parsed to figure out type of authentication
     needed, right now just deal with "header" token authentication
+    Other params are passed on to solr, eg. fl=<fields> to only get the
+    fields the mapping uses, modified_field=<field> is the field incremental
+    harvests filter on. With export=true & a URL ending in /select or
+    /query, the docs are streamed from the /export handler next to it if
+    Solr can export them. Otherwise, with partitions > 1 the query is split
+    into that many ranges of the sort field, harvested concurrently.
+    Exported & partitioned harvests have no cursor.
     '''
 
-    def __init__(self, url_harvest, extra_data, **kwargs):
+    cursor_attrs = ('_cursorMark', '_nextCursorMark')
+    incremental = True
+    partitioned = True
+
+    def __init__(self, url_harvest, extra_data, modified_since=None,
+                 prefetch=PREFETCH_PAGES, partitions=0, export=False,
+                 **kwargs):
         super(RequestsSolrFetcher, self).__init__(url_harvest, extra_data,
                                                   **kwargs)
+        self.prefetch = prefetch
+        self._pages = None
+        self._items = None
         # will need to change URLs for existing to add /select in general
         # the bampfa has NO /select or /query
         self._query_iter_template = \
@@ -123,6 +737,24 @@ class RequestsSolrFetcher(Fetcher):
             self._query_params.update({'wt': ['json']})
         if 'sort' not in self._query_params:
             self._query_params.update({'sort': ['id asc']})
+        modified_fq = modified_since_fq(
+            self, modified_since,
+            self._query_params.pop('modified_field', [None])[0])
+        if modified_fq:
+            self._query_params.setdefault('fq', []).append(modified_fq)
+        self._export = \
+            truthy(self._query_params.pop('export', [''])[0]) or export
+        self.partitions = partitions
+        self._started = False
+
+    def _start(self):
+        '''Start the export or the partitions on the first next, a fetcher
+        the harvest doesn't iterate over requests nothing'''
+        self._started = True
+        if self._export and self.start_export():
+            return
+        if self.partitions > 1:
+            self.start_partitions(self.partitions)
 
     @property
     def end_of_feed(self):
@@ -131,33 +763,165 @@ class RequestsSolrFetcher(Fetcher):
     @property
     def url_request(self):
         # build current URL
+        return self.page_url(self._cursorMark)
+
+    def page_url(self, cursorMark):
+        '''The URL of the page of results for the cursorMark'''
         url_request = ''.join((
             self.url,
             self._query_iter_template.format(
-                rows=self._page_size, cursorMark=self._cursorMark), ))
+                rows=self._page_size, cursorMark=cursorMark), ))
         # join 'q' and all other params
-        for name, value in self._query_params.items():
-            url_request = ''.join((url_request, '&', name, '=', value[0]))
+        for name, values in self._query_params.items():
+            if name == 'fq':  # filter queries can be repeated
+                for value in values:
+                    url_request = ''.join((url_request, '&fq=',
+                                           quote_param(value)))
+                continue
+            url_request = ''.join((url_request, '&', name, '=', values[0]))
         return url_request
 
     def get_response(self):
         '''Get the correct response for the given combo of params'''
-        return requests.get(self.url_request, headers=self._headers)
+        return self.requests_get(self.url_request, headers=self._headers)
+
+    def _get(self, url):
+        '''Start the stream=True request of the url'''
+        resp = self.requests_get(url, headers=self._headers, stream=True)
+        resp.raise_for_status()
+        return resp
+
+    def get_page(self, cursorMark, fq=None):
+        '''Request & decode the page of results for the cursorMark, with the
+        extra filter query fq'''
+        url = self.page_url(cursorMark)
+        if fq:
+            url = ''.join((url, '&fq=', quote_param(fq)))
+        return stream_solr_response(self._get(url), self.metrics)
+
+    def params_url(self, url, fq=None, **params):
+        '''The url with the query params, with params replacing them, None
+        to leave one out, & the extra filter query fq'''
+        query_params = dict(self._query_params)
+        query_params.update(
+            (name, None if value is None else [str(value)])
+            for name, value in params.items())
+        if fq:
+            query_params['fq'] = query_params.get('fq', []) + [fq]
+        return ''.join((url, '?', '&'.join(
+            '='.join((name, quote_param(value) if name == 'fq' else value))
+            for name, values in query_params.items() if values is not None
+            for value in values)))
+
+    @property
+    def export_url(self):
+        '''The URL of the /export handler next to the /select or /query
+        handler of the URL, None if the URL has neither'''
+        match = re.match(r'(.*/)(select|query)/?$', self.url)
+        return match.group(1) + 'export' if match else None
+
+    def start_export(self):
+        '''Start streaming the docs from the /export handler, False if Solr
+        can't export them'''
+        if not self.export_url or 'fl' not in self._query_params:
+            self.logger.warning('Solr export needs a /select or /query URL '
+                                '& the fl fields, paging with cursorMark')
+            return False
+        try:
+            results, docs = export_docs(
+                self._get(self.params_url(self.export_url)), self.metrics)
+        except (pysolr.SolrError, requests.exceptions.RequestException,
+                ValueError) as e:
+            self.logger.warning(
+                'Solr export unavailable, paging with cursorMark: '
+                '{}'.format(e))
+            return False
+        self._items = self._export_pages(docs)
+        return True
+
+    def _export_pages(self, docs):
+        while True:
+            page = list(islice(docs, self._page_size))
+            if not page:
+                return
+            yield page
+
+    def start_partitions(self, partitions):
+        '''Split the query into ranges of the sort field, harvested
+        concurrently'''
+        num_found = stream_solr_response(
+            self._get(self.params_url(self.url, rows=0)),
+            self.metrics)['response']['numFound']
+        field = sort_field(self._query_params['sort'][0])
+
+        def value_at(offset):
+            docs = stream_solr_response(
+                self._get(self.params_url(self.url, start=offset, rows=1,
+                                          fl=field)),
+                self.metrics)['response']['docs']
+            return docs[0].get(field) if docs else None
+
+        filters = partition_filters(field, num_found, partitions, value_at)
+        self.logger.info('Harvesting {} docs in {} partitions'.format(
+            num_found, len(filters)))
+        self._items = PartitionedSolrIterator(self.partition_pages,
+                                              filters, partitions)
+
+    def partition_pages(self, fq):
+        '''The pages of docs of the query with the extra filter query fq'''
+        for cursorMark, page in iter_cursor_pages(
+                functools.partial(self.get_page, fq=fq)):
+            if page['response']['docs']:
+                yield page['response']['docs']
 
     def next(self):
         '''get the next page of solr data, using the cursor mark to build
         URL
         '''
+        if not self._started:
+            self._start()
+        if self._items is not None:
+            return self._items.next()
         if (self.end_of_feed):
+            self.close_pages()
             raise StopIteration
         # get resp
         self._cursorMark = self._nextCursorMark
-        resp = self.get_response()
-        resp.raise_for_status()
-        resp_obj = resp.json()
+        if self.prefetch:
+            if self._pages is None:
+                self._pages = PrefetchSolrPages(
+                    iter_cursor_pages(self.get_page, self._cursorMark),
+                    self.prefetch)
+            try:
+                cursorMark, resp_obj = self._pages.next()
+            except StopIteration:
+                self._pages = None
+                raise
+        else:
+            resp_obj = self.get_page(self._cursorMark)
         self._nextCursorMark = resp_obj['nextCursorMark']
         return resp_obj['response']['docs']
 
+    def close_pages(self):
+        '''Stop requesting pages ahead'''
+        if self._pages is not None:
+            self._pages.close()
+            self._pages = None
+
+    def close(self):
+        self.close_pages()
+
+    def get_cursor(self):
+        if self._items is not None:
+            return None
+        return super(RequestsSolrFetcher, self).get_cursor()
+
+    def set_cursor(self, cursor):
+        # a cursor is from a harvest paging with cursorMark
+        self._started = True
+        self.close_pages()
+        super(RequestsSolrFetcher, self).set_cursor(cursor)
+
 
 # Copyright © 2017, Regents of the University of California
 # All rights reserved.
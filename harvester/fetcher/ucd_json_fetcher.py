@@ -1,9 +1,7 @@
 # -*- coding: utf-8 -*-
 from collections import defaultdict
 from .fetcher import Fetcher
-import urllib
 import extruct
-import requests
 import re
 from xml.etree import ElementTree as ET
 from w3lib.html import get_base_url
@@ -13,12 +11,23 @@ register('json-ld', Serializer, 'rdflib_jsonld.serializer', 'JsonLDSerializer')
 
 class UCD_JSON_Fetcher(Fetcher):
     '''Retrieve JSON from each page listed on
-    UC Davis XML sitemap given as url_harvest'''
+    UC Davis XML sitemap given as url_harvest.
+    The whole sitemap is one objset, with lazy it's a generator that gets
+    the pages as the records are read'''
+    conditional_get = True
+    streamed = True
 
-    def __init__(self, url_harvest, extra_data, **kwargs):
+    def __init__(self, url_harvest, extra_data, lazy=False, **kwargs):
+        super(UCD_JSON_Fetcher, self).__init__(url_harvest, extra_data,
+                                               **kwargs)
+        self.lazy = lazy
         self.url_base = url_harvest
         self.docs_fetched = 0
-        xml = urllib.urlopen(self.url_base).read()
+        self.docs_total = 0
+        self.hits = []
+        xml = self.fetch_source(self.url_base)
+        if xml is None:
+            return
         total = re.findall('<url>', xml)
         self.docs_total = len(total)
 
@@ -30,10 +39,12 @@ class UCD_JSON_Fetcher(Fetcher):
     def _dochits_to_objset(self, docHits):
         '''Returns list of objects.
         '''
+        return list(self._iter_dochits(docHits))
 
-        objset = []
+    def _iter_dochits(self, docHits):
+        '''Yield the object for each of the pages'''
         for d in docHits:
-            r = requests.get(d.text)
+            r = self.requests_get(d.text)
 
             # get JSON-LD from the page
             base_url = get_base_url(r.text)
@@ -45,14 +56,15 @@ class UCD_JSON_Fetcher(Fetcher):
             for mdata in jsld:
                 obj_mdata[mdata] = jsld[mdata]
             obj['metadata'] = dict(obj_mdata)
-            objset.append(obj)
             self.docs_fetched += 1
-        return objset
+            yield obj
 
     def next(self):
         '''get next objset, use etree to pythonize'''
         if self.docs_fetched >= self.docs_total:
             raise StopIteration
+        if self.lazy:
+            return self._iter_dochits(self.hits)
         return self._dochits_to_objset(self.hits)
 
 # Copyright © 2016, Regents of the University of California
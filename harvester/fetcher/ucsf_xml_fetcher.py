@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import urllib
 import re
 from xml.etree import ElementTree as ET
 from collections import defaultdict
@@ -7,13 +6,15 @@ from .fetcher import Fetcher
 
 
 class UCSF_XML_Fetcher(Fetcher):
+    cursor_attrs = ('page_current', 'doc_current', 'docs_fetched')
+
     def __init__(self, url_harvest, extra_data, page_size=100, **kwargs):
         self.url_base = url_harvest
         self.page_size = page_size
         self.page_current = 1
         self.doc_current = 1
         self.docs_fetched = 0
-        xml = urllib.urlopen(self.url_current).read()
+        xml = self.urlopen_read(self.url_current)
         total = re.search('search-hits pages="(?P<pages>\d+)" page="'
                           '(?P<page>\d+)" total="(?P<total>\d+)"', xml)
         self.docs_total = int(total.group('total'))
@@ -60,7 +61,7 @@ class UCSF_XML_Fetcher(Fetcher):
                     .format(self.docs_fetched, self.docs_total))
             else:
                 raise StopIteration
-        tree = ET.fromstring(urllib.urlopen(self.url_current).read())
+        tree = ET.fromstring(self.urlopen_read(self.url_current))
         hits = tree.findall(
             ".//{http://legacy.library.ucsf.edu/search/1.0}search-hit")
         self.page_current += 1
@@ -1,5 +1,4 @@
 # -*- coding: utf-8 -*-
-import urllib
 import re
 from xml.etree import ElementTree as ET
 from collections import defaultdict
@@ -11,17 +10,22 @@ from itertools import islice
 class XML_Fetcher(Fetcher):
     '''Harvests 1,000 records at a time from
     static XML document at url_harvest'''
+    conditional_get = True
 
     def __init__(self, url_harvest, extra_data, **kwargs):
+        super(XML_Fetcher, self).__init__(url_harvest, extra_data, **kwargs)
         self.url_base = url_harvest
         self.doc_current = 1
         self.docs_fetched = 0
-        xml = urllib.urlopen(self.url_base).read()
-        total = re.findall('<record>', xml)
-        self.docs_total = len(total)
-        # Use etree to pythonize
-        tree = ET.fromstring(xml)
-        self.hits = tree.findall(".//record")
+        self.docs_total = 0
+        self.hits = []
+        xml = self.fetch_source(self.url_base)
+        if xml is not None:
+            total = re.findall('<record>', xml)
+            self.docs_total = len(total)
+            # Use etree to pythonize
+            tree = ET.fromstring(xml)
+            self.hits = tree.findall(".//record")
         self.re_ns_strip = re.compile('{.*}(?P<tag>.*)$')
 
     def _dochits_to_objset(self, docHits):
@@ -0,0 +1,161 @@
+'''State for collection harvests that has to outlive a single RQ job, kept in
+the redis instance used for the job queues.
+'''
+import json
+import hashlib
+from redis import Redis
+from harvester.config import config
+
+CHECKPOINT_TTL = 1209600  # 2 weeks, OAI resumptionTokens expire before this
+VALIDATOR_TTL = 7776000  # 90 days, sources not harvested since are refetched
+RECORD_HASH_TTL = 7776000  # 90 days
+METADATA_FORMAT_TTL = 604800  # 1 week, new formats are seen within a week
+
+
+def get_redis_connection(conf=None):
+    '''Return a Redis connection for the harvester config'''
+    if conf is None:
+        conf = config()
+    return Redis(
+        host=conf['redis_host'],
+        port=conf['redis_port'],
+        password=conf['redis_password'],
+        socket_connect_timeout=conf['redis_connect_timeout'])
+
+
+class HarvestCheckpoint(object):
+    '''The last saved position of a collection's metadata harvest.
+    The checkpoint is a JSON object with the fetcher's cursor and the
+    controller's save location & counts at the time the objset was saved.
+    '''
+    key_tmpl = 'ucldc:harvester:checkpoint:{cid}'
+
+    def __init__(self, collection_id, redis=None, ttl=CHECKPOINT_TTL):
+        self.key = self.key_tmpl.format(cid=collection_id)
+        self._redis = redis if redis is not None else get_redis_connection()
+        self.ttl = ttl
+
+    def load(self):
+        '''Return the checkpoint dict or None if no checkpoint'''
+        value = self._redis.get(self.key)
+        if not value:
+            return None
+        return json.loads(value)
+
+    def save(self, state):
+        self._redis.set(self.key, json.dumps(state), ex=self.ttl)
+
+    def clear(self):
+        self._redis.delete(self.key)
+
+
+class ValidatorCache(object):
+    '''HTTP validators for the files static-file sources are harvested from.
+    For each URL the ETag, Last-Modified & a sha1 of the content are kept
+    from the last successful harvest, so the next harvest can make a
+    conditional GET & tell when the file hasn't changed.
+    '''
+    key_tmpl = 'ucldc:harvester:validators:{url_hash}'
+
+    def __init__(self, redis=None, ttl=VALIDATOR_TTL):
+        self._redis = redis if redis is not None else get_redis_connection()
+        self.ttl = ttl
+
+    def key(self, url):
+        return self.key_tmpl.format(url_hash=hashlib.sha1(url).hexdigest())
+
+    def get(self, url):
+        '''Return the validators dict for url or None'''
+        value = self._redis.get(self.key(url))
+        if not value:
+            return None
+        return json.loads(value)
+
+    def set(self, url, validators):
+        self._redis.set(self.key(url), json.dumps(validators), ex=self.ttl)
+
+
+class MetadataFormatCache(object):
+    '''The metadataPrefixes of the formats an OAI endpoint supports, so the
+    harvests of its collections don't each list them.
+    '''
+    key_tmpl = 'ucldc:harvester:metadata-formats:{url_hash}'
+
+    def __init__(self, redis=None, ttl=METADATA_FORMAT_TTL):
+        self._redis = redis if redis is not None else get_redis_connection()
+        self.ttl = ttl
+
+    def key(self, endpoint):
+        return self.key_tmpl.format(
+            url_hash=hashlib.sha1(endpoint).hexdigest())
+
+    def get(self, endpoint):
+        '''Return the list of metadataPrefixes or None'''
+        value = self._redis.get(self.key(endpoint))
+        if not value:
+            return None
+        return json.loads(value)
+
+    def set(self, endpoint, prefixes):
+        self._redis.set(self.key(endpoint), json.dumps(prefixes), ex=self.ttl)
+
+
+class HighWaterMark(object):
+    '''The time the last successful ingest of a collection started, in UTC.
+    Incremental harvests only fetch the records modified since then.
+    Not expired, an incremental harvest with no mark is a full harvest.
+    '''
+    key_tmpl = 'ucldc:harvester:high-water-mark:{cid}'
+    datetime_fmt = '%Y-%m-%dT%H:%M:%SZ'
+
+    def __init__(self, collection_id, redis=None):
+        self.key = self.key_tmpl.format(cid=collection_id)
+        self._redis = redis if redis is not None else get_redis_connection()
+
+    def load(self):
+        '''Return the mark as a "YYYY-MM-DDThh:mm:ssZ" string or None'''
+        return self._redis.get(self.key) or None
+
+    def save(self, harvest_start):
+        '''Save the start of a successful harvest, a UTC datetime'''
+        self._redis.set(self.key, harvest_start.strftime(self.datetime_fmt))
+
+    def clear(self):
+        self._redis.delete(self.key)
+
+
+class RecordHashIndex(object):
+    '''The hashes of the records saved by the last ingest of a collection.
+    A harvest adds the hashes of the records it fetches to the next index,
+    which replaces the index once the records are saved.
+    '''
+    key_tmpl = 'ucldc:harvester:record-hashes:{cid}'
+
+    def __init__(self, collection_id, redis=None, ttl=RECORD_HASH_TTL):
+        self.key = self.key_tmpl.format(cid=collection_id)
+        self.key_next = self.key + ':next'
+        self._redis = redis if redis is not None else get_redis_connection()
+        self.ttl = ttl
+
+    def load(self):
+        '''Return the set of hashes of the last ingest'''
+        return self._redis.smembers(self.key)
+
+    def start(self):
+        '''Start a new next index'''
+        self._redis.delete(self.key_next)
+
+    def add(self, hashes):
+        '''Add the hashes of harvested records to the next index'''
+        if hashes:
+            self._redis.sadd(self.key_next, *hashes)
+            self._redis.expire(self.key_next, self.ttl)
+
+    def commit(self):
+        '''Replace the index with the next index, if there is one'''
+        if self._redis.exists(self.key_next):
+            self._redis.rename(self.key_next, self.key)
+            self._redis.expire(self.key, self.ttl)
+
+    def clear(self):
+        self._redis.delete(self.key, self.key_next)
@@ -6,8 +6,6 @@
 
 import os
 import sys
-import datetime
-import time
 import urlparse
 import urllib
 from couchdb import ResourceConflict
@@ -25,6 +23,8 @@ from harvester.couchdb_pager import couchdb_pager
 from harvester.cleanup_dir import cleanup_work_dir
 from harvester.sns_message import publish_to_harvesting
 from harvester.sns_message import format_results_subject
+from harvester.rate_limit import get_rate_limiter
+from harvester.rate_limit import THROTTLE_STATUS
 
 BUCKET_BASES = os.environ.get(
     'S3_BUCKET_IMAGE_BASE',
@@ -47,6 +47,10 @@ class ImageHTTPError(ImageHarvestError):
     # will waap exceptions from the HTTP request
     dict_key = 'HTTP Error'
 
+    def __init__(self, message, doc_id=None, status_code=None):
+        super(ImageHTTPError, self).__init__(message, doc_id=doc_id)
+        self.status_code = status_code
+
 
 class HasObject(ImageHarvestError):
     dict_key = 'Has Object already'
@@ -82,7 +86,8 @@ def link_is_to_image(doc_id, url, auth=None):
             response = requests.get(url, allow_redirects=True, auth=auth)
         if response.status_code != 200:
             raise ImageHTTPError(
-                'HTTP ERROR: {}'.format(response.status_code), doc_id=doc_id)
+                'HTTP ERROR: {}'.format(response.status_code), doc_id=doc_id,
+                status_code=response.status_code)
     content_type = response.headers.get('content-type', None)
     if not content_type:
         return False
@@ -94,7 +99,8 @@ def link_is_to_image(doc_id, url, auth=None):
         response = requests.get(url, allow_redirects=True, auth=auth)
         if response.status_code != 200:
             raise ImageHTTPError(
-                'HTTP ERROR: {}'.format(response.status_code), doc_id=doc_id)
+                'HTTP ERROR: {}'.format(response.status_code), doc_id=doc_id,
+                status_code=response.status_code)
         content_type = response.headers.get('content-type', None)
         if not content_type:
             return False
@@ -108,14 +114,19 @@ def stash_image_for_doc(doc,
                         hash_cache,
                         ignore_content_type,
                         bucket_bases=BUCKET_BASES,
-                        auth=None):
+                        auth=None,
+                        rate_limiter=None):
     '''Stash the images in s3, using md5s3stash
     Duplicate it among the "BUCKET_BASES" list. This will give redundancy
     in case some idiot (me) deletes one of the copies. Not tons of data so
     cheap to replicate them.
     Return md5s3stash report if image found
     If link is not an image type, don't stash & raise
+    Requests to the image's host wait for the rate_limiter, if
+    HARVEST_RATE_LIMITS or HARVEST_RATE_LIMIT_DEFAULT sets a rate for it.
     '''
+    if rate_limiter is None:
+        rate_limiter = get_rate_limiter()
     try:
         url_image = doc['isShownBy']
         if not url_image:
@@ -137,13 +148,21 @@ def stash_image_for_doc(doc,
         print >> sys.stderr, msg
         raise FailsImageTest(msg, doc_id=doc['_id'])
     reports = []
+    rate_limiter.acquire(url_image)
+    try:
+        is_image = link_is_to_image(doc['_id'], url_image, auth)
+    except ImageHTTPError as e:
+        if e.status_code in THROTTLE_STATUS:
+            rate_limiter.throttled(url_image)
+        raise
     # If '--ignore_content_type' set, don't check link_is_to_image
-    if link_is_to_image(doc['_id'], url_image, auth) or ignore_content_type:
+    if is_image or ignore_content_type:
         for bucket_base in bucket_bases:
             try:
                 logging.getLogger('image_harvest.stash_image').info(
                     'bucket_base:{0} url_image:{1}'.format(bucket_base,
                                                            url_image))
+                rate_limiter.acquire(url_image)
                 region, bucket_base = bucket_base.split(':')
                 conn = boto.s3.connect_to_region(region)
                 report = md5s3stash.md5s3stash(
@@ -179,7 +198,8 @@ class ImageHarvester(object):
                  ignore_content_type=False,
                  url_cache=None,
                  hash_cache=None,
-                 harvested_object_cache=None):
+                 harvested_object_cache=None,
+                 rate_limiter=None):
         self._config = config()
         if cdb:
             self._couchdb = cdb
@@ -209,6 +229,8 @@ class ImageHarvester(object):
             redis_collections.Dict(
                 key='ucldc:harvester:harvested-images',
                 redis=self._redis)
+        self._rate_limiter = rate_limiter if rate_limiter is not None else \
+            get_rate_limiter()
 
     def stash_image(self, doc):
         return stash_image_for_doc(
@@ -217,7 +239,8 @@ class ImageHarvester(object):
             self._hash_cache,
             self.ignore_content_type,
             bucket_bases=self._bucket_bases,
-            auth=self._auth)
+            auth=self._auth,
+            rate_limiter=self._rate_limiter)
 
     def update_doc_object(self, doc, report):
         '''Update the object field to point to an s3 bucket'''
@@ -269,14 +292,11 @@ class ImageHarvester(object):
     def by_doc_id(self, doc_id):
         '''For a list of ids, harvest images'''
         doc = self._couchdb[doc_id]
-        dt_start = dt_end = datetime.datetime.now()
         report_errors = defaultdict(list)
         try:
             reports = self.harvest_image_for_doc(doc, force=True)
         except ImageHarvestError as e:
             report_errors[e.dict_key].append((e.doc_id, str(e)))
-        dt_end = datetime.datetime.now()
-        time.sleep((dt_end - dt_start).total_seconds())
         return report_errors
 
     def by_collection(self, collection_key=None):
@@ -296,14 +316,11 @@ class ImageHarvester(object):
         doc_ids = []
         report_errors = defaultdict(list)
         for r in v:
-            dt_start = dt_end = datetime.datetime.now()
             try:
                 reports = self.harvest_image_for_doc(r.doc)
             except ImageHarvestError as e:
                 report_errors[e.dict_key].append((e.doc_id, str(e)))
             doc_ids.append(r.doc['_id'])
-            dt_end = datetime.datetime.now()
-            time.sleep((dt_end - dt_start).total_seconds())
         report_list = [
             ' : '.join((key, str(val))) for key, val in report_errors.items()
         ]
@@ -1,11 +1,10 @@
-import datetime
-import time
 from redis import Redis
 from rq import Queue
 
 from harvester.config import config
 from harvester.couchdb_init import get_couchdb
 from harvester.couchdb_pager import couchdb_pager
+from harvester.rate_limit import get_rate_limiter
 
 COUCHDB_VIEW = 'all_provider_docs/by_provider_name'
 
@@ -63,8 +62,11 @@ class CouchDBWorker(object):
     ????Add the "save" keyword argument to save the document to db???
     functions should have call signature of (doc, *args, **kwargs)
     '''
-    def __init__(self):
+
+    def __init__(self, rate_limiter=None):
         self._couchdb = get_couchdb()
+        self._rate_limiter = rate_limiter if rate_limiter is not None else \
+            get_rate_limiter()
 
     def run_by_list_of_doc_ids(self, doc_ids, func, *args, **kwargs):
         '''For a list of ids, harvest images'''
@@ -81,12 +83,15 @@ class CouchDBWorker(object):
         v = CouchDBCollectionFilter(couchdb_obj=self._couchdb,
                                     collection_key=collection_key)
         results = []
+        url = self._couchdb.resource.url
+        # our own couchdb, only limited if HARVEST_RATE_LIMITS has its host,
+        # not by HARVEST_RATE_LIMIT_DEFAULT
+        limited = self._rate_limiter.host(url) in self._rate_limiter.rates
         for r in v:
-            dt_start = dt_end = datetime.datetime.now()
+            if limited:
+                self._rate_limiter.acquire(url)
             result = func(r.doc, *args, **kwargs)
             results.append((r.doc['_id'], result))
-            dt_end = datetime.datetime.now()
-            time.sleep((dt_end-dt_start).total_seconds())
         return results
 
 
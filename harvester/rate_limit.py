@@ -0,0 +1,152 @@
+'''Per host rate limits for the requests made to harvest sources.
+A GCRA token bucket for each host: every request reserves the next slot
+for its host & sleeps until then, so requests go out at the host's rate
+with bursts of up to HARVEST_RATE_LIMIT_BURST.
+With HARVEST_RATE_LIMIT_SHARED set, the buckets are kept in the redis from
+harvester.config & shared by all the RQ workers, otherwise they're local
+to the process.
+Rates are requests/second, HARVEST_RATE_LIMITS sets them for hosts:
+    HARVEST_RATE_LIMITS="nuxeo.cdlib.org=10,api.flickr.com=0.5"
+Other hosts get the default rate of the caller, or
+HARVEST_RATE_LIMIT_DEFAULT, or no limit.
+A 429 or 503 from a host halves its rate for SLOWDOWN_TTL seconds.
+'''
+import os
+import time
+import urlparse
+import threading
+from harvester.harvest_state import get_redis_connection
+
+THROTTLE_STATUS = (429, 503)
+SLOWDOWN_TTL = 300
+MAX_SLOWDOWN = 64
+
+
+def parse_rates(rates):
+    '''Parse "host=rate,host=rate" into a dict'''
+    parsed = {}
+    for host_rate in rates.split(','):
+        if not host_rate.strip():
+            continue
+        host, rate = host_rate.rsplit('=', 1)
+        parsed[host.strip().lower()] = float(rate)
+    return parsed
+
+
+RATES = parse_rates(os.environ.get('HARVEST_RATE_LIMITS', ''))
+DEFAULT_RATE = float(os.environ['HARVEST_RATE_LIMIT_DEFAULT']) \
+    if os.environ.get('HARVEST_RATE_LIMIT_DEFAULT') else None
+BURST = int(os.environ.get('HARVEST_RATE_LIMIT_BURST', 1))
+SHARED = bool(os.environ.get('HARVEST_RATE_LIMIT_SHARED'))
+
+
+class HostRateLimiter(object):
+    '''Rate limit requests by the host of the URL.
+    redis is the connection to keep the buckets in, None to keep them in
+    this process.
+    '''
+    key_tmpl = 'ucldc:harvester:rate-limit:{host}'
+    slowdown_key_tmpl = 'ucldc:harvester:rate-limit:{host}:slowdown'
+
+    def __init__(self, redis=None, rates=None, default_rate=DEFAULT_RATE,
+                 burst=BURST):
+        self._redis = redis
+        self.rates = RATES if rates is None else rates
+        self.default_rate = default_rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._tats = {}
+        self._slowdowns = {}
+
+    @staticmethod
+    def host(url):
+        return urlparse.urlsplit(url).netloc.lower()
+
+    def rate(self, host, default_rate=None):
+        '''The configured rate for host, None if not limited'''
+        return self.rates.get(host) or default_rate or self.default_rate
+
+    def acquire(self, url, default_rate=None):
+        '''Wait for the next slot for url's host. default_rate is the
+        caller's rate for hosts without one configured.
+        Returns the seconds waited.
+        '''
+        host = self.host(url)
+        rate = self.rate(host, default_rate)
+        if not rate:
+            return 0
+        interval = self.slowdown(host) / float(rate)
+        wait = self._reserve(host, interval)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def throttled(self, url):
+        '''The host of url asked us to slow down, halve its rate'''
+        host = self.host(url)
+        slowdown = min(self.slowdown(host) * 2, MAX_SLOWDOWN)
+        if self._redis is None:
+            expires = time.time() + SLOWDOWN_TTL
+            with self._lock:
+                self._slowdowns[host] = (slowdown, expires)
+            return
+        self._redis.set(self.slowdown_key_tmpl.format(host=host), slowdown,
+                        ex=SLOWDOWN_TTL)
+
+    def slowdown(self, host):
+        '''The factor the rate of host is currently divided by'''
+        if self._redis is None:
+            with self._lock:
+                slowdown, expires = self._slowdowns.get(host, (1, None))
+                if expires and expires < time.time():
+                    del self._slowdowns[host]
+                    slowdown = 1
+            return slowdown
+        slowdown = self._redis.get(self.slowdown_key_tmpl.format(host=host))
+        return int(slowdown) if slowdown else 1
+
+    def _next_slot(self, tat, interval, now):
+        '''GCRA: tat is the theoretical arrival time of the next request.
+        Returns the wait for this request & the new tat'''
+        tat = max(tat or now, now)
+        wait = max(0.0, tat - (self.burst - 1) * interval - now)
+        return wait, tat + interval
+
+    def _reserve(self, host, interval):
+        '''Reserve the next slot for host, return the wait for it'''
+        if self._redis is None:
+            with self._lock:
+                wait, self._tats[host] = self._next_slot(
+                    self._tats.get(host), interval, time.time())
+            return wait
+        key = self.key_tmpl.format(host=host)
+
+        def reserve(pipe):
+            # rerun by redis-py if another worker changes the key
+            now = time.time()
+            tat = pipe.get(key)
+            wait, tat = self._next_slot(
+                float(tat) if tat else None, interval, now)
+            pipe.multi()
+            # expire once the bucket is full again
+            pipe.set(key, repr(tat),
+                     px=int((tat - now + self.burst * interval) * 1000) + 1)
+            return wait
+
+        return self._redis.transaction(reserve, key,
+                                       value_from_callable=True)
+
+
+_rate_limiter = None
+
+
+def get_rate_limiter():
+    '''The HostRateLimiter for the process, shared through redis if
+    HARVEST_RATE_LIMIT_SHARED is set'''
+    global _rate_limiter
+    if _rate_limiter is None:
+        redis = None
+        if SHARED:
+            redis = get_redis_connection()
+        _rate_limiter = HostRateLimiter(redis)
+    return _rate_limiter
@@ -83,8 +83,12 @@ def main(user_email,
          redis_timeout=600,
          rq_queue=None,
          run_image_harvest=False,
+         remove_deleted=True,
          **kwargs):
-    '''Runs a UCLDC ingest process for the given collection'''
+    '''Runs a UCLDC ingest process for the given collection.
+    With remove_deleted False, the records not in this ingest are left in
+    the collection & the counts aren't checked.
+    '''
     cleanup_work_dir()  # remove files from /tmp
     emails = [user_email]
     if EMAIL_SYS_ADMIN:
@@ -123,6 +127,19 @@ def main(user_email,
                  ' Run on stage and QA first, then set',
                  ' ready_for_publication')).format(collection.id))
     logger.info("INGEST DOC ID:{0}".format(ingest_doc_id))
+    if harvester.source_unchanged:
+        logger.info('SOURCE UNCHANGED, SKIPPING ENRICH & SAVE')
+        harvester.commit_record_hashes()
+        harvester.commit_high_water_mark()
+        harvester.commit_validators()
+        subject = format_results_subject(collection.id,
+                                         'Harvest to CouchDB {env} ')
+        publish_to_harvesting(subject,
+                              'Metadata source unchanged for CID: {}\n'
+                              'Nothing harvested'.format(collection.id))
+        log_handler.pop_application()
+        mail_handler.pop_application()
+        return
     logger.info('HARVESTED {0} RECORDS'.format(num_recs))
     logger.info('IN DIR:{0}'.format(dir_save))
     resp = enrich_records.main([None, ingest_doc_id])
@@ -137,16 +154,35 @@ def main(user_email,
         raise Exception("Error saving records {0}".format(str(resp)))
     num_saved = resp
     logger.info("SAVED RECS : {}".format(num_saved))
-
-    resp = remove_deleted_records.main([None, ingest_doc_id])
-    if not resp == 0:
-        logger.error("Error deleting records {0}".format(resp))
-        raise Exception("Error deleting records {0}".format(resp))
-
-    resp = check_ingestion_counts.main([None, ingest_doc_id])
-    if not resp == 0:
-        logger.error("Error checking counts {0}".format(resp))
-        raise Exception("Error checking counts {0}".format(resp))
+    harvester.commit_record_hashes()
+    harvester.commit_high_water_mark()
+    harvester.commit_validators()
+
+    if not remove_deleted:
+        logger.info('SKIPPING DELETE & COUNT CHECK')
+    elif harvester.identifiers:
+        # only the records asked for were harvested
+        logger.info('HARVEST OF {} IDENTIFIERS, SKIPPING DELETE & COUNT '
+                    'CHECK'.format(len(harvester.identifiers)))
+    elif harvester.modified_since:
+        # only the changed records were harvested, the records not in this
+        # ingest aren't deleted & the counts don't match the collection
+        logger.info('INCREMENTAL HARVEST SINCE {}, SKIPPING DELETE & COUNT '
+                    'CHECK'.format(harvester.modified_since))
+    elif harvester.num_unchanged:
+        # the unchanged records weren't saved again, they'd be deleted
+        logger.info('{} UNCHANGED RECORDS SKIPPED, SKIPPING DELETE & COUNT '
+                    'CHECK'.format(harvester.num_unchanged))
+    else:
+        resp = remove_deleted_records.main([None, ingest_doc_id])
+        if not resp == 0:
+            logger.error("Error deleting records {0}".format(resp))
+            raise Exception("Error deleting records {0}".format(resp))
+
+        resp = check_ingestion_counts.main([None, ingest_doc_id])
+        if not resp == 0:
+            logger.error("Error checking counts {0}".format(resp))
+            raise Exception("Error checking counts {0}".format(resp))
 
     resp = dashboard_cleanup.main([None, ingest_doc_id])
     if not resp == 0:
@@ -0,0 +1,198 @@
+'''Roll the pages fetched by a harvest up into larger S3 objects.
+
+Fetchers that return one record per objset would otherwise make one S3 PUT
+per record. The pages are appended to a JSONL segment which is uploaded
+when it reaches segment_size bytes or segment_records records. Each
+segment has a small index object mapping its pages to their byte offset &
+length, so the pages can be read back. A resumed harvest merges the
+segment indexes. When the harvest is done, one index of all the pages is
+written. The offsets are into the uncompressed segment.
+'''
+import sys
+import json
+import threading
+import Queue
+import boto3
+from botocore.exceptions import ClientError
+from .compression import compress, decompress, EXTENSIONS
+
+SEGMENT_SIZE = 8 * 1024 * 1024
+INDEX_NAME = 'segments-index.json'
+
+
+class S3SegmentWriter(object):
+    '''Write the pages of a harvest to JSONL segments under prefix.
+    Segments are uploaded by a background thread through a single boto3
+    client. Pages can be written from more than one thread, their order in
+    the segments is the order they are written.
+    on_saved(page, state) is called, from the upload thread, for each page
+    once its segment & the segment's index are in S3.
+    '''
+    tmpl_segment = '{prefix}segment-{n}.jsonl'
+    tmpl_segment_index = '{prefix}segment-{n}.index.json'
+
+    def __init__(self,
+                 bucket,
+                 prefix,
+                 segment_size=SEGMENT_SIZE,
+                 segment_records=None,
+                 client=None,
+                 compression=None,
+                 on_saved=None,
+                 queue_depth=2):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.segment_size = segment_size
+        self.segment_records = segment_records
+        self.client = client if client else boto3.client('s3')
+        self.compression = compression
+        self.on_saved = on_saved
+        self.segment = 0
+        # page -> [segment, offset, length, number of records]
+        self.index = {}
+        self._lock = threading.Lock()
+        self._index_lock = threading.Lock()
+        self._reset_buffer()
+        self._error = None
+        self._queue = Queue.Queue(maxsize=queue_depth)
+        self._thread = threading.Thread(
+            target=self._upload_worker, name='s3-segment-upload')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def key_index(self):
+        return ''.join((self.prefix, INDEX_NAME))
+
+    def key_segment(self, n):
+        return ''.join((self.tmpl_segment.format(prefix=self.prefix, n=n),
+                        EXTENSIONS[self.compression]))
+
+    def key_segment_index(self, n):
+        return self.tmpl_segment_index.format(prefix=self.prefix, n=n)
+
+    def _reset_buffer(self):
+        self._buf = []
+        self._buf_size = 0
+        self._buf_records = 0
+        self._buf_pages = []
+
+    def write_page(self, page, records, state=None):
+        '''Add the serialized records of a page to the current segment.
+        state is passed to on_saved when the page is in S3.'''
+        self._raise_error()
+        body = ''.join([rec + '\n' for rec in records])
+        with self._lock:
+            self._buf_pages.append(
+                (page, self._buf_size, len(body), len(records), state))
+            self._buf.append(body)
+            self._buf_size += len(body)
+            self._buf_records += len(records)
+            if self._buf_size >= self.segment_size or (
+                    self.segment_records and
+                    self._buf_records >= self.segment_records):
+                self._flush()
+
+    def _flush(self):
+        if not self._buf:
+            return
+        self._queue.put((self.segment, ''.join(self._buf), self._buf_pages))
+        self.segment += 1
+        self._reset_buffer()
+
+    def _upload_worker(self):
+        '''Upload the segments, then the index of each segment's pages.
+        After an error keep draining so writers don't block on the queue.
+        '''
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error:
+                    continue
+                segment, body, pages = item
+                self.client.put_object(
+                    Bucket=self.bucket,
+                    Key=self.key_segment(segment),
+                    Body=compress(body, self.compression))
+                segment_index = dict(
+                    (page, [segment, offset, length, n_records])
+                    for page, offset, length, n_records, state in pages)
+                self.client.put_object(
+                    Bucket=self.bucket, Key=self.key_segment_index(segment),
+                    Body=json.dumps({'pages': segment_index}))
+                with self._index_lock:
+                    self.index.update(segment_index)
+                if self.on_saved:
+                    for page, offset, length, n_records, state in pages:
+                        self.on_saved(page, state)
+            except Exception:
+                self._error = sys.exc_info()
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error:
+            exc_type, exc_value, exc_tb = self._error
+            self._error = None
+            raise exc_type, exc_value, exc_tb
+
+    def close(self):
+        '''Upload the last segment, wait for the uploads to finish & write
+        the index of all the pages'''
+        if self._thread:
+            with self._lock:
+                self._flush()
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+            if not self._error:
+                self.client.put_object(
+                    Bucket=self.bucket, Key=self.key_index,
+                    Body=json.dumps({'segments': self.segment,
+                                     'pages': self.index}))
+        self._raise_error()
+
+    def _segment_indexes(self):
+        '''The page indexes of the segments in S3, in order. Segments are
+        uploaded in order, the first one missing is the end'''
+        n = 0
+        while True:
+            try:
+                body = self.client.get_object(
+                    Bucket=self.bucket,
+                    Key=self.key_segment_index(n))['Body'].read()
+            except ClientError as e:
+                if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+                    return
+                raise
+            yield json.loads(body)['pages']
+            n += 1
+
+    def restore(self, n_pages):
+        '''Read back pages 0 to n_pages - 1 from S3, for resuming a harvest.
+        Returns a list of the list of records for each page. The index only
+        keeps those pages, new segments are numbered after any existing ones.
+        A page in more than one segment was written again after a resume,
+        the last segment has it.
+        '''
+        self.segment = 0
+        self.index = {}
+        for segment_index in self._segment_indexes():
+            self.segment += 1
+            self.index.update((int(page), loc)
+                              for page, loc in segment_index.items()
+                              if int(page) < n_pages)
+        bodies = {}
+        pages = []
+        for page in range(n_pages):
+            segment, offset, length, n_records = self.index[page]
+            if segment not in bodies:
+                bodies[segment] = decompress(self.client.get_object(
+                    Bucket=self.bucket,
+                    Key=self.key_segment(segment))['Body'].read())
+            pages.append(
+                bodies[segment][offset:offset + length].splitlines())
+        return pages
+
@@ -59,6 +59,16 @@ def def_args():
         type=str,
         default=None,
         help='The page range as a comma separated pair of numbers')
+    parser.add_argument(
+        '--identifiers',
+        type=str,
+        default=None,
+        help='File of the OAI identifiers to harvest, one per line, '
+        'instead of the whole collection')
+    parser.add_argument(
+        '--skip_remove_deleted',
+        action='store_true',
+        help='Leave the records not in this harvest in the collection')
     return parser
 
 
@@ -73,7 +83,9 @@ def main(
         job_timeout=86400,  # 24 hrs
         rq_queue=None,
         run_image_harvest=False,
-        page_range=None):
+        page_range=None,
+        identifiers=None,
+        remove_deleted=True):
     timeout_dt = datetime.timedelta(seconds=timeout) if timeout else \
         datetime.timedelta(seconds=TIMEOUT)
     start_time = datetime.datetime.now()
@@ -89,6 +101,10 @@ def main(
         rq_queue,
         connection=get_redis_connection(redis_host, redis_port, redis_pswd))
     url_api_collection = [u.strip() for u in url_api_collection.split(';')]
+    if isinstance(identifiers, basestring):
+        # the workers don't have the file
+        with open(identifiers) as foo:
+            identifiers = [line.strip() for line in foo if line.strip()]
     results = []
     for url in url_api_collection:
         result = rQ.enqueue_call(
@@ -97,7 +113,9 @@ def main(
             kwargs={
                 'run_image_harvest': run_image_harvest,
                 'rq_queue': rq_queue,
-                'page_range': page_range
+                'page_range': page_range,
+                'identifiers': identifiers,
+                'remove_deleted': remove_deleted
             },
             timeout=job_timeout, )
         results.append(result)
@@ -120,4 +138,6 @@ if __name__ == '__main__':
         rq_queue=args.rq_queue,
         job_timeout=args.job_timeout,
         run_image_harvest=args.run_image_harvest,
-        page_range=args.page_range)
+        page_range=args.page_range,
+        identifiers=args.identifiers,
+        remove_deleted=not args.skip_remove_deleted)
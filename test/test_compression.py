@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, skipUnless
+from harvester import compression
+
+
+class CompressionTestCase(TestCase):
+    '''Test the compression of harvested pages'''
+
+    def setUp(self):
+        self.dir_save = tempfile.mkdtemp()
+        self.data = '{"id": "1"}\n{"id": "2"}\n'
+
+    def tearDown(self):
+        shutil.rmtree(self.dir_save)
+
+    def testCheckCompression(self):
+        compression.check_compression(None)
+        compression.check_compression('gzip')
+        self.assertRaises(ValueError, compression.check_compression, 'lzma')
+
+    def testUncompressedPassThrough(self):
+        self.assertEqual(compression.compress(self.data, None), self.data)
+        self.assertEqual(compression.decompress(self.data), self.data)
+
+    def testGzip(self):
+        data = compression.compress(self.data, 'gzip')
+        self.assertTrue(data.startswith(compression.GZIP_MAGIC))
+        self.assertEqual(compression.decompress(data), self.data)
+        self.assertEqual(compression.loads_jsonl(data),
+                         [{'id': '1'}, {'id': '2'}])
+
+    @skipUnless(compression.zstandard, 'zstandard not installed')
+    def testZstd(self):
+        data = compression.compress(self.data, 'zstd')
+        self.assertTrue(data.startswith(compression.ZSTD_MAGIC))
+        self.assertEqual(compression.decompress(data), self.data)
+
+    def testOpenWriteAndLoad(self):
+        '''Test that objset files are read the same compressed or not'''
+        for comp in (None, 'gzip'):
+            filename = os.path.join(self.dir_save, 'objset' +
+                                    compression.EXTENSIONS[comp])
+            with compression.open_write(filename, comp) as foo:
+                foo.write('[')
+                foo.write('{"id": "1"}')
+                foo.write(']')
+            self.assertEqual(compression.load_objset(filename), [{'id': '1'}])
+        self.assertEqual(list(compression.iter_objsets(self.dir_save)),
+                         [[{'id': '1'}], [{'id': '1'}]])
@@ -9,6 +9,7 @@ from harvester.config import config
 from harvester.post_processing.couchdb_runner import COUCHDB_VIEW
 from harvester.post_processing.couchdb_runner import CouchDBWorker
 from harvester.post_processing.couchdb_runner import CouchDBJobEnqueue
+from harvester.rate_limit import HostRateLimiter
 
 
 class CouchDBWorkerTestCase(TestCase):
@@ -49,8 +50,11 @@ class CouchDBWorkerTestCase(TestCase):
                 content_type='application/json',
                 )
 
-        results = self._cdbworker.run_by_collection('5112', self.function,
-                'arg1', 'arg2', kwarg1='1', kwarg2=2)
+        with patch('harvester.rate_limit.time.sleep') as mock_sleep:
+            results = self._cdbworker.run_by_collection('5112',
+                    self.function, 'arg1', 'arg2', kwarg1='1', kwarg2=2)
+        # couchdb isn't rate limited unless HARVEST_RATE_LIMITS has its host
+        self.assertFalse(mock_sleep.called)
         self.assertEqual(len(results), 3)
         self.assertEqual(results[1][0], '5112--http://ark.cdlib.org/ark:/13030/kt7779r8zj')
         self.assertEqual(results[1][1][1], ('arg1', 'arg2'))
@@ -58,6 +62,31 @@ class CouchDBWorkerTestCase(TestCase):
         doc = results[0][1][0]
         self.assertEqual(doc['isShownAt'], 'http://www.coronado.ca.us/library/')
 
+    @httpretty.activate
+    def testCollectionRateLimited(self):
+        '''Test that the couchdb host is limited when HARVEST_RATE_LIMITS
+        has a rate for it, not by the default rate'''
+        url_to_pretty = os.path.join(self.url_couch_base, self.cdb,
+                '_design', COUCHDB_VIEW.split('/')[0],
+                '_view', COUCHDB_VIEW.split('/')[1])
+        httpretty.register_uri(httpretty.GET,
+                re.compile(url_to_pretty+".*$"),
+                body=open(DIR_FIXTURES+'/couchdb_by_provider_name-5112.json').read(),
+                content_type='application/json',
+                )
+        host = HostRateLimiter.host(self.url_couch_base)
+        self._cdbworker._rate_limiter = HostRateLimiter(
+                rates={'other.edu': 1}, default_rate=1)
+        with patch('harvester.rate_limit.time.sleep') as mock_sleep:
+            self._cdbworker.run_by_collection('5112', self.function)
+        self.assertFalse(mock_sleep.called)
+        self._cdbworker._rate_limiter = HostRateLimiter(rates={host: 1})
+        with patch('harvester.rate_limit.time.sleep') as mock_sleep:
+            results = self._cdbworker.run_by_collection('5112',
+                    self.function)
+        self.assertEqual(len(results), 3)
+        self.assertTrue(mock_sleep.called)
+
 
 class CouchDBJobEnqueueTestCase(TestCase):
     #@patch('redis.client.Redis', autospec=True)
@@ -0,0 +1,29 @@
+from unittest import TestCase
+import harvester.fetcher as fetcher
+from harvester.fetcher.registry import FetcherRegistry
+
+
+class FetcherRegistryTestCase(TestCase):
+    '''Test the lazy harvest type registry'''
+
+    def testLookup(self):
+        registry = FetcherRegistry({'XML': 'xml_fetcher.XML_Fetcher',
+                                    'BAD': 'no_such_fetcher.Fetcher'})
+        self.assertEqual(len(registry), 2)
+        self.assertIn('BAD', registry)
+        self.assertNotIn('OAI', registry)
+        self.assertEqual(sorted(registry.keys()), ['BAD', 'XML'])
+        self.assertIs(registry['XML'], fetcher.XML_Fetcher)
+        self.assertIsNone(registry.get('OAI'))
+        self.assertRaises(KeyError, registry.__getitem__, 'OAI')
+        self.assertRaises(ImportError, registry.__getitem__, 'BAD')
+
+    def testHarvestTypes(self):
+        self.assertIs(fetcher.HARVEST_TYPES['OAI'], fetcher.OAIFetcher)
+        self.assertIs(fetcher.HARVEST_TYPES['SFX'],
+                      fetcher.PySolrQueryFetcher)
+        self.assertIn('NUX', fetcher.HARVEST_TYPES)
+
+    def testPackageExports(self):
+        self.assertIn('HarvestController', fetcher.__all__)
+        self.assertRaises(AttributeError, getattr, fetcher, 'NoSuchFetcher')
@@ -0,0 +1,110 @@
+import datetime
+from unittest import TestCase
+from mock import patch
+from test.utils import DictRedis
+from harvester.harvest_state import HarvestCheckpoint, get_redis_connection
+from harvester.harvest_state import ValidatorCache, HighWaterMark
+from harvester.harvest_state import RecordHashIndex
+
+
+class GetRedisConnectionTestCase(TestCase):
+    '''Test the redis connection for the harvest state'''
+
+    @patch('harvester.harvest_state.Redis')
+    def testConnectionFromConfig(self, mock_redis):
+        get_redis_connection({
+            'redis_host': 'test_host',
+            'redis_port': '6380',
+            'redis_password': 'pswd',
+            'redis_connect_timeout': 10
+        })
+        mock_redis.assert_called_with(
+            host='test_host',
+            port='6380',
+            password='pswd',
+            socket_connect_timeout=10)
+
+
+class HarvestCheckpointTestCase(TestCase):
+    '''Test the checkpoint for a collection harvest'''
+
+    def setUp(self):
+        self.redis = DictRedis()
+        self.checkpoint = HarvestCheckpoint('197', redis=self.redis)
+
+    def testNoCheckpoint(self):
+        self.assertIsNone(self.checkpoint.load())
+
+    def testSaveLoadClear(self):
+        state = {
+            'cursor': {'resumptionToken': 'xyz', 'offset': 3},
+            'objset_page': 10,
+            'num_records': 1000
+        }
+        self.checkpoint.save(state)
+        self.assertIn('ucldc:harvester:checkpoint:197', self.redis.data)
+        self.assertEqual(self.checkpoint.load(), state)
+        # other collections have their own checkpoint
+        self.assertIsNone(HarvestCheckpoint('1', redis=self.redis).load())
+        self.checkpoint.clear()
+        self.assertIsNone(self.checkpoint.load())
+
+
+class ValidatorCacheTestCase(TestCase):
+    '''Test the HTTP validator cache for static-file sources'''
+
+    def testGetSet(self):
+        redis = DictRedis()
+        cache = ValidatorCache(redis=redis)
+        url = 'http://example.edu/marc.mrc'
+        self.assertIsNone(cache.get(url))
+        validators = {'etag': '"abc"', 'last_modified': None, 'sha1': 'f00'}
+        cache.set(url, validators)
+        self.assertEqual(cache.get(url), validators)
+        self.assertEqual(len(redis.data), 1)
+        self.assertTrue(redis.data.keys()[0].startswith(
+            'ucldc:harvester:validators:'))
+        self.assertIsNone(cache.get('http://example.edu/other.mrc'))
+
+
+class HighWaterMarkTestCase(TestCase):
+    '''Test the high water mark for incremental harvests'''
+
+    def testSaveLoadClear(self):
+        redis = DictRedis()
+        mark = HighWaterMark('197', redis=redis)
+        self.assertIsNone(mark.load())
+        mark.save(datetime.datetime(2017, 7, 14, 12, 1, 30, 500))
+        self.assertEqual(mark.load(), '2017-07-14T12:01:30Z')
+        self.assertIn('ucldc:harvester:high-water-mark:197', redis.data)
+        self.assertIsNone(HighWaterMark('1', redis=redis).load())
+        mark.clear()
+        self.assertIsNone(mark.load())
+
+
+class RecordHashIndexTestCase(TestCase):
+    '''Test the index of the record hashes of the last ingest'''
+
+    def testIndex(self):
+        redis = DictRedis()
+        index = RecordHashIndex('197', redis=redis)
+        self.assertEqual(index.load(), set())
+        # nothing harvested, nothing to commit
+        index.commit()
+        self.assertEqual(index.load(), set())
+        index.start()
+        index.add(['a', 'b'])
+        index.add([])
+        # not replaced until committed
+        self.assertEqual(index.load(), set())
+        index.commit()
+        self.assertEqual(index.load(), set(['a', 'b']))
+        self.assertIn('ucldc:harvester:record-hashes:197', redis.data)
+        index.start()
+        index.add(['b', 'c'])
+        self.assertEqual(index.load(), set(['a', 'b']))
+        index.commit()
+        self.assertEqual(index.load(), set(['b', 'c']))
+        self.assertEqual(RecordHashIndex('1', redis=redis).load(), set())
+        index.clear()
+        self.assertEqual(index.load(), set())
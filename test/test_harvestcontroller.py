@@ -5,14 +5,18 @@ import shutil
 import re
 import json
 import datetime
+from StringIO import StringIO
 from mypretty import httpretty
 # import httpretty
-from mock import patch
+from mock import patch, MagicMock
 from test.utils import ConfigFileOverrideMixin, LogOverrideMixin
+from test.utils import DictRedis
 from test.utils import DIR_FIXTURES, TEST_COUCH_DASHBOARD, TEST_COUCH_DB
 import harvester.fetcher as fetcher
 from harvester.collection_registry_client import Collection
 from harvester.fetcher.controller import HarvestController
+from harvester.harvest_state import HarvestCheckpoint
+from harvester import compression
 
 
 class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
@@ -96,6 +100,25 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
             HarvestController.jsonl(objset),
             '{"x": "y", "z": "a", "b": [1, 2, 3]}\n')
 
+    def test_serialize_objset(self):
+        '''Test that the objects are serialized once with the shared
+        registry data spliced in'''
+        objset = [
+            self.controller_oai._add_registry_data({'id': 'a', 'x': [1, 2]}),
+            self.controller_oai._add_registry_data({}),
+        ]
+        records = self.controller_oai.serialize_objset(objset)
+        self.assertEqual(len(records), 2)
+        self.assertEqual([json.loads(r) for r in records],
+                         json.loads(json.dumps(objset)))
+        self.assertEqual(
+            self.controller_oai.serialize_objset({'z': 'y'}), ['{"z": "y"}'])
+        self.controller_oai.save_objset(objset, records=records)
+        dir_list = os.listdir(self.controller_oai.dir_save)
+        objset_saved = json.load(
+            open(os.path.join(self.controller_oai.dir_save, dir_list[0])))
+        self.assertEqual(objset_saved, json.loads(json.dumps(objset)))
+
     @httpretty.activate
     @patch('boto3.resource', autospec=True)
     def testSaveToS3(self, mock_boto3):
@@ -148,6 +171,7 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
             self.assertIn("fetch_process/end_time", call_args)
             self.assertIn("fetch_process/total_items=0", call_args)
             self.assertIn("fetch_process/total_collections=None", call_args)
+            self.assertIn("fetch_process/metrics", call_args)
 
     @patch('dplaingestion.couch.Couch')
     def testCreateIngestCouch(self, mock_couch):
@@ -285,6 +309,21 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
         self.assertEqual(obj['collection'][0]['repository'][0]['@id'],
                          'https://registry.cdlib.org/api/v1/repository/37/')
 
+    def testRegistryDataBuiltOnce(self):
+        '''The registry block is built once and shared by the objects'''
+        with patch.object(
+                self.controller_oai,
+                '_build_registry_data',
+                wraps=self.controller_oai._build_registry_data) as mock_build:
+            obj1 = self.controller_oai._add_registry_data({'id': '1'})
+            obj2 = self.controller_oai._add_registry_data(
+                {'id': '2', 'collection': 'source coll'})
+        self.assertEqual(mock_build.call_count, 1)
+        self.assertIs(obj1['collection'], obj2['collection'])
+        self.assertEqual(obj2['source_collection_name'], 'source coll')
+        self.assertEqual(obj1['collection'][0]['campus'][0]['@id'],
+                         'https://registry.cdlib.org/api/v1/campus/12/')
+
     @patch('boto3.resource', autospec=True)
     def testObjectsHaveRegistryData(self, mock_boto3):
         '''Test that the registry data is being attached to objects from
@@ -326,6 +365,272 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
             }]
         }])
 
+    @patch('boto3.resource', autospec=True)
+    def testPipelinedHarvest(self, mock_boto3):
+        '''Test that the pipelined harvest saves all the objsets to disk &
+        S3 from the save worker threads'''
+        self.controller_oai.pipeline_depth = 4
+        self.controller_oai.save_workers = 2
+        # create the child mocks here, the save workers racing to create
+        # them lazily can lose calls on the mocks they throw away
+        put_object = mock_boto3.return_value.Bucket.return_value.put_object
+        n = self.controller_oai.harvest()
+        self.assertEqual(n, 128)
+        dir_list = os.listdir(self.controller_oai.dir_save)
+        self.assertEqual(len(dir_list), 128)
+        # call_count isn't thread safe, count the calls in call_args_list
+        keys = sorted(c[1]['Key'] for c in put_object.call_args_list)
+        self.assertEqual(
+            keys,
+            sorted(self.controller_oai.s3path + 'page-{}.jsonl'.format(i)
+                   for i in range(128)))
+        self.assertEqual(self.controller_oai._save_threads, [])
+
+    @patch('boto3.resource', autospec=True)
+    def testPipelinedHarvestSaveError(self, mock_boto3):
+        '''Test that an error in a save worker is raised in the harvest'''
+        self.controller_oai.pipeline_depth = 2
+        with patch.object(
+                self.controller_oai,
+                'save_objset',
+                side_effect=IOError('disk full')):
+            self.assertRaises(IOError, self.controller_oai.harvest)
+        self.assertEqual(self.controller_oai._save_threads, [])
+
+    @patch('boto3.resource', autospec=True)
+    def testFetcherClosed(self, mock_boto3):
+        '''Test that the fetcher is closed when the harvest fails'''
+        with patch.object(self.controller_oai.fetcher, 'close') as close, \
+                patch.object(self.controller_oai, 'save_objset',
+                             side_effect=IOError('disk full')):
+            self.assertRaises(IOError, self.controller_oai.harvest)
+        close.assert_called_once_with()
+
+    @patch('boto3.client', autospec=True)
+    @patch('boto3.resource', autospec=True)
+    def testS3SegmentsHarvest(self, mock_boto3, mock_client):
+        '''Test that objsets are rolled up into S3 segments'''
+        self.controller_oai.s3_segment_records = 50
+        self.controller_oai.pipeline_depth = 4
+        self.controller_oai.save_workers = 2
+        n = self.controller_oai.harvest()
+        self.assertEqual(n, 128)
+        self.assertEqual(len(os.listdir(self.controller_oai.dir_save)), 128)
+        self.assertEqual(mock_boto3().Bucket().put_object.call_count, 0)
+        put_object = mock_client('s3').put_object
+        keys = [c[1]['Key'] for c in put_object.call_args_list]
+        segments = [self.controller_oai.s3path + 'segment-{}.jsonl'.format(i)
+                    for i in range(3)]
+        self.assertEqual(sorted(set(keys)), sorted(segments + [
+            self.controller_oai.s3path + 'segment-{}.index.json'.format(i)
+            for i in range(3)] + [
+            self.controller_oai.s3path + 'segments-index.json']))
+        n_lines = sum(len(c[1]['Body'].splitlines())
+                      for c in put_object.call_args_list
+                      if c[1]['Key'] in segments)
+        self.assertEqual(n_lines, 128)
+        self.assertIsNone(self.controller_oai._s3_writer)
+
+    @patch('boto3.resource', autospec=True)
+    def testRegroupedHarvest(self, mock_boto3):
+        '''Test that the records fetched one at a time are saved in objsets
+        of objset_records'''
+        self.controller_oai.objset_records = 50
+        n = self.controller_oai.harvest()
+        self.assertEqual(n, 128)
+        dir_list = os.listdir(self.controller_oai.dir_save)
+        self.assertEqual(sorted(
+            len(json.load(open(os.path.join(self.controller_oai.dir_save,
+                                            fname))))
+            for fname in dir_list), [28, 50, 50])
+        self.assertEqual(mock_boto3().Bucket().put_object.call_count, 3)
+        self.assertEqual(self.controller_oai.metrics.pages, 3)
+
+    def testRegroup(self):
+        '''Test that records, pages & lazy objsets are regrouped & that the
+        cursor is only given where a fetched objset ends'''
+        def lazy_objset():
+            for i in (5, 6, 7):
+                yield {'id': i}
+
+        def fetched():
+            return [{'id': 1}, [{'id': 2}, {'id': 3}, {'id': 4}],
+                    lazy_objset()]
+
+        self.controller_oai.checkpoint = MagicMock()
+        expected = [([1, 2], None), ([3, 4], 'cursor'), ([5, 6], None),
+                    ([7], 'cursor')]
+        with patch.object(self.controller_oai.fetcher, 'get_cursor',
+                          return_value='cursor'):
+            self.controller_oai.objset_records = 2
+            self.assertEqual(
+                [([obj['id'] for obj in objset], cursor) for objset, cursor
+                 in self.controller_oai._regroup(fetched())], expected)
+            # '{"id": 1}' is 9 bytes
+            self.controller_oai.objset_records = None
+            self.controller_oai.objset_size = 18
+            self.assertEqual(
+                [([obj['id'] for obj in objset], cursor) for objset, cursor
+                 in self.controller_oai._regroup(fetched())], expected)
+
+    @httpretty.activate
+    def testRegroupLazy(self):
+        '''Test that fetchers that can stream their objsets are asked to
+        when the records are regrouped'''
+        with patch.object(fetcher.OAIFetcher, 'streamed', True), \
+                patch.object(fetcher.OAIFetcher, '__init__',
+                             return_value=None) as init:
+            fetcher.HarvestController(
+                'email@example.com', self.collection,
+                config_file=self.config_file, profile_path=self.profile_path,
+                objset_records=500)
+            self.assertTrue(init.call_args[1]['lazy'])
+            fetcher.HarvestController(
+                'email@example.com', self.collection,
+                config_file=self.config_file, profile_path=self.profile_path)
+            self.assertNotIn('lazy', init.call_args[1])
+
+    @patch('boto3.resource', autospec=True)
+    def testCompressedHarvest(self, mock_boto3):
+        '''Test that the objset files & S3 pages can be gzipped'''
+        self.controller_oai.file_compression = 'gzip'
+        self.controller_oai.s3_compression = 'gzip'
+        self.controller_oai.harvest()
+        dir_list = os.listdir(self.controller_oai.dir_save)
+        self.assertEqual(len(dir_list), 128)
+        self.assertTrue(dir_list[0].endswith('.gz'))
+        objset = compression.load_objset(
+            os.path.join(self.controller_oai.dir_save, dir_list[0]))
+        self.assertEqual(objset[0]['collection'][0]['@id'],
+                         'https://registry.cdlib.org/api/v1/collection/197/')
+        put_object = mock_boto3().Bucket().put_object
+        kwargs = put_object.call_args_list[0][1]
+        self.assertEqual(kwargs['Key'],
+                         self.controller_oai.s3path + 'page-0.jsonl.gz')
+        self.assertEqual(len(compression.loads_jsonl(kwargs['Body'])), 1)
+
+    def testUnknownCompression(self):
+        self.assertRaises(
+            ValueError,
+            fetcher.HarvestController,
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            s3_compression='lzma')
+
+    @httpretty.activate
+    def testUnknownHarvestType(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            "https://registry.cdlib.org/api/v1/collection/197/",
+            body=open(DIR_FIXTURES + '/collection_api_test_bad_type.json')
+            .read())
+        collection = Collection(
+            'https://registry.cdlib.org/api/v1/collection/197/')
+        self.assertRaises(
+            ValueError,
+            fetcher.HarvestController,
+            'email@example.com',
+            collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            incremental=True)
+
+    @patch('boto3.resource', autospec=True)
+    def testHarvestMetrics(self, mock_boto3):
+        '''Test that the harvest records its metrics'''
+        self.controller_oai.harvest()
+        summary = self.controller_oai.metrics.summary()
+        self.assertEqual(summary['records'], 128)
+        self.assertEqual(summary['pages'], 128)
+        # ListMetadataFormats & the single ListRecords page
+        self.assertEqual(summary['requests'], 2)
+        self.assertGreater(summary['bytes_received'], 0)
+        self.assertEqual(
+            sorted(summary['stage_seconds'].keys()),
+            ['disk_save', 'fetch', 'registry', 's3_save', 'serialize'])
+
+    def testCheckpointInPageOrder(self):
+        '''Test that pages saved out of order only checkpoint once the
+        pages before them are saved'''
+        self.controller_oai.checkpoint = HarvestCheckpoint(
+            '197', redis=DictRedis())
+        self.controller_oai._page_saved(1, {'objset_page': 2})
+        self.assertIsNone(self.controller_oai.checkpoint.load())
+        self.controller_oai._page_saved(0, {'objset_page': 1})
+        self.assertEqual(self.controller_oai.checkpoint.load(),
+                         {'objset_page': 2})
+        self.controller_oai._page_saved(3, {'objset_page': 4})
+        self.controller_oai._page_saved(2, {'objset_page': 3})
+        self.assertEqual(self.controller_oai.checkpoint.load(),
+                         {'objset_page': 4})
+
+    @httpretty.activate
+    @patch('boto3.resource', autospec=True)
+    @patch('harvester.fetcher.controller.get_redis_connection')
+    def testCheckpointResume(self, mock_redis, mock_boto3):
+        '''Test that an interrupted harvest resumes from the checkpoint,
+        into the same S3 prefix with the pages already fetched restored to
+        the new dir_save'''
+        httpretty.register_uri(
+            httpretty.GET,
+            re.compile("http://content.cdlib.org/oai?.*"),
+            body=open(DIR_FIXTURES + '/testOAI-128-records.xml').read())
+        mock_redis.return_value = DictRedis()
+        bodies = {}
+        errors = [IOError('S3 down')]
+
+        def put_object(Body, Key):
+            if len(bodies) == 50 and errors:
+                raise errors.pop()
+            bodies[Key] = Body
+
+        bucket = mock_boto3().Bucket()
+        bucket.put_object.side_effect = put_object
+        controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            checkpoint=True)
+        self.assertRaises(IOError, controller.harvest)
+        state = controller.checkpoint.load()
+        self.assertEqual(state['objset_page'], 50)
+        self.assertEqual(state['num_records'], 50)
+        self.assertEqual(state['cursor'],
+                         {'resumptionToken': None, 'offset': 50})
+        shutil.rmtree(controller.dir_save)
+
+        def s3_object(bucket_name, key):
+            obj = MagicMock()
+            obj.get.return_value = {'Body': StringIO(bodies[key])}
+            return obj
+
+        mock_boto3().Object.side_effect = s3_object
+        controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            checkpoint=True)
+        n = controller.harvest()
+        self.assertEqual(n, 128)
+        self.assertEqual(len(bodies), 128)
+        self.assertEqual(
+            sorted(bodies.keys()),
+            sorted('data-fetched/197/2017-07-14-1201/page-{}.jsonl'.format(i)
+                   for i in range(128)))
+        dir_list = os.listdir(controller.dir_save)
+        self.assertEqual(len(dir_list), 128)
+        ids = set()
+        for fname in dir_list:
+            objset = json.load(open(os.path.join(controller.dir_save, fname)))
+            ids.update(obj['id'] for obj in objset)
+        self.assertEqual(len(ids), 128)
+        self.assertIsNone(controller.checkpoint.load())
+        shutil.rmtree(controller.dir_save)
+
     @httpretty.activate
     def testFailsIfNoRecords(self):
         '''Test that the Controller throws an error if no records come back
@@ -349,6 +654,131 @@ class HarvestControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
         self.assertRaises(fetcher.NoRecordsFetchedException,
                           controller.harvest)
 
+    @httpretty.activate
+    @patch('boto3.resource', autospec=True)
+    @patch('harvester.fetcher.controller.get_redis_connection')
+    def testIncrementalHarvest(self, mock_redis, mock_boto3):
+        '''Test that an incremental harvest starts from the high water
+        mark of the last successful harvest'''
+        httpretty.register_uri(
+            httpretty.GET,
+            re.compile("http://content.cdlib.org/oai?.*"),
+            body=open(DIR_FIXTURES + '/testOAI-128-records.xml').read())
+        mock_redis.return_value = DictRedis()
+        controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            incremental=True)
+        self.assertIsNone(controller.modified_since)
+        self.assertNotIn('from', httpretty.last_request().querystring)
+        self.assertEqual(controller.harvest(), 128)
+        shutil.rmtree(controller.dir_save)
+        # the mark is saved once the ingest has saved the records
+        self.assertIsNone(controller.high_water_mark.load())
+        controller.commit_high_water_mark()
+        mark = controller.high_water_mark.load()
+        self.assertRegexpMatches(mark, r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\dZ$')
+        controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            incremental=True)
+        self.assertEqual(controller.modified_since, mark)
+        self.assertEqual(httpretty.last_request().querystring['from'],
+                         [mark[:10]])
+        self.assertEqual(controller.harvest(), 128)
+        self.assertFalse(controller.source_unchanged)
+        shutil.rmtree(controller.dir_save)
+        # nothing changed since
+        httpretty.reset()
+        httpretty.register_uri(
+            httpretty.GET,
+            re.compile("http://content.cdlib.org/oai?.*ListMetadataFormats.*"),
+            body=open(DIR_FIXTURES + '/oai-fmts.xml').read(),
+            match_querystring=True)
+        httpretty.register_uri(
+            httpretty.GET,
+            re.compile("http://content.cdlib.org/oai?.*ListRecords.*"),
+            body=open(DIR_FIXTURES + '/testOAI-no-records-match.xml').read(),
+            match_querystring=True)
+        controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            incremental=True)
+        self.assertEqual(controller.harvest(), 0)
+        self.assertTrue(controller.source_unchanged)
+        shutil.rmtree(controller.dir_save)
+
+    @httpretty.activate
+    @patch('boto3.resource', autospec=True)
+    @patch('harvester.fetcher.controller.get_redis_connection')
+    def testSkipUnchanged(self, mock_redis, mock_boto3):
+        '''Test that records unchanged since the last ingest are not saved
+        again'''
+        httpretty.register_uri(
+            httpretty.GET,
+            re.compile("http://content.cdlib.org/oai?.*"),
+            body=open(DIR_FIXTURES + '/testOAI-128-records.xml').read())
+        mock_redis.return_value = DictRedis()
+
+        def harvest():
+            mock_boto3.reset_mock()
+            controller = fetcher.HarvestController(
+                'email@example.com',
+                self.collection,
+                config_file=self.config_file,
+                profile_path=self.profile_path,
+                skip_unchanged=True)
+            self.assertEqual(controller.harvest(), 128)
+            num_saved = len(os.listdir(controller.dir_save))
+            shutil.rmtree(controller.dir_save)
+            self.assertEqual(
+                mock_boto3().Bucket().put_object.call_count, num_saved)
+            return controller, num_saved
+
+        controller, num_saved = harvest()
+        self.assertEqual(num_saved, 128)
+        self.assertEqual(controller.num_unchanged, 0)
+        self.assertFalse(controller.source_unchanged)
+        # the ingest wasn't saved, nothing is skipped
+        controller, num_saved = harvest()
+        self.assertEqual(num_saved, 128)
+        controller.commit_record_hashes()
+        hashes = controller.record_hashes.load()
+        self.assertEqual(len(hashes), 128)
+        controller, num_saved = harvest()
+        self.assertEqual(num_saved, 0)
+        self.assertEqual(controller.num_unchanged, 128)
+        self.assertTrue(controller.source_unchanged)
+        controller.commit_record_hashes()
+        self.assertEqual(controller.record_hashes.load(), hashes)
+        # one record changed
+        mock_redis.return_value.data[controller.record_hashes.key].pop()
+        controller, num_saved = harvest()
+        self.assertEqual(num_saved, 1)
+        self.assertEqual(controller.num_unchanged, 127)
+        self.assertFalse(controller.source_unchanged)
+
+    def testRecordHash(self):
+        '''Test that the record hash leaves out the volatile fields'''
+        controller = self.controller_oai
+        controller._registry_data = controller._build_registry_data()
+        obj = {'id': 'x', 'title': ['A title'], 'datestamp': '2017-01-01'}
+        h = controller.record_hash(controller._add_registry_data(dict(obj)))
+        obj['datestamp'] = '2017-02-01'
+        self.assertEqual(
+            controller.record_hash(controller._add_registry_data(dict(obj))),
+            h)
+        obj['title'] = ['Another title']
+        self.assertNotEqual(
+            controller.record_hash(controller._add_registry_data(dict(obj))),
+            h)
+
 
 class FetcherClassTestCase(TestCase):
     '''Test the abstract Fetcher class'''
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from mypretty import httpretty
+from mock import patch
+import requests
+import harvester.fetcher as fetcher
+from harvester.fetcher.http_session import HarvestSession
+from test.utils import DIR_FIXTURES
+from test.utils import LogOverrideMixin
+
+
+class HarvestSessionTestCase(LogOverrideMixin, TestCase):
+    '''Test the pooled, retrying session the fetchers share'''
+
+    @patch.object(requests.Session, 'request')
+    def testDefaultTimeout(self, mock_request):
+        session = HarvestSession(timeout=(3, 30))
+        session.get('http://example.edu/feed')
+        self.assertEqual(mock_request.call_args[1]['timeout'], (3, 30))
+        session.get('http://example.edu/feed', timeout=5)
+        self.assertEqual(mock_request.call_args[1]['timeout'], 5)
+
+    @httpretty.activate
+    def testRetryRecorded(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/feed',
+            responses=[
+                httpretty.Response(body='busy', status=503),
+                httpretty.Response(body='busy', status=503),
+                httpretty.Response(body='ok'),
+            ])
+        h = fetcher.Fetcher('http://example.edu/feed', None)
+        h.session = HarvestSession(backoff_factor=0)
+        resp = h.requests_get('http://example.edu/feed')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.text, 'ok')
+        self.assertEqual(h.metrics.requests, 1)
+        self.assertEqual(h.metrics.retries, 2)
+
+    @httpretty.activate
+    def testRetriesExhausted(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/feed',
+            body='busy', status=503)
+        h = fetcher.Fetcher('http://example.edu/feed', None)
+        h.session = HarvestSession(retries=1, backoff_factor=0)
+        resp = h.requests_get('http://example.edu/feed')
+        self.assertEqual(resp.status_code, 503)
+        self.assertEqual(h.metrics.retries, 1)
+
+    def testSessionLazy(self):
+        h = fetcher.Fetcher('http://example.edu/feed', None)
+        self.assertIsInstance(h.session, HarvestSession)
+        self.assertIs(h.session, h.session)
+
+    def testLocalFile(self):
+        path = DIR_FIXTURES + '/eMuseum-page-1.xml'
+        h = fetcher.Fetcher(path, None)
+        self.assertEqual(h.urlopen_read(path), open(path).read())
@@ -11,6 +11,7 @@ from harvester.image_harvest import ImageHTTPError
 from harvester.image_harvest import IsShownByError
 from harvester.image_harvest import HasObject
 from harvester.image_harvest import RestoreFromObjectCache
+from harvester.rate_limit import HostRateLimiter
 
 #TODO: make this importable from md5s3stash
 StashReport = namedtuple('StashReport',
@@ -213,6 +214,37 @@ class ImageHarvestTestCase(TestCase):
         ret = image_harvester.stash_image(doc)
         self.assertEqual(ret, [r])
 
+    @patch('couchdb.Server')
+    @patch(
+        'md5s3stash.md5s3stash',
+        autospec=True,
+        return_value=StashReport('test url', 'md5 test value', 's3 url object',
+                                 'mime_type', 'dimensions'))
+    @httpretty.activate
+    def test_rate_limit(self, mock_stash, mock_couch):
+        '''Test that image requests are only rate limited if
+        HARVEST_RATE_LIMITS or HARVEST_RATE_LIMIT_DEFAULT sets a rate'''
+        url = 'http://getthisimage/image'
+        doc = {'_id': 'RATE_LIMIT', 'isShownBy': url}
+        httpretty.register_uri(
+            httpretty.HEAD,
+            url,
+            body='',
+            content_length='0',
+            content_type='image/jpeg;',
+            connection='close', )
+        for rates, default_rate, limited in (({}, None, False),
+                                             ({'getthisimage': 1}, None,
+                                              True),
+                                             ({}, 1, True)):
+            image_harvester = image_harvest.ImageHarvester(
+                url_cache={}, hash_cache={}, bucket_bases=['region:x'],
+                rate_limiter=HostRateLimiter(rates=rates,
+                                             default_rate=default_rate))
+            with patch('harvester.rate_limit.time.sleep') as mock_sleep:
+                image_harvester.stash_image(doc)
+            self.assertEqual(mock_sleep.called, limited)
+
     @patch('couchdb.Server')
     @patch(
         'md5s3stash.md5s3stash',
@@ -5,6 +5,8 @@ from mock import patch
 from harvester.collection_registry_client import Collection
 from test.utils import ConfigFileOverrideMixin, LogOverrideMixin
 from test.utils import DIR_FIXTURES
+from test.utils import DictRedis
+from harvester.harvest_state import ValidatorCache
 from mypretty import httpretty
 # import httpretty
 import harvester.fetcher as fetcher
@@ -35,6 +37,56 @@ class MARCFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertEqual(len(rec['fields']), 21)
 
 
+class MARCFetcherConditionalGetTestCase(LogOverrideMixin, TestCase):
+    '''Test skipping MARC files that haven't changed since the last
+    harvest'''
+
+    def setUp(self):
+        super(MARCFetcherConditionalGetTestCase, self).setUp()
+        self.cache = ValidatorCache(redis=DictRedis())
+        self.url = 'http://example.edu/marc-test'
+        self.marc = open(DIR_FIXTURES + '/marc-test').read()
+
+    @httpretty.activate
+    def testNotModified(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            self.url,
+            responses=[
+                httpretty.Response(body=self.marc, etag='"v1"'),
+                httpretty.Response(body='', status=304),
+            ])
+        h = fetcher.MARCFetcher(self.url, None, validator_cache=self.cache)
+        self.assertFalse(h.source_unchanged)
+        self.assertEqual(len(list(h)), 10)
+        h.commit_validators()
+        self.assertEqual(self.cache.get(self.url)['etag'], '"v1"')
+        h = fetcher.MARCFetcher(self.url, None, validator_cache=self.cache)
+        self.assertEqual(
+            httpretty.last_request().headers['If-None-Match'], '"v1"')
+        self.assertTrue(h.source_unchanged)
+        self.assertEqual(list(h), [])
+
+    @httpretty.activate
+    def testContentUnchanged(self):
+        '''Without validators from the server, the content hash is
+        compared'''
+        httpretty.register_uri(httpretty.GET, self.url, body=self.marc)
+        h = fetcher.MARCFetcher(self.url, None, validator_cache=self.cache)
+        self.assertFalse(h.source_unchanged)
+        # not committed, the harvest didn't finish
+        h = fetcher.MARCFetcher(self.url, None, validator_cache=self.cache)
+        self.assertFalse(h.source_unchanged)
+        h.commit_validators()
+        h = fetcher.MARCFetcher(self.url, None, validator_cache=self.cache)
+        self.assertNotIn('If-None-Match', httpretty.last_request().headers)
+        self.assertTrue(h.source_unchanged)
+        httpretty.register_uri(httpretty.GET, self.url,
+                               body=self.marc.replace('Iranian', 'Persian'))
+        h = fetcher.MARCFetcher(self.url, None, validator_cache=self.cache)
+        self.assertFalse(h.source_unchanged)
+
+
 class AlephMARCXMLFetcherTestCase(LogOverrideMixin, TestCase):
     @httpretty.activate
     def testInit(self):
@@ -104,6 +156,98 @@ class Harvest_MARC_ControllerTestCase(ConfigFileOverrideMixin,
         self.assertEqual(num, 10)
         self.tearDown_config()
 
+    @httpretty.activate
+    @patch('boto3.resource', autospec=True)
+    @patch('harvester.fetcher.controller.get_redis_connection')
+    def testMARCHarvestUnchanged(self, mock_redis, mock_boto3):
+        '''Test that a harvest of an unchanged MARC file saves nothing'''
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://registry.cdlib.org/api/v1/collection/',
+            body=open(DIR_FIXTURES + '/collection_api_test_marc.json').read())
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/marc-test',
+            body=open(DIR_FIXTURES + '/marc-test').read(),
+            last_modified='Tue, 01 Apr 1997 11:33:37 GMT')
+        mock_redis.return_value = DictRedis()
+        self.collection = Collection(
+            'http://registry.cdlib.org/api/v1/collection/')
+        self.collection.url_harvest = 'http://example.edu/marc-test'
+        self.setUp_config(self.collection)
+        controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            conditional_get=True)
+        self.assertEqual(controller.harvest(), 10)
+        self.assertFalse(controller.source_unchanged)
+        shutil.rmtree(controller.dir_save)
+        # the validators are committed once the records are saved
+        self.assertFalse(fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            conditional_get=True).source_unchanged)
+        controller.commit_validators()
+        bucket = mock_boto3().Bucket()
+        bucket.put_object.reset_mock()
+        self.controller = fetcher.HarvestController(
+            'email@example.com',
+            self.collection,
+            config_file=self.config_file,
+            profile_path=self.profile_path,
+            conditional_get=True)
+        self.assertEqual(
+            httpretty.last_request().headers['If-Modified-Since'],
+            'Tue, 01 Apr 1997 11:33:37 GMT')
+        self.assertTrue(self.controller.source_unchanged)
+        self.assertEqual(self.controller.harvest(), 0)
+        self.assertEqual(bucket.put_object.call_count, 0)
+        self.tearDown_config()
+
+    @httpretty.activate
+    @patch('boto3.resource', autospec=True)
+    @patch('harvester.fetcher.controller.get_redis_connection')
+    @patch('dplaingestion.couch.Couch')
+    def testMainChangedSource(self, mock_couch, mock_redis, mock_boto3):
+        '''Test that the harvester main reports a changed source as
+        changed. The harvest doesn't commit the validators, the harvester
+        returned has them for run_ingest to commit.'''
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://registry.cdlib.org/api/v1/collection/',
+            body=open(DIR_FIXTURES + '/collection_api_test_marc.json').read())
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/marc-test',
+            body=open(DIR_FIXTURES + '/marc-test').read(),
+            etag='"v1"')
+        mock_redis.return_value = DictRedis()
+        mock_couch.return_value._create_ingestion_document.return_value = \
+            'test-id'
+        self.collection = Collection(
+            'http://registry.cdlib.org/api/v1/collection/')
+        self.setUp_config(self.collection)
+        with patch('harvester.fetcher.controller.Collection') as collection:
+            collection.return_value = self.collection
+            self.collection.url_harvest = 'http://example.edu/marc-test'
+            ingest_doc_id, num, dir_save, self.controller = fetcher.main(
+                'email@example.com',
+                'http://registry.cdlib.org/api/v1/collection/',
+                log_handler=self.test_log_handler,
+                mail_handler=self.test_log_handler,
+                profile_path=self.profile_path,
+                config_file=self.config_file,
+                conditional_get=True)
+        self.assertEqual(num, 10)
+        self.assertFalse(self.controller.source_unchanged)
+        self.assertEqual(self.controller.fetcher.validators_fetched[
+            'http://example.edu/marc-test']['etag'], '"v1"')
+        self.tearDown_config()
+
 
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+from StringIO import StringIO
+from xml.etree import ElementTree as ET
+from lxml import etree
+import pymarc
+from test.utils import DIR_FIXTURES
+from harvester.fetcher.marcxml import records_to_dicts, record_to_dict
+
+MARC_RECORD = '''<record xmlns="http://www.loc.gov/MARC21/slim">
+  <controlfield tag="1">1234</controlfield>
+  <!-- comments are skipped -->
+  <datafield tag="245" ind1="1">
+    <subfield code="a">Título</subfield>
+    <subfield code="b"></subfield>
+  </datafield>
+</record>'''
+
+
+class MARCXMLTestCase(TestCase):
+    '''Test the conversion of MARCXML elements to pymarc dicts'''
+
+    def assertSameAsPymarc(self, xml):
+        expected = [rec.as_dict() for rec in
+                    pymarc.parse_xml_to_array(StringIO(xml))
+                    if rec is not None]
+        self.assertTrue(expected)
+        self.assertEqual(records_to_dicts(ET.fromstring(xml)), expected)
+        self.assertEqual(records_to_dicts(etree.fromstring(xml)), expected)
+
+    def testSameAsPymarc(self):
+        for name in ('ucsb-aleph-resp-1-3.xml', 'testOAI-tind.xml'):
+            self.assertSameAsPymarc(open(DIR_FIXTURES + '/' + name).read())
+        self.assertSameAsPymarc(MARC_RECORD)
+
+    def testRecord(self):
+        rec = record_to_dict(etree.fromstring(MARC_RECORD))
+        self.assertEqual(rec['leader'], '          22        4500')
+        self.assertEqual(rec['fields'], [
+            {'001': u'1234'},
+            {'245': {'ind1': u'1', 'ind2': u' ',
+                     'subfields': [{'a': u'T\xedtulo'},
+                                   {'b': u''}]}}])
@@ -0,0 +1,43 @@
+from unittest import TestCase
+from harvester.fetcher.metrics import FetchMetrics
+import harvester.fetcher as fetcher
+
+
+class FetchMetricsTestCase(TestCase):
+    '''Test the harvest metrics collector'''
+
+    def testSummary(self):
+        metrics = FetchMetrics()
+        metrics.record_request(0.5, 1000)
+        metrics.record_request(1.5, 3000)
+        metrics.record_retry()
+        metrics.record_page(10)
+        metrics.record_page(5)
+        with metrics.timer('disk_save'):
+            pass
+        metrics.add_stage_time('disk_save', 1.0)
+        summary = metrics.summary()
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(summary['request_seconds_avg'], 1.0)
+        self.assertEqual(summary['request_seconds_max'], 1.5)
+        self.assertEqual(summary['bytes_received'], 4000)
+        self.assertEqual(summary['retries'], 1)
+        self.assertEqual(summary['pages'], 2)
+        self.assertEqual(summary['records'], 15)
+        self.assertGreaterEqual(summary['stage_seconds']['disk_save'], 1.0)
+        self.assertIsNotNone(summary['records_per_second'])
+
+    def testEmptySummary(self):
+        summary = FetchMetrics().summary()
+        self.assertEqual(summary['requests'], 0)
+        self.assertIsNone(summary['request_seconds_avg'])
+        self.assertEqual(summary['stage_seconds'], {})
+
+    def testFetcherMetrics(self):
+        '''Fetchers create their metrics on first use'''
+        h = fetcher.Fetcher('url_harvest', 'extra_data')
+        self.assertIsInstance(h.metrics, FetchMetrics)
+        self.assertIs(h.metrics, h.metrics)
+        metrics = FetchMetrics()
+        h.metrics = metrics
+        self.assertIs(h.metrics, metrics)
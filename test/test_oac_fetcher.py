@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import time
+import threading
 from unittest import TestCase
 import shutil
 from mock import patch
@@ -498,6 +500,98 @@ class OAC_XML_Fetcher_mixed_contentTestCase(LogOverrideMixin, TestCase):
         self.assertRaises(StopIteration, oac_fetcher.next)
 
 
+class OAC_XML_Fetcher_page_threadsTestCase(LogOverrideMixin, TestCase):
+    '''Test fetching the pages concurrently. httpretty isn't thread safe,
+    the pages come from a stand in for _get_result_set'''
+    url = 'http://dsc.cdlib.org/search?facet=type-tab&style=cui&raw=1&' \
+        'relation=ark:/13030/hb5d5nb7dj&docsPerPage=10'
+    pages = {
+        '': ('testOAC-url_next-0.xml', 0),
+        '&startDoc=1&group=image': ('testOAC-url_next-0.xml', 0.2),
+        '&startDoc=11&group=image': ('testOAC-url_next-1.xml', 0.1),
+        '&startDoc=1&group=text': ('testOAC-url_next-2.xml', 0.05),
+        '&startDoc=11&group=text': ('testOAC-url_next-3.xml', 0),
+    }
+
+    def setUp(self):
+        super(OAC_XML_Fetcher_page_threadsTestCase, self).setUp()
+        self.requested = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        test = self
+
+        def get_result_set(fetcher_self, url):
+            name, delay = test.pages[url[len(test.url):]]
+            if name is None:
+                raise IOError('timed out')
+            with test.lock:
+                test.requested.append(url[len(test.url):])
+                test.in_flight += 1
+                test.max_in_flight = max(test.max_in_flight, test.in_flight)
+            # the first pages take longest, they finish out of order
+            time.sleep(delay)
+            with test.lock:
+                test.in_flight -= 1
+            return ET.parse(DIR_FIXTURES + '/' + name).getroot().find(
+                'facet')
+
+        patcher = patch.object(fetcher.OAC_XML_Fetcher, '_get_result_set',
+                               get_result_set)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testPagesInOrder(self):
+        h = fetcher.OAC_XML_Fetcher(
+            'http://dsc.cdlib.org/search?facet=type-tab&style=cui&raw=1&'
+            'relation=ark:/13030/hb5d5nb7dj', 'extra_data', docsPerPage=10,
+            page_threads=3)
+        lengths = []
+        urls = []
+        for objset in h:
+            lengths.append(len(objset))
+            urls.append(h._url_current[len(self.url):])
+        self.assertEqual(lengths, [10, 3, 10, 1])
+        self.assertEqual(urls, ['&startDoc=1&group=image',
+                                '&startDoc=11&group=image',
+                                '&startDoc=1&group=text',
+                                '&startDoc=11&group=text'])
+        self.assertEqual(h.currentDoc, 24)
+        self.assertEqual(self.max_in_flight, 3)
+        self.assertEqual(len(self.requested), 5)
+
+    def testCursor(self):
+        h = fetcher.OAC_XML_Fetcher(
+            'http://dsc.cdlib.org/search?facet=type-tab&style=cui&raw=1&'
+            'relation=ark:/13030/hb5d5nb7dj', 'extra_data', docsPerPage=10,
+            page_threads=2)
+        h.next()
+        cursor = h.get_cursor()
+        h = fetcher.OAC_XML_Fetcher(
+            'http://dsc.cdlib.org/search?facet=type-tab&style=cui&raw=1&'
+            'relation=ark:/13030/hb5d5nb7dj', 'extra_data', docsPerPage=10,
+            page_threads=2)
+        del self.requested[:]
+        h.set_cursor(cursor)
+        self.assertEqual([len(objset) for objset in h], [3, 10, 1])
+        self.assertEqual(self.requested, ['&startDoc=11&group=image',
+                                          '&startDoc=1&group=text',
+                                          '&startDoc=11&group=text'])
+
+    def testPageError(self):
+        '''Test that the page pool is closed when a page fails'''
+        self.pages = dict(self.pages)
+        self.pages['&startDoc=11&group=image'] = (None, 0)
+        h = fetcher.OAC_XML_Fetcher(
+            'http://dsc.cdlib.org/search?facet=type-tab&style=cui&raw=1&'
+            'relation=ark:/13030/hb5d5nb7dj', 'extra_data', docsPerPage=10,
+            page_threads=2)
+        h.next()
+        self.assertIsNotNone(h._page_pool)
+        self.assertRaises(IOError, h.next)
+        self.assertIsNone(h._page_pool)
+
+
 class OAC_JSON_FetcherTestCase(LogOverrideMixin, TestCase):
     '''Test the OAC_JSON_Fetcher
     '''
@@ -1,14 +1,237 @@
 # -*- coding: utf-8 -*-
+import os
+import re
+import time
+import tempfile
 import shutil
+import gzip
+import datetime
+from StringIO import StringIO
 from unittest import TestCase
 from test.utils import ConfigFileOverrideMixin, LogOverrideMixin
 from test.utils import DIR_FIXTURES
+from test.utils import DictRedis
 from harvester.collection_registry_client import Collection
 import harvester.fetcher as fetcher
 from mypretty import httpretty
+from sickle.oaiexceptions import NoRecordsMatch, BadArgument
+from harvester.fetcher.oai_fetcher import PartitionedOAIIterator
+from harvester.fetcher.oai_fetcher import GetRecordOAIIterator
+from harvester.fetcher.oai_fetcher import PrefetchOAIIterator
+from harvester.fetcher.oai_fetcher import ParsedOAIIterator
+from harvester.fetcher.oai_fetcher import didl_to_dict, etree_to_dict
+from harvester.fetcher.oai_fetcher import DIDL_NS
+from harvester.harvest_state import MetadataFormatCache
+from mock import patch, MagicMock
+from lxml import etree
 import pprint
 # import httpretty
 
+OAI_NO_RECORDS_MATCH = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>2017-07-15T11:11:58Z</responseDate>
+  <request verb="ListRecords">http://content.cdlib.org/oai</request>
+  <error code="noRecordsMatch">No matching records</error>
+</OAI-PMH>'''
+
+OAI_RESPONSE = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>2017-07-15T11:11:58Z</responseDate>
+  <request>http://content.cdlib.org/oai</request>
+  {}
+</OAI-PMH>'''
+
+OAI_ID_DOES_NOT_EXIST = '''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">
+  <responseDate>2017-07-15T11:11:58Z</responseDate>
+  <request verb="GetRecord">http://content.cdlib.org/oai</request>
+  <error code="idDoesNotExist">No such identifier</error>
+</OAI-PMH>'''
+
+OAI_RECORD = '''<record><header><identifier>{}</identifier>
+<datestamp>{}</datestamp></header><metadata>
+<oai_dc:dc xmlns:oai_dc="http://www.openarchives.org/OAI/2.0/oai_dc/"
+xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>{}</dc:title>
+</oai_dc:dc></metadata></record>'''
+
+
+def oai_repository(records, requests):
+    '''Return an httpretty callback serving Identify & ListRecords for the
+    (identifier, datestamp, set) records. The ListRecords & GetRecord
+    params are appended to requests'''
+    def callback(request, uri, headers):
+        params = dict((k, v[0]) for k, v in request.querystring.items())
+        if params['verb'] == 'Identify':
+            return (200, headers, OAI_RESPONSE.format(
+                '<Identify><earliestDatestamp>{}</earliestDatestamp>'
+                '</Identify>'.format(min(r[1] for r in records))))
+        requests.append(params)
+        if params['verb'] == 'GetRecord':
+            matches = [OAI_RECORD.format(identifier, datestamp, identifier)
+                       for identifier, datestamp, set_spec in records
+                       if identifier == params['identifier']]
+            if not matches:
+                return (200, headers, OAI_ID_DOES_NOT_EXIST)
+            return (200, headers, OAI_RESPONSE.format(
+                '<GetRecord>{}</GetRecord>'.format(matches[0])))
+        matches = [
+            OAI_RECORD.format(identifier, datestamp, identifier)
+            for identifier, datestamp, set_spec in records
+            if datestamp[:10] >= params.get('from', '') and
+            datestamp[:10] <= params.get('until', '9999') and
+            set_spec == params.get('set', set_spec)]
+        if not matches:
+            return (200, headers, OAI_NO_RECORDS_MATCH)
+        return (200, headers, OAI_RESPONSE.format(
+            '<ListRecords>{}</ListRecords>'.format(''.join(matches))))
+    return callback
+
+
+class PartitionedOAIIteratorTestCase(TestCase):
+    '''Test the concurrent harvest of ListRecords partitions'''
+
+    class Record(object):
+        def __init__(self, identifier):
+            self.header = MagicMock(identifier=identifier)
+
+    def list_records(self, **params):
+        if params.get('error'):
+            raise BadArgument('bad')
+        return [self.Record(identifier) for identifier in params['ids']]
+
+    def testRecords(self):
+        partitions = [{'ids': ['{}-{}'.format(i, n) for n in range(100)]}
+                      for i in range(10)]
+        partitions.append({'ids': ['0-1', '1-1', 'dup']})
+        partitions.append({'ids': ['dup']})
+        records = PartitionedOAIIterator(self, partitions, 4, queue_size=5)
+        # the threads start on the first next
+        self.assertEqual(records._threads, [])
+        ids = [r.header.identifier for r in records]
+        self.assertEqual(len(records._threads), 4)
+        self.assertEqual(len(ids), 1001)
+        self.assertEqual(len(set(ids)), 1001)
+        self.assertRaises(StopIteration, records.next)
+
+    def testError(self):
+        partitions = [{'ids': ['a']}, {'error': True}, {'ids': ['b']}]
+        records = PartitionedOAIIterator(self, partitions, 2)
+        self.assertRaises(BadArgument, list, records)
+
+    @patch('harvester.fetcher.oai_fetcher.QUEUE_TIMEOUT', 0.01)
+    def testClose(self):
+        '''Test the threads waiting on the full queue stop once closed'''
+        partitions = [{'ids': ['{}-{}'.format(i, n) for n in range(100)]}
+                      for i in range(4)]
+        records = PartitionedOAIIterator(self, partitions, 2, queue_size=5)
+        records.next()
+        for i in range(100):
+            if records._records.full():
+                break
+            time.sleep(0.01)
+        self.assertTrue(all(t.is_alive() for t in records._threads))
+        records.close()
+        for t in records._threads:
+            t.join(5)
+            self.assertFalse(t.is_alive())
+        self.assertRaises(StopIteration, records.next)
+        # the partitions left aren't harvested
+        self.assertFalse(records._partitions.empty())
+
+    @patch('harvester.fetcher.oai_fetcher.QUEUE_TIMEOUT', 0.01)
+    def testGetRecordClose(self):
+        '''Test closing the fetcher stops the GetRecord threads'''
+        self.get_record = self.Record
+        records = GetRecordOAIIterator(
+            self, ['id-{}'.format(n) for n in range(100)], 2, queue_size=5)
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=a&metadataPrefix=oai_dc',
+                               identifiers=['id-1'])
+        h.records = records
+        records.next()
+        for i in range(100):
+            if records._records.full():
+                break
+            time.sleep(0.01)
+        self.assertTrue(all(t.is_alive() for t in records._threads))
+        h.close()
+        for t in records._threads:
+            t.join(5)
+            self.assertFalse(t.is_alive())
+        self.assertRaises(StopIteration, records.next)
+
+
+class PrefetchOAIIteratorTestCase(TestCase):
+    '''Test the records read ahead on a thread'''
+
+    class Records(object):
+        page_token = None
+        page_offset = 0
+
+        def __iter__(self):
+            return iter(range(100))
+
+    @patch('harvester.fetcher.oai_fetcher.QUEUE_TIMEOUT', 0.01)
+    def testClose(self):
+        '''Test the thread waits on the full queue & stops when closed'''
+        records = PrefetchOAIIterator(self.Records(), 1, page_records=5)
+        # the thread starts on the first next
+        self.assertIsNone(records._thread)
+        self.assertEqual(records.next(), 0)
+        for i in range(100):
+            if records._queue.full():
+                break
+            time.sleep(0.01)
+        self.assertEqual(records._queue.qsize(), 5)
+        self.assertTrue(records._thread.is_alive())
+        records.close()
+        records._thread.join(5)
+        self.assertFalse(records._thread.is_alive())
+        self.assertRaises(StopIteration, records.next)
+
+
+NESTED_DIDL = '''<didl:DIDL xmlns:didl="urn:mpeg:mpeg21:2002:02-DIDL-NS"
+  xmlns:dc="http://purl.org/dc/elements/1.1/">
+  <didl:Item id="outer">
+    <didl:Item id="inner">
+      <didl:Component id="c1"><didl:Resource ref="r1"/></didl:Component>
+      <!-- a comment -->
+      <didl:Component id="c2"><didl:Resource ref="r2"/></didl:Component>
+    </didl:Item>
+    <didl:Descriptor><didl:Statement>
+      <dc:title>Title</dc:title>
+    </didl:Statement></didl:Descriptor>
+  </didl:Item>
+</didl:DIDL>'''
+
+
+class DIDLToDictTestCase(TestCase):
+    '''Test the single pass conversion of DIDL elements'''
+
+    def assertSameAsFindall(self, didl):
+        expected = {}
+        for element in didl.findall('.//' + DIDL_NS + '*'):
+            expected[re.sub(r'\{.*\}', '', element.tag)] = \
+                etree_to_dict(element)
+        self.assertEqual(didl_to_dict(didl), expected)
+
+    def testSameAsFindall(self):
+        tree = etree.parse(DIR_FIXTURES + '/testOAI-didl.xml')
+        self.assertSameAsFindall(tree.find('.//' + DIDL_NS + 'DIDL'))
+        self.assertSameAsFindall(etree.fromstring(NESTED_DIDL))
+
+    def testNested(self):
+        metadata = didl_to_dict(etree.fromstring(NESTED_DIDL))
+        self.assertEqual(sorted(metadata), ['Component', 'Descriptor', 'Item',
+                                            'Resource', 'Statement'])
+        # the last in document order
+        self.assertEqual(metadata['Item']['@id'], 'inner')
+        self.assertEqual(metadata['Component']['@id'], 'c2')
+        self.assertEqual(metadata['Resource']['@ref'], 'r2')
+        title = metadata['Statement'][DIDL_NS + 'Statement'][0]
+        self.assertIn('{http://purl.org/dc/elements/1.1/}title', title)
+        self.assertEqual(title['text'], 'Title')
+
 
 class HarvestOAIControllerTestCase(ConfigFileOverrideMixin,
                                    LogOverrideMixin, TestCase):
@@ -42,6 +265,40 @@ class HarvestOAIControllerTestCase(ConfigFileOverrideMixin,
         # self.assertEqual(len(self.test_log_handler.records), 2)
         self.tearDown_config()
 
+    @httpretty.activate
+    def testIdentifiers(self):
+        '''Test that the identifiers file is passed to the fetcher & that
+        other harvest types refuse identifiers'''
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://registry.cdlib.org/api/v1/collection/',
+                body=open(DIR_FIXTURES+'/collection_api_test.json').read())
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=open(DIR_FIXTURES+'/testOAC-url_next-0.xml').read())
+        self.collection = Collection(
+                'http://registry.cdlib.org/api/v1/collection/')
+        self.setUp_config(self.collection)
+        self.addCleanup(self.tearDown_config)
+        f, path = tempfile.mkstemp()
+        self.addCleanup(os.remove, path)
+        with open(path, 'w') as foo:
+            foo.write('oai:ark:/13030/a1\n\noai:ark:/13030/a2\n')
+        self.controller = fetcher.HarvestController(
+                'email@example.com', self.collection,
+                config_file=self.config_file, profile_path=self.profile_path,
+                identifiers=path)
+        identifiers = ['oai:ark:/13030/a1', 'oai:ark:/13030/a2']
+        self.assertEqual(self.controller.identifiers, identifiers)
+        self.assertEqual(self.controller.fetcher.identifiers, identifiers)
+        with patch.object(fetcher.OAIFetcher, 'targeted', False):
+            self.assertRaises(ValueError, fetcher.HarvestController,
+                              'email@example.com', self.collection,
+                              config_file=self.config_file,
+                              profile_path=self.profile_path,
+                              identifiers=identifiers)
+
 
 class OAIFetcherTestCase(LogOverrideMixin, TestCase):
     '''Test the OAIFetcher
@@ -86,6 +343,23 @@ class OAIFetcherTestCase(LogOverrideMixin, TestCase):
         # skips over 5 "deleted" records
         self.assertEqual(len(recs), 3)
 
+    @httpretty.activate
+    def testCursor(self):
+        '''Test that the fetcher restarts from a cursor, skipping the
+        records of the page already returned'''
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=open(DIR_FIXTURES+'/testOAI.xml').read())
+        rec = self.fetcher.next()
+        cursor = self.fetcher.get_cursor()
+        self.assertEqual(cursor, {'resumptionToken': None, 'offset': 1})
+        ids = [r['id'] for r in self.fetcher]
+        f = fetcher.OAIFetcher('http://content.cdlib.org/oai', 'oac:images')
+        f.set_cursor(cursor)
+        self.assertEqual([r['id'] for r in f], ids)
+        self.assertNotIn(rec['id'], ids)
+
     @httpretty.activate
     def testOverrideMetadataPrefix(self):
         '''test that the metadataPrefix for an OAI feed can be overridden.
@@ -161,6 +435,299 @@ class OAIFetcherTestCase(LogOverrideMixin, TestCase):
                          {u'verb': [u'ListRecords'], u'set': [u'sugoroku'],
                          u'metadataPrefix': [u'marcxml']})
 
+    @httpretty.activate
+    def testModifiedSince(self):
+        '''Test that an incremental harvest lists the records from the day
+        of the high water mark & that no matching records is no records'''
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=open(DIR_FIXTURES+'/testOAI.xml').read())
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=oac:images&metadataPrefix=oai_dc',
+                               modified_since='2017-07-14T12:01:00Z')
+        self.assertEqual(httpretty.last_request().querystring,
+                         {u'verb': [u'ListRecords'], u'set': [u'oac:images'],
+                          u'metadataPrefix': [u'oai_dc'],
+                          u'from': [u'2017-07-14']})
+        self.assertIn('id', h.next())
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=OAI_NO_RECORDS_MATCH)
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=oac:images&metadataPrefix=oai_dc',
+                               modified_since='2017-07-14T12:01:00Z')
+        self.assertEqual(list(h), [])
+
+    @httpretty.activate
+    def testNoRecordsMatch(self):
+        '''Test that no matching records is an error for a full harvest'''
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=OAI_NO_RECORDS_MATCH)
+        self.assertRaises(NoRecordsMatch, fetcher.OAIFetcher,
+                          'http://content.cdlib.org/oai',
+                          'set=oac:images&metadataPrefix=oai_dc')
+
+    @httpretty.activate
+    @patch('harvester.fetcher.oai_fetcher.datetime')
+    @patch('harvester.fetcher.oai_fetcher.PartitionedOAIIterator',
+           lambda fetcher, partitions, n_threads:
+           PartitionedOAIIterator(fetcher, partitions, 1))
+    def testPartitions(self, mock_datetime):
+        '''Test that a partitioned harvest lists the datestamp ranges of
+        each set & returns each record once. httpretty isn't thread safe,
+        the partitions are harvested by one thread'''
+        mock_datetime.datetime.utcnow.return_value = \
+            datetime.datetime(2017, 1, 10, 12)
+        mock_datetime.datetime.strptime = datetime.datetime.strptime
+        mock_datetime.timedelta = datetime.timedelta
+        records = [('id-1', '2017-01-01T10:00:00Z', 'a'),
+                   ('id-2', '2017-01-04', 'a'),
+                   ('id-3', '2017-01-10', 'a'),
+                   ('id-4', '2017-01-05', 'b'),
+                   # moved between sets during the harvest
+                   ('id-4', '2017-01-06', 'a')]
+        requests = []
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=oai_repository(records, requests))
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=a&set=b&metadataPrefix=oai_dc',
+                               partitions=3)
+        # no Identify or ListRecords requests until the harvest starts
+        self.assertEqual(httpretty.httpretty.latest_requests, [])
+        self.assertEqual(sorted(r['id'] for r in h),
+                         ['id-1', 'id-2', 'id-3', 'id-4'])
+        self.assertIsNone(h.get_cursor())
+        ranges = [('2017-01-01', '2017-01-03'),
+                  ('2017-01-04', '2017-01-06'),
+                  ('2017-01-07', None)]
+        expected = []
+        for set_spec in ('a', 'b'):
+            for range_from, range_until in ranges:
+                params = {'verb': 'ListRecords', 'metadataPrefix': 'oai_dc',
+                          'set': set_spec, 'from': range_from}
+                if range_until:
+                    params['until'] = range_until
+                expected.append(params)
+        self.assertEqual(
+            sorted(requests, key=lambda p: (p['set'], p['from'])), expected)
+        # incremental harvests are partitioned from modified_since
+        del requests[:]
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=a&metadataPrefix=oai_dc',
+                               modified_since='2017-01-09T12:00:00Z',
+                               partitions=3)
+        self.assertEqual([r['id'] for r in h], ['id-3'])
+        self.assertEqual(sorted(p['from'] for p in requests),
+                         ['2017-01-09', '2017-01-10'])
+
+    @httpretty.activate
+    def testGetRecord(self):
+        '''Test that a harvest by identifier gets just those records, once
+        each & starts requesting them on the first next'''
+        records = [('id-1', '2017-01-01', 'a'), ('id-2', '2017-01-02', 'a'),
+                   ('id-3', '2017-01-03', 'b')]
+        requests = []
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                body=oai_repository(records, requests))
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=a&metadataPrefix=oai_dc',
+                               modified_since='2017-01-02T00:00:00Z',
+                               identifiers=['id-3', 'id-1', 'gone', 'id-1'],
+                               get_record_threads=1)
+        self.assertEqual(requests, [])
+        recs = list(h)
+        self.assertEqual(sorted(r['id'] for r in recs), ['id-1', 'id-3'])
+        self.assertEqual(recs[0]['title'], [recs[0]['id']])
+        self.assertEqual(
+            sorted(p['identifier'] for p in requests),
+            ['gone', 'id-1', 'id-1', 'id-3'])
+        self.assertEqual(set(p['verb'] for p in requests), set(['GetRecord']))
+        self.assertEqual(set(p['metadataPrefix'] for p in requests),
+                         set(['oai_dc']))
+        self.assertIsNone(h.get_cursor())
+
+    @httpretty.activate
+    def testPrefetch(self):
+        '''Test that pages are read ahead up to the prefetch depth & the
+        cursor is the position of the records returned'''
+        page = open(DIR_FIXTURES+'/testOAI.xml').read()
+        token = '<resumptionToken cursor="0">{}</resumptionToken>' \
+            '</ListRecords>'
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                responses=[
+                    httpretty.Response(body=page.replace(
+                        '</ListRecords>', token.format('page-2'))),
+                    httpretty.Response(body=page.replace(
+                        '</ListRecords>', token.format('page-3'))),
+                    httpretty.Response(body=page),
+                ])
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=oac:images&metadataPrefix=oai_dc',
+                               prefetch=1)
+        self.assertIsInstance(h.records, PrefetchOAIIterator)
+        # the read ahead starts on the first next
+        self.assertIsNone(h.records._thread)
+        self.assertEqual(len(httpretty.httpretty.latest_requests), 1)
+        rec = h.next()
+        self.assertEqual(h.get_cursor(),
+                         {'resumptionToken': None, 'offset': 1})
+        # page 2 is read ahead, page 3 waits for page 1 to be done
+        for i in range(100):
+            if len(httpretty.httpretty.latest_requests) == 2:
+                break
+            time.sleep(0.01)
+        time.sleep(0.05)
+        self.assertEqual(len(httpretty.httpretty.latest_requests), 2)
+        recs = [rec] + list(h)
+        self.assertEqual(len(recs), 9)
+        self.assertEqual(len(httpretty.httpretty.latest_requests), 3)
+        self.assertEqual(h.get_cursor(),
+                         {'resumptionToken': 'page-3', 'offset': 6})
+        # resuming stops the read ahead, the last response is repeated
+        h.set_cursor({'resumptionToken': 'page-3', 'offset': 5})
+        self.assertEqual([r['id'] for r in h], [recs[-1]['id']])
+
+    @httpretty.activate
+    def testParseProcesses(self):
+        '''Test that records parsed in the process pool are the same as
+        parsed in the harvest & come in order, with their position'''
+        for name, extra_data in (
+                ('testOAI-didl.xml', 'set=hdl_10575_7&metadataPrefix=didl'),
+                ('testOAI-tind.xml', 'set=sugoroku&metadataPrefix=marcxml')):
+            httpretty.reset()
+            # just the one page
+            body = re.sub(r'<resumptionToken.*</resumptionToken>', '',
+                          open(DIR_FIXTURES + '/' + name).read())
+            httpretty.register_uri(
+                    httpretty.GET,
+                    'http://content.cdlib.org/oai',
+                    body=body)
+            expected = list(fetcher.OAIFetcher(
+                'http://content.cdlib.org/oai', extra_data))
+            h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                                   extra_data, parse_processes=2)
+            self.assertIsInstance(h.records, ParsedOAIIterator)
+            self.assertEqual(list(h), expected)
+            # closed once the records are done
+            self.assertIsNone(h._parse_pool)
+        httpretty.reset()
+        page = open(DIR_FIXTURES+'/testOAI.xml').read()
+        token = '<resumptionToken cursor="0">{}</resumptionToken>' \
+            '</ListRecords>'
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                responses=[
+                    httpretty.Response(body=page.replace(
+                        '</ListRecords>', token.format('page-2'))),
+                    httpretty.Response(body=page.replace(
+                        '</ListRecords>', token.format('page-3'))),
+                    httpretty.Response(body=page),
+                ])
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=oac:images&metadataPrefix=oai_dc',
+                               prefetch=1, parse_processes=2)
+        h.records.chunk_size = 2
+        rec = h.next()
+        self.assertEqual(h.get_cursor(),
+                         {'resumptionToken': None, 'offset': 1})
+        recs = [rec] + list(h)
+        self.assertEqual(len(recs), 9)
+        self.assertEqual(recs[:3], list(fetcher.OAIFetcher(
+            'http://content.cdlib.org/oai',
+            'set=oac:images&metadataPrefix=oai_dc')))
+        self.assertEqual(h.get_cursor(),
+                         {'resumptionToken': 'page-3', 'offset': 6})
+        h.set_cursor({'resumptionToken': 'page-3', 'offset': 5})
+        self.assertIsInstance(h.records, ParsedOAIIterator)
+        self.assertEqual([r['id'] for r in h], [recs[-1]['id']])
+        # a harvest that stops part way closes the pool
+        h.set_cursor({'resumptionToken': 'page-3', 'offset': 0})
+        h.next()
+        self.assertIsNotNone(h._parse_pool)
+        h.close()
+        self.assertIsNone(h._parse_pool)
+
+    @httpretty.activate
+    def testFormatCache(self):
+        '''Test that the metadata formats of an endpoint are cached'''
+        httpretty.register_uri(
+                httpretty.GET,
+                re.compile('http://content.cdlib.org/oai.*'
+                           'ListMetadataFormats.*'),
+                body=open(DIR_FIXTURES+'/oai-fmts-qdc.xml').read(),
+                match_querystring=True)
+        httpretty.register_uri(
+                httpretty.GET,
+                re.compile('http://content.cdlib.org/oai.*ListRecords.*'),
+                body=open(DIR_FIXTURES+'/testOAI.xml').read(),
+                match_querystring=True)
+        cache = MetadataFormatCache(redis=DictRedis())
+        for i in range(2):
+            h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                                   'oac:images', format_cache=cache)
+            self.assertEqual(h._metadataPrefix, 'oai_qdc')
+        verbs = [r.querystring['verb'][0]
+                 for r in httpretty.httpretty.latest_requests]
+        self.assertEqual(verbs.count('ListMetadataFormats'), 1)
+        self.assertEqual(cache.get('http://content.cdlib.org/oai'),
+                         ['oai_dc', 'oclcdc', 'oai_qdc'])
+
+    @httpretty.activate
+    def testStreamedPages(self):
+        '''Test that the ListRecords pages are streamed, gzipped or not,
+        and the records are freed once the next one is read'''
+        page = open(DIR_FIXTURES+'/testOAI.xml').read()
+        page_1 = page.replace(
+            '</ListRecords>',
+            '<resumptionToken cursor="0">page-2</resumptionToken>'
+            '</ListRecords>')
+        gz = StringIO()
+        with gzip.GzipFile(fileobj=gz, mode='wb') as gzfile:
+            gzfile.write(page_1)
+        httpretty.register_uri(
+                httpretty.GET,
+                'http://content.cdlib.org/oai',
+                responses=[
+                    httpretty.Response(body=gz.getvalue(),
+                                       content_encoding='gzip'),
+                    httpretty.Response(body=page),
+                ])
+        h = fetcher.OAIFetcher('http://content.cdlib.org/oai',
+                               'set=oac:images&metadataPrefix=oai_dc')
+        elements = []
+        mapper = h.records.mapper
+
+        def record_element(element):
+            elements.append(element)
+            return mapper(element)
+        h.records.mapper = record_element
+        recs = list(h)
+        self.assertEqual(len(recs), 6)
+        self.assertEqual([r['id'] for r in recs[:3]],
+                         [r['id'] for r in recs[3:]])
+        self.assertEqual(httpretty.last_request().querystring,
+                         {u'verb': [u'ListRecords'],
+                          u'resumptionToken': [u'page-2']})
+        self.assertEqual(h.metrics.requests, 2)
+        self.assertEqual(h.metrics.bytes, len(page_1) + len(page))
+        # deleted records included, the last of each page is left to the
+        # garbage collector
+        self.assertEqual(len(elements), 16)
+        self.assertEqual(len(elements[0]), 0)
+        self.assertIsNone(elements[0].getparent())
+        self.assertGreater(len(elements[-1]), 0)
+
     @httpretty.activate
     def testDCTERMS(self):
         '''Test the OAI fetcher when the source data has exteneded dcterms in
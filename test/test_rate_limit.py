@@ -0,0 +1,119 @@
+from unittest import TestCase
+from mock import patch
+from mypretty import httpretty
+import harvester.fetcher as fetcher
+from harvester.fetcher.http_session import HarvestSession
+from harvester.rate_limit import HostRateLimiter, parse_rates, MAX_SLOWDOWN
+from test.utils import DictRedis
+from test.utils import LogOverrideMixin
+
+
+class Clock(object):
+    '''Stand in for time.time & time.sleep, sleeping advances the clock'''
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class RateLimitTestCase(TestCase):
+    '''Test the per host rate limiter'''
+
+    def setUp(self):
+        self.clock = Clock()
+        patcher = patch.multiple('harvester.rate_limit.time',
+                                 time=self.clock.time, sleep=self.clock.sleep)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def testParseRates(self):
+        self.assertEqual(
+            parse_rates('nuxeo.cdlib.org=10, API.flickr.com=0.5,'),
+            {'nuxeo.cdlib.org': 10.0, 'api.flickr.com': 0.5})
+        self.assertEqual(parse_rates(''), {})
+
+    def testUnlimited(self):
+        limiter = HostRateLimiter(rates={}, default_rate=None)
+        for i in range(3):
+            self.assertEqual(limiter.acquire('http://example.edu/x'), 0)
+        self.assertEqual(self.clock.slept, [])
+
+    def testRates(self):
+        limiter = HostRateLimiter(rates={'example.edu': 2},
+                                  default_rate=None)
+        self.assertEqual(limiter.rate('example.edu'), 2)
+        self.assertEqual(limiter.rate('other.edu', 5), 5)
+        self.assertIsNone(limiter.rate('other.edu'))
+
+    def _assertPaced(self, limiter):
+        waits = [limiter.acquire('http://example.edu/{}'.format(i))
+                 for i in range(4)]
+        self.assertEqual(waits, [0, 0.5, 0.5, 0.5])
+        # other hosts have their own bucket
+        self.assertEqual(limiter.acquire('http://other.edu/', 1), 0)
+        # the bucket refills while idle
+        self.clock.now += 10
+        self.assertEqual(limiter.acquire('http://example.edu/'), 0)
+
+    def testLocal(self):
+        self._assertPaced(HostRateLimiter(rates={'example.edu': 2}))
+
+    def testShared(self):
+        redis = DictRedis()
+        self._assertPaced(HostRateLimiter(redis, rates={'example.edu': 2}))
+        self.assertIn('ucldc:harvester:rate-limit:example.edu', redis.data)
+
+    def testBurst(self):
+        limiter = HostRateLimiter(rates={'example.edu': 1}, burst=3)
+        waits = [limiter.acquire('http://example.edu/') for i in range(5)]
+        self.assertEqual(waits, [0, 0, 0, 1, 1])
+
+    def testThrottled(self):
+        for redis in (None, DictRedis()):
+            limiter = HostRateLimiter(redis, rates={'example.edu': 2})
+            limiter.acquire('http://example.edu/')
+            limiter.throttled('http://example.edu/')
+            self.assertEqual(limiter.slowdown('example.edu'), 2)
+            # the slot reserved at the old rate, then half the rate
+            self.assertEqual(limiter.acquire('http://example.edu/'), 0.5)
+            self.assertEqual(limiter.acquire('http://example.edu/'), 1)
+            for i in range(10):
+                limiter.throttled('http://example.edu/')
+            self.assertEqual(limiter.slowdown('example.edu'), MAX_SLOWDOWN)
+        # local slowdowns expire
+        limiter = HostRateLimiter(rates={'example.edu': 2})
+        limiter.throttled('http://example.edu/')
+        self.clock.now += 1000
+        self.assertEqual(limiter.slowdown('example.edu'), 1)
+
+
+class FetcherRateLimitTestCase(LogOverrideMixin, TestCase):
+    '''Test that fetcher requests wait for the rate limiter'''
+
+    @httpretty.activate
+    def testRequestsGet(self):
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/feed',
+            responses=[
+                httpretty.Response(body='busy', status=429),
+                httpretty.Response(body='ok'),
+            ])
+        limiter = HostRateLimiter(rates={})
+        h = fetcher.Fetcher('http://example.edu/feed', None)
+        h.session = HarvestSession(backoff_factor=0)
+        h.rate_limiter = limiter
+        h.rate_limit = 4
+        with patch.object(limiter, 'acquire', return_value=0.25) as acquire:
+            resp = h.requests_get('http://example.edu/feed')
+        self.assertEqual(resp.text, 'ok')
+        acquire.assert_called_with('http://example.edu/feed', 4)
+        self.assertEqual(h.metrics.stages['rate_limit'], 0.25)
+        # the retried 429 slowed down the host
+        self.assertEqual(limiter.slowdown('example.edu'), 2)
@@ -4,6 +4,7 @@ from unittest import TestCase
 import shutil
 import re
 import pickle
+import json
 from mypretty import httpretty
 # import httpretty
 import logbook
@@ -11,10 +12,12 @@ from mock import patch
 from mock import MagicMock
 from test.utils import ConfigFileOverrideMixin, LogOverrideMixin
 from test.utils import DIR_FIXTURES
+from test.utils import DictRedis
 from harvester.collection_registry_client import Collection
 import harvester.fetcher as fetcher
 from harvester.fetcher import get_log_file_path
 from harvester.config import config
+from harvester.harvest_state import ValidatorCache
 import harvester.run_ingest as run_ingest
 
 
@@ -393,6 +396,68 @@ class RunIngestTestCase(LogOverrideMixin, TestCase):
         mock_enrich.assert_called_with([None, 'test-id'])
         self.assertEqual(len(self.test_log_handler.records), 14)
 
+    @patch('boto3.resource', autospec=True)
+    @patch('harvester.run_ingest.publish_to_harvesting')
+    @patch('harvester.fetcher.controller.get_redis_connection')
+    @patch('dplaingestion.scripts.enrich_records.main', return_value=0)
+    @patch('dplaingestion.scripts.save_records.main', return_value=10)
+    @patch('dplaingestion.scripts.remove_deleted_records.main', return_value=0)
+    @patch('dplaingestion.scripts.check_ingestion_counts.main', return_value=0)
+    @patch('dplaingestion.scripts.dashboard_cleanup.main', return_value=0)
+    @patch('dplaingestion.couch.Couch')
+    def testRunIngestConditionalGet(self, mock_couch, mock_dash_clean,
+                                    mock_check, mock_remove, mock_save,
+                                    mock_enrich, mock_redis, mock_publish,
+                                    mock_boto3):
+        '''Test that a changed source is enriched & saved, its validators
+        are committed once the records are saved'''
+        mock_couch.return_value._create_ingestion_document.return_value = \
+            'test-id'
+        redis = DictRedis()
+        mock_redis.return_value = redis
+        url_api_collection = 'https://registry.cdlib.org/api/v1/collection/' \
+            '197/'
+        url_marc = 'http://example.edu/marc-test'
+        collection = json.load(
+            open(DIR_FIXTURES + '/collection_api_test_marc.json'))
+        collection['url_harvest'] = url_marc
+        httpretty.httpretty.enable()
+        self.addCleanup(httpretty.httpretty.disable)
+        httpretty.register_uri(
+            httpretty.GET, url_api_collection, body=json.dumps(collection))
+        httpretty.register_uri(
+            httpretty.GET, url_marc,
+            body=open(DIR_FIXTURES + '/marc-test').read(),
+            etag='"v1"')
+
+        def ingest(save_returns=10):
+            mock_save.return_value = save_returns
+            run_ingest.main(
+                'mark.redar@ucop.edu',
+                url_api_collection,
+                log_handler=self.test_log_handler,
+                mail_handler=MagicMock(),
+                conditional_get=True)
+
+        # the save fails, the validators aren't committed
+        self.assertRaises(Exception, ingest, -1)
+        mock_enrich.assert_called_with([None, 'test-id'])
+        cache = ValidatorCache(redis=redis)
+        self.assertIsNone(cache.get(url_marc))
+        mock_enrich.reset_mock()
+        ingest()
+        mock_enrich.assert_called_with([None, 'test-id'])
+        mock_save.assert_called_with([None, 'test-id'])
+        self.assertEqual(cache.get(url_marc)['etag'], '"v1"')
+        self.assertIn('Fetched: 10\nSaved: 10', mock_publish.call_args[0][1])
+        # not modified since, nothing enriched
+        mock_enrich.reset_mock()
+        httpretty.register_uri(
+            httpretty.GET, url_marc, body='', status=304)
+        ingest()
+        self.assertFalse(mock_enrich.called)
+        self.assertIn('unchanged', mock_publish.call_args[0][1])
+
     @patch('boto3.resource', autospec=True)
     @patch('harvester.run_ingest.Redis', autospec=True)
     @patch('couchdb.Server')
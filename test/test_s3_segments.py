@@ -0,0 +1,129 @@
+import json
+from unittest import TestCase
+from StringIO import StringIO
+from mock import MagicMock
+from botocore.exceptions import ClientError
+from harvester.s3_segments import S3SegmentWriter
+
+
+class S3SegmentWriterTestCase(TestCase):
+    '''Test the rollup of harvest pages into S3 segments'''
+
+    def setUp(self):
+        self.objects = {}
+
+        def put_object(Bucket, Key, Body):
+            self.objects[Key] = Body
+
+        def get_object(Bucket, Key):
+            if Key not in self.objects:
+                raise ClientError({'Error': {'Code': 'NoSuchKey'}},
+                                  'GetObject')
+            return {'Body': StringIO(self.objects[Key])}
+
+        self.client = MagicMock()
+        self.client.put_object.side_effect = put_object
+        self.client.get_object.side_effect = get_object
+
+    def pages(self, n_pages):
+        return [['{{"id": "{}-{}"}}'.format(page, i) for i in range(3)]
+                for page in range(n_pages)]
+
+    def testSegmentsByRecords(self):
+        '''Pages are rolled up until the record count is reached'''
+        saved = []
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', segment_records=6,
+            client=self.client,
+            on_saved=lambda page, state: saved.append((page, state)))
+        for page, records in enumerate(self.pages(5)):
+            writer.write_page(page, records, state={'page': page})
+        writer.close()
+        self.assertEqual(
+            sorted(self.objects.keys()),
+            ['data-fetched/197/segment-0.index.json',
+             'data-fetched/197/segment-0.jsonl',
+             'data-fetched/197/segment-1.index.json',
+             'data-fetched/197/segment-1.jsonl',
+             'data-fetched/197/segment-2.index.json',
+             'data-fetched/197/segment-2.jsonl',
+             'data-fetched/197/segments-index.json'])
+        # 3 segments, the index of each & the index of all the pages
+        self.assertEqual(self.client.put_object.call_count, 7)
+        # a segment's index only has its own pages
+        segment_index = json.loads(
+            self.objects['data-fetched/197/segment-1.index.json'])
+        self.assertEqual(sorted(segment_index['pages']), ['2', '3'])
+        segment = self.objects['data-fetched/197/segment-1.jsonl']
+        self.assertEqual(len(segment.splitlines()), 6)
+        self.assertEqual(json.loads(segment.splitlines()[0]), {'id': '2-0'})
+        index = json.loads(
+            self.objects['data-fetched/197/segments-index.json'])
+        self.assertEqual(index['segments'], 3)
+        offset, length = index['pages']['3'][1:3]
+        self.assertEqual(segment[offset:offset + length].splitlines(),
+                         self.pages(4)[3])
+        self.assertEqual(saved, [(i, {'page': i}) for i in range(5)])
+
+    def testSegmentsBySize(self):
+        '''A segment is uploaded once it reaches the segment size'''
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', segment_size=1, client=self.client)
+        for page, records in enumerate(self.pages(3)):
+            writer.write_page(page, records)
+        writer.close()
+        self.assertIn('data-fetched/197/segment-2.jsonl', self.objects)
+
+    def testRestore(self):
+        '''Pages are read back from the segments'''
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', segment_records=4,
+            client=self.client)
+        for page, records in enumerate(self.pages(5)):
+            writer.write_page(page, records)
+        writer.close()
+        # an interrupted harvest has no index of all the pages
+        del self.objects['data-fetched/197/segments-index.json']
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', segment_records=4,
+            client=self.client)
+        self.assertEqual(writer.restore(3), self.pages(3))
+        self.assertEqual(sorted(writer.index.keys()), [0, 1, 2])
+        self.assertEqual(writer.segment, 3)
+        # pages written again after the resume are read from the new
+        # segments
+        pages = [[rec.replace('id', 'resumed') for rec in records]
+                 for records in self.pages(5)]
+        for page in range(3, 5):
+            writer.write_page(page, pages[page])
+        writer.close()
+        self.assertIn('data-fetched/197/segment-3.jsonl', self.objects)
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', client=self.client)
+        self.assertEqual(writer.restore(5), self.pages(3) + pages[3:])
+        self.assertEqual(writer.segment, 4)
+        writer.close()
+
+    def testRestoreCompressed(self):
+        '''Compressed segments are read back the same'''
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', segment_records=4,
+            client=self.client, compression='gzip')
+        for page, records in enumerate(self.pages(5)):
+            writer.write_page(page, records)
+        writer.close()
+        self.assertIn('data-fetched/197/segment-0.jsonl.gz', self.objects)
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', client=self.client,
+            compression='gzip')
+        self.assertEqual(writer.restore(5), self.pages(5))
+        writer.close()
+
+    def testUploadError(self):
+        '''An upload error is raised in the writing thread'''
+        self.client.put_object.side_effect = IOError('S3 down')
+        writer = S3SegmentWriter(
+            'bucket', 'data-fetched/197/', segment_records=1,
+            client=self.client)
+        writer.write_page(0, ['{}'])
+        self.assertRaises(IOError, writer.close)
@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
+import re
+import json
+import urlparse
+from collections import OrderedDict
 from unittest import TestCase
-from mock import patch
+from mock import patch, MagicMock
 from test.utils import ConfigFileOverrideMixin, LogOverrideMixin
 from test.utils import DIR_FIXTURES
 from harvester.collection_registry_client import Collection
+from harvester.fetcher.solr_fetcher import decode_solr_response
+from harvester.fetcher.solr_fetcher import export_docs, partition_filters
+from harvester.fetcher.solr_fetcher import PartitionedSolrIterator
 import solr
 import pysolr
 import harvester.fetcher as fetcher
@@ -71,6 +78,28 @@ class SolrFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertEqual(['Mission at Santa Barbara'], r['title_tesim'])
         self.assertEqual(n, 10)
 
+    @httpretty.activate
+    def testModifiedSince(self):
+        '''Test that an incremental harvest filters on the modified_field
+        of the query'''
+        httpretty.register_uri(
+            httpretty.POST,
+            'http://example.edu/solr/select',
+            body=open(DIR_FIXTURES +
+                      '/ucsd-new-feed-missions-bb3038949s-0.xml').read())
+        h = fetcher.SolrFetcher(
+            'http://example.edu/solr', 'q=extra_data&modified_field=updated',
+            modified_since='2017-07-14T12:01:00Z')
+        body = urlparse.parse_qs(httpretty.last_request().body)
+        self.assertEqual(body['q'], ['extra_data'])
+        self.assertEqual(body['fq'], ['updated:[2017-07-14T12:01:00Z TO *]'])
+        self.assertTrue(h.incremental)
+        h = fetcher.SolrFetcher('http://example.edu/solr', 'extra_data',
+                                modified_since='2017-07-14T12:01:00Z')
+        body = urlparse.parse_qs(httpretty.last_request().body)
+        self.assertNotIn('fq', body)
+        self.assertFalse(h.incremental)
+
 
 class PySolrQueryFetcherTestCase(LogOverrideMixin, TestCase):
     '''Test the harvesting of solr baed data.'''
@@ -130,6 +159,107 @@ class PySolrQueryFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertEqual(['Mission Santa Ynez'], r['title_tesim'])
 
 
+    @httpretty.activate
+    def testCursor(self):
+        '''Test that the fetcher restarts from a cursor part way through a
+        page of results'''
+        responses = [
+            httpretty.Response(body=open(
+                DIR_FIXTURES +
+                '/ucsd-new-feed-missions-bb3038949s-{}.json'.format(i)).read())
+            for i in range(4)]
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.edu/solr/query',
+            responses=responses)
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr', 'extra_data',
+                                       **{'rows': 3})
+        ids = [h.next()['id'] for i in range(4)]
+        cursor = h.get_cursor()
+        self.assertEqual(cursor['offset'], 1)
+        self.assertEqual(cursor['index'], 4)
+        ids_rest = [r['id'] for r in h]
+        httpretty.reset()
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.edu/solr/query',
+            responses=responses)
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr', 'extra_data',
+                                       **{'rows': 3})
+        h.set_cursor(cursor)
+        self.assertEqual(h.index, 4)
+        self.assertEqual([r['id'] for r in h], ids_rest)
+        self.assertEqual(len(ids + ids_rest), 10)
+
+    @httpretty.activate
+    def testPrefetch(self):
+        '''Test that the pages requested ahead are returned in order'''
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.edu/solr/query',
+            responses=[
+                httpretty.Response(body=open(
+                    DIR_FIXTURES +
+                    '/ucsd-new-feed-missions-bb3038949s-{}.json'.format(i))
+                    .read())
+                for i in range(4)])
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr', 'extra_data',
+                                       prefetch=2, **{'rows': 3})
+        self.assertEqual(h.numFound, 10)
+        # the pages are requested ahead once the harvest starts
+        self.assertIsNone(h._pages)
+        ids = [r['id'] for r in h]
+        self.assertEqual(len(ids), 10)
+        self.assertEqual(len(set(ids)), 10)
+        self.assertEqual(r['title_tesim'], ['Mission Santa Ynez'])
+        self.assertIsNone(h._pages)
+
+    @httpretty.activate
+    def testClose(self):
+        '''Test that closing the fetcher stops the pages requested ahead'''
+        httpretty.register_uri(
+            httpretty.GET, 'http://example.edu/solr/query',
+            responses=[
+                httpretty.Response(body=open(
+                    DIR_FIXTURES +
+                    '/ucsd-new-feed-missions-bb3038949s-{}.json'.format(i))
+                    .read())
+                for i in range(4)])
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr', 'extra_data',
+                                       prefetch=1, **{'rows': 3})
+        ids = [h.next()['id'] for i in range(4)]
+        pages = h._pages
+        self.assertTrue(pages._thread.is_alive())
+        h.close()
+        pages._thread.join(5)
+        self.assertFalse(pages._thread.is_alive())
+        self.assertIsNone(h._pages)
+        self.assertEqual(len(set(ids)), 4)
+
+    @httpretty.activate
+    def testModifiedSince(self):
+        '''Test that an incremental harvest adds a timestamp filter query
+        to the ones in the query params'''
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/solr/query',
+            body=open(DIR_FIXTURES +
+                      '/ucsd-new-feed-missions-bb3038949s-0.json').read())
+        h = fetcher.PySolrQueryFetcher(
+            'http://example.edu/solr', 'q=extra_data&modified_field=timestamp',
+            modified_since='2017-07-14T12:01:00Z', fq='type:image')
+        self.assertEqual(
+            httpretty.last_request().querystring['fq'],
+            ['type:image', 'timestamp:[2017-07-14T12:01:00Z TO *]'])
+        self.assertNotIn('modified_field',
+                         httpretty.last_request().querystring)
+        self.assertTrue(h.incremental)
+        # no field to filter on, a full harvest
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr', 'extra_data',
+                                       modified_since='2017-07-14T12:01:00Z',
+                                       fq='type:image')
+        self.assertEqual(httpretty.last_request().querystring['fq'],
+                         ['type:image'])
+        self.assertFalse(h.incremental)
+
+
 class RequestsSolrFetcherTestCase(LogOverrideMixin, TestCase):
     '''Test the Request Solr fetcher which uses cursorMark'''
 
@@ -173,6 +303,47 @@ class RequestsSolrFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertEqual(cursor, h._cursorMark)
         self.assertEqual(len(docs), 4)
 
+    @httpretty.activate
+    def testPrefetch(self):
+        '''Test that the pages requested ahead are returned in order'''
+        bodies = [open(DIR_FIXTURES +
+                       '/ucb-cursor-results-{}.json'.format(i)).read()
+                  for i in range(4)]
+        httpretty.register_uri(
+            httpretty.GET,
+            'http://example.edu/solr',
+            responses=[httpretty.Response(body=body) for body in bodies])
+        h = fetcher.RequestsSolrFetcher('http://example.edu/solr',
+                                        'q=extra:data', prefetch=1)
+        h._page_size = 1
+        # the last page is returned again for its nextCursorMark
+        self.assertEqual(list(h),
+                         [json.loads(body)['response']['docs']
+                          for body in bodies + bodies[-1:]])
+        self.assertTrue(h.end_of_feed)
+        self.assertIsNone(h._pages)
+        cursorMarks = [r.querystring['cursorMark'][0]
+                       for r in httpretty.httpretty.latest_requests]
+        self.assertEqual(cursorMarks, ['*'] + [
+            json.loads(body)['nextCursorMark'] for body in bodies])
+        self.assertEqual(h.metrics.requests, 5)
+        self.assertEqual(h.metrics.bytes,
+                         sum(len(body) for body in bodies + bodies[-1:]))
+
+    def testCursor(self):
+        '''Test that the cursor is the cursorMarks for the next page'''
+        h = fetcher.RequestsSolrFetcher('http://example.edu/solr',
+                                        'q=extra:data')
+        h._cursorMark = 'AAAA'
+        h._nextCursorMark = 'BBBB'
+        cursor = h.get_cursor()
+        h = fetcher.RequestsSolrFetcher('http://example.edu/solr',
+                                        'q=extra:data')
+        h.set_cursor(cursor)
+        self.assertFalse(h.end_of_feed)
+        self.assertIn('cursorMark=AAAA', h.url_request)
+        self.assertEqual(h._nextCursorMark, 'BBBB')
+
     def test_url_request(self):
         '''Test the url_request dynamic property of the fetcher'''
         h = fetcher.RequestsSolrFetcher(
@@ -197,6 +368,279 @@ class RequestsSolrFetcherTestCase(LogOverrideMixin, TestCase):
             '&q=extra:data&wt=xml&sort=PID asc',
             h.url_request)
 
+    def testModifiedSince(self):
+        '''Test that an incremental harvest filters on the timestamp'''
+        h = fetcher.RequestsSolrFetcher(
+            'http://example.edu/solr',
+            'q=extra:data&fq=type:image&modified_field=timestamp',
+            modified_since='2017-07-14T12:01:00Z')
+        self.assertIn('&fq=type%3Aimage', h.url_request)
+        self.assertIn('&fq=timestamp%3A%5B2017-07-14T12%3A01%3A00Z%20TO%20'
+                      '%2A%5D', h.url_request)
+        self.assertNotIn('modified_field', h.url_request)
+        self.assertTrue(h.incremental)
+        # no field to filter on, a full harvest
+        h = fetcher.RequestsSolrFetcher(
+            'http://example.edu/solr', 'q=extra:data&fq=type:image',
+            modified_since='2017-07-14T12:01:00Z')
+        self.assertNotIn('timestamp', h.url_request)
+        self.assertFalse(h.incremental)
+        self.assertIn('No modified_field',
+                      self.test_log_handler.formatted_records[0])
+
+
+class DecodeSolrResponseTestCase(TestCase):
+    '''Test the decoding of Solr JSON responses read in chunks'''
+
+    def testChunks(self):
+        for name in ('ucb-cursor-results-0.json',
+                     'ucsd-new-feed-missions-bb3038949s-1.json'):
+            body = open(DIR_FIXTURES + '/' + name).read()
+            for size in (1, 7, 4096):
+                chunks = [body[i:i + size]
+                          for i in range(0, len(body), size)]
+                self.assertEqual(decode_solr_response(chunks),
+                                 json.loads(body))
+
+    def testValues(self):
+        body = '{"a": 12345, "response": {"docs": [], "numFound": 0},' \
+            ' "b": [1, {"c": null}], "d": "\\u00e9\xc3\xa9"}'
+        self.assertEqual(decode_solr_response(body), json.loads(body))
+        self.assertEqual(decode_solr_response(list(body)), json.loads(body))
+        self.assertEqual(decode_solr_response(['{}']), {})
+
+    def testTruncated(self):
+        body = open(DIR_FIXTURES + '/ucb-cursor-results-0.json').read()
+        self.assertRaises(ValueError, decode_solr_response,
+                          [body[:len(body) / 2]])
+
+
+RANGE = re.compile(r'(-?)(\w+):\[(\*|".*") TO (\*|".*")[\]}]$')
+
+
+def solr_index(docs, requests, export=True):
+    '''An httpretty callback for a Solr index of the docs, sorted on id.
+    cursorMarks are offsets, fq id ranges are applied. The path & params of
+    each request are appended to requests'''
+    def callback(request, uri, headers):
+        # httpretty's querystring is unquoted before it's split on &
+        path, query = urlparse.urlsplit(uri)[2:4]
+        params = dict((name, values if name == 'fq' else values[0])
+                      for name, values in urlparse.parse_qs(query).items())
+        requests.append((path, params))
+        matches = sorted(docs, key=lambda doc: doc['id'])
+        for fq in params.get('fq', []):
+            if not RANGE.match(fq):
+                continue
+            negate, field, low, high = RANGE.match(fq).groups()
+            if negate:
+                matches = [doc for doc in matches if field not in doc]
+                continue
+            matches = [doc for doc in matches if field in doc and
+                       (low == '*' or doc[field] >= json.loads(low)) and
+                       (high == '*' or doc[field] < json.loads(high))]
+        if 'fl' in params:
+            fields = params['fl'].split(',')
+            matches = [dict((name, doc[name]) for name in fields
+                            if name in doc)
+                       for doc in matches]
+        # solr writes numFound before the docs
+        response = OrderedDict([('numFound', len(matches))])
+        results = {'responseHeader': {'status': 0}, 'response': response}
+        if path.endswith('/export'):
+            if not export:
+                return (404, headers, 'Not Found')
+            response['docs'] = matches
+            return (200, headers, json.dumps(results))
+        cursorMark = params.get('cursorMark')
+        start = int(params.get('start', 0))
+        if cursorMark and cursorMark != '*':
+            start = int(cursorMark)
+        response['docs'] = matches[start:start + int(params['rows'])]
+        if cursorMark:
+            results['nextCursorMark'] = str(start + len(response['docs']))
+        return (200, headers, json.dumps(results))
+    return callback
+
+
+class SolrPartitionsTestCase(LogOverrideMixin, TestCase):
+    '''Test the partitioned & exported Solr harvests'''
+
+    def setUp(self):
+        super(SolrPartitionsTestCase, self).setUp()
+        self.docs = [{'id': 'id-{:02}'.format(i), 'title': 'Doc {}'.format(i)}
+                     for i in range(25)]
+        self.requests = []
+        # httpretty isn't thread safe, harvest the partitions in one thread
+        patcher = patch(
+            'harvester.fetcher.solr_fetcher.PartitionedSolrIterator',
+            lambda items, filters, n_threads:
+            PartitionedSolrIterator(items, filters, 1))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def register(self, export=True):
+        httpretty.register_uri(
+            httpretty.GET, re.compile(r'http://example.edu/solr/\w+'),
+            body=solr_index(self.docs, self.requests, export=export))
+
+    def testPartitionFilters(self):
+        self.assertEqual(
+            partition_filters('id', 25, 3, lambda offset: 'id-{:02}'.format(
+                offset)),
+            ['id:[* TO "id-08"}', 'id:["id-08" TO "id-16"}',
+             'id:["id-16" TO *]', '-id:[* TO *]'])
+        # fewer docs than partitions
+        self.assertEqual(
+            partition_filters('id', 1, 3, lambda offset: 'a"\\'),
+            ['id:[* TO "a\\"\\\\"}', 'id:["a\\"\\\\" TO *]',
+             '-id:[* TO *]'])
+        self.assertEqual(partition_filters('id', 0, 3, lambda offset: None),
+                         ['id:[* TO *]', '-id:[* TO *]'])
+
+    @httpretty.activate
+    def testPySolrPartitions(self):
+        self.register()
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr',
+                                       'q=*:*&fl=id', partitions=3,
+                                       rows=4)
+        # the partitions are requested on the first next
+        self.assertEqual(self.requests, [])
+        ids = [doc['id'] for doc in h]
+        self.assertEqual(sorted(ids), [doc['id'] for doc in self.docs])
+        self.assertEqual(h.numFound, 25)
+        self.assertEqual(h.index, 25)
+        self.assertIsNone(h.get_cursor())
+        self.assertEqual(
+            [params['start'] for path, params in self.requests
+             if 'start' in params], ['8', '16'])
+        self.assertEqual(
+            set(params['fq'][0] for path, params in self.requests
+                if 'fq' in params),
+            set(['id:[* TO "id-08"}', 'id:["id-08" TO "id-16"}',
+                 'id:["id-16" TO *]', '-id:[* TO *]']))
+
+    @httpretty.activate
+    def testPartitionsMissingField(self):
+        '''Test the docs without the sort field are harvested'''
+        for doc in self.docs[::3]:
+            doc.pop('title')
+        self.register()
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr',
+                                       'q=*:*&fl=id,title', partitions=3,
+                                       sort='title asc,id asc', rows=4)
+        ids = [doc['id'] for doc in h]
+        self.assertEqual(sorted(ids), [doc['id'] for doc in self.docs])
+        self.assertIn('-title:[* TO *]',
+                      [params['fq'][0] for path, params in self.requests
+                       if 'fq' in params])
+
+    @httpretty.activate
+    def testRequestsPartitions(self):
+        self.register()
+        h = fetcher.RequestsSolrFetcher(
+            'http://example.edu/solr/select',
+            'q=*:*&fl=id&fq=type:image&header=app_key:111', partitions=2)
+        h._page_size = 5
+        self.assertEqual(self.requests, [])
+        pages = list(h)
+        self.assertEqual([len(page) for page in pages], [5, 5, 2, 5, 5, 3])
+        self.assertEqual(sorted(doc['id'] for page in pages for doc in page),
+                         [doc['id'] for doc in self.docs])
+        self.assertEqual(pages[0][0], {'id': 'id-00'})
+        self.assertIsNone(h.get_cursor())
+        self.assertEqual(httpretty.last_request().headers['app_key'], '111')
+
+    @httpretty.activate
+    def testRequestsPartitionsQuoted(self):
+        '''Test the partition bounds are URL encoded in the filter queries'''
+        self.docs = [{'id': 'id-{:02}{}'.format(i, '&+#%'[i % 4])}
+                     for i in range(25)]
+        self.register()
+        h = fetcher.RequestsSolrFetcher('http://example.edu/solr/select',
+                                        'q=*:*&fl=id', partitions=3)
+        h._page_size = 5
+        ids = [doc['id'] for page in h for doc in page]
+        self.assertEqual(sorted(ids), [doc['id'] for doc in self.docs])
+        self.assertEqual(
+            set(params['fq'][0] for path, params in self.requests
+                if 'fq' in params),
+            set(['id:[* TO "id-08&"}', 'id:["id-08&" TO "id-16&"}',
+                 'id:["id-16&" TO *]', '-id:[* TO *]']))
+
+    @httpretty.activate
+    def testPySolrExport(self):
+        self.register()
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr',
+                                       'q=*:*&fl=id,title&export=true',
+                                       partitions=3)
+        # the export starts on the first next
+        self.assertEqual(self.requests, [])
+        self.assertEqual(list(h), self.docs)
+        self.assertTrue(h.export)
+        self.assertEqual(h.numFound, 25)
+        self.assertIsNone(h.get_cursor())
+        self.assertEqual([path for path, params in self.requests],
+                         ['/solr/export'])
+        self.assertNotIn('export', self.requests[0][1])
+
+    @httpretty.activate
+    def testExportUnavailable(self):
+        self.register(export=False)
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr',
+                                       'q=*:*&fl=id,title&export=true',
+                                       rows=10)
+        self.assertEqual(list(h), self.docs)
+        self.assertFalse(h.export)
+        self.assertEqual(h.get_cursor()['index'], 25)
+        self.assertIn('Solr export unavailable',
+                      self.test_log_handler.formatted_records[0])
+        # no fl fields to export
+        h = fetcher.PySolrQueryFetcher('http://example.edu/solr',
+                                       'q=*:*&export=true', rows=10)
+        self.assertEqual(h.next(), self.docs[0])
+        self.assertFalse(h.export)
+
+    @httpretty.activate
+    def testRequestsExport(self):
+        self.register()
+        h = fetcher.RequestsSolrFetcher('http://example.edu/solr/select',
+                                        'q=*:*&fl=id,title&export=true')
+        h._page_size = 10
+        self.assertEqual(list(h), [self.docs[:10], self.docs[10:20],
+                                   self.docs[20:]])
+        self.assertIsNone(h.get_cursor())
+        self.assertEqual(self.requests[0][1],
+                         {'q': '*:*', 'fl': 'id,title', 'wt': 'json',
+                          'sort': 'id asc'})
+        # no /export next to the URL
+        h = fetcher.RequestsSolrFetcher('http://example.edu/solr',
+                                        'q=*:*&fl=id,title&export=true')
+        self.assertEqual(h.get_cursor(),
+                         {'_cursorMark': None, '_nextCursorMark': '*'})
+
+    def testExportErrors(self):
+        def response(body, status_code=200):
+            resp = MagicMock(status_code=status_code)
+            resp.iter_content.return_value = [body]
+            return resp
+
+        metrics = MagicMock()
+        self.assertRaises(pysolr.SolrError, export_docs,
+                          response('', 400), metrics)
+        self.assertRaises(
+            pysolr.SolrError, export_docs,
+            response('{"responseHeader": {"status": 400}, "response": '
+                     '{"numFound": 0, "docs": [{"EXCEPTION": "no '
+                     'docValues"}]}}'), metrics)
+        results, docs = export_docs(
+            response('{"responseHeader": {"status": 0}, "response": '
+                     '{"numFound": 2, "docs": [{"id": "a"}, '
+                     '{"EXCEPTION": "timeout"}]}}'), metrics)
+        self.assertEqual(results['response']['numFound'], 2)
+        self.assertEqual(docs.next(), {'id': 'a'})
+        self.assertRaises(pysolr.SolrError, docs.next)
+
 
 class HarvestSolr_ControllerTestCase(ConfigFileOverrideMixin, LogOverrideMixin,
                                      TestCase):
@@ -53,6 +53,16 @@ class UCDFetcherTestCase(LogOverrideMixin, TestCase):
         self.assertIn('@context', test2['metadata'])
         self.assertEqual(test2['metadata']['license'],
                          'http://rightsstatements.org/vocab/InC-NC/1.0/')
+        self.assertRaises(StopIteration, h.next)
+        # lazy, the record pages are requested as the objset is read
+        h = fetcher.UCD_JSON_Fetcher(url, None, lazy=True)
+        n_requests = len(httpretty.httpretty.latest_requests)
+        objset = h.next()
+        self.assertEqual(len(httpretty.httpretty.latest_requests), n_requests)
+        self.assertEqual(list(objset), docs)
+        self.assertEqual(len(httpretty.httpretty.latest_requests),
+                         n_requests + 3)
+        self.assertRaises(StopIteration, h.next)
 
 # Copyright © 2016, Regents of the University of California
 # All rights reserved.
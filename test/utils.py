@@ -82,4 +82,48 @@ class ConfigFileOverrideMixin(object):
         os.remove(self.profile_path)
 
 
-
+class DictRedis(object):
+    '''Stand in for a Redis connection, keeps the data in a dict.
+    Just the commands used by the harvester state objects.'''
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None, px=None):
+        self.data[key] = str(value)
+        return True
+
+    def multi(self):
+        pass
+
+    def sadd(self, key, *values):
+        members = self.data.setdefault(key, set())
+        n = len(members)
+        members.update(str(value) for value in values)
+        return len(members) - n
+
+    def smembers(self, key):
+        return set(self.data.get(key, ()))
+
+    def exists(self, *keys):
+        return sum(1 for key in keys if key in self.data)
+
+    def rename(self, src, dst):
+        self.data[dst] = self.data.pop(src)
+        return True
+
+    def expire(self, key, seconds):
+        return key in self.data
+
+    def transaction(self, func, *watches, **kwargs):
+        '''Run func as its own pipeline, nothing else changes the keys'''
+        return func(self)
+
+    def delete(self, *keys):
+        n = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                n += 1
+        return n